@@ -0,0 +1,657 @@
+"""
+Request parsing, query builders and payload computations shared by the API servers.
+
+server.py (Flask, sync PyMongo) and server_async.py (ASGI, async PyMongo) only
+fetch documents with their own driver and hand them to these functions, so
+both return identical payloads for the same request. Nothing in this module
+touches the database.
+"""
+
+import hashlib
+import json
+import threading
+from collections import Counter, OrderedDict
+from datetime import datetime, timedelta
+from time import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+STAGE_ORDER = ["OA", "Phone/R1", "Onsite", "HM", "Offer", "Reject"]
+
+# Fields needed to rebuild candidate journeys (heatmap, timeline, dashboard)
+JOURNEY_PROJECTION = {"company": 1, "author": 1, "stage": 1, "timestamp": 1, "_id": 0}
+
+MS_PER_DAY = 1000 * 60 * 60 * 24
+HIRING_TRENDS_DAYS = 180
+HIRING_TRENDS_TOP_N = 5
+WEEKLY_TOP_LIMIT = 10
+SUBMISSION_CUTOFF = datetime(2025, 10, 27)
+
+# Responses a fresh process precomputes before taking traffic: what the
+# dashboard requests on first load (both job types checked, no filters)
+WARMUP_PATHS = [
+    "/api/meta",
+    "/api/meta?job_types=new_grad",
+    "/api/meta?job_types=intern",
+    "/api/messages",
+    "/api/dashboard",
+    "/api/top-oa-companies?job_types=new_grad,intern",
+    "/api/top-offer-companies?job_types=new_grad,intern",
+    "/api/hiring-trends?job_types=new_grad,intern",
+]
+
+
+# ---- Response cache ----
+class TTLCache(OrderedDict):
+    """
+    LRU response cache whose entries expire after ttl seconds.
+
+    Shared by a worker's request threads and its cache warmer, so every
+    read, write and iteration holds the cache's lock.
+    """
+
+    def __init__(self, maxsize=256, ttl=300):
+        super().__init__()
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = super().get(key)
+            if not item:
+                return None
+            data, ts = item
+            if time() - ts > self.ttl:
+                del self[key]
+                return None
+            self.move_to_end(key)
+            return data
+
+    def set(self, key, value):
+        with self._lock:
+            if key in self:
+                self.move_to_end(key)
+            self[key] = (value, time())
+            if len(self) > self.maxsize:
+                self.popitem(last=False)
+
+    def age(self, key):
+        """Seconds since key was stored (expired or not), None if it is not cached."""
+        with self._lock:
+            item = super().get(key)
+        if not item:
+            return None
+        return time() - item[1]
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return super().pop(key, default)
+
+    def clear(self):
+        with self._lock:
+            super().clear()
+
+
+class PopularityTracker:
+    """
+    Request counts per response cache key, with a path that recomputes each key.
+
+    Feeds the cache warmers: the most requested keys are refreshed before they
+    expire. Counts halve every decay_every seconds so filters that were
+    popular yesterday fade out, and only the max_tracked busiest keys are kept.
+    Request threads and the warmer share it, so all access holds its lock.
+    """
+
+    def __init__(self, max_tracked=500, decay_every=600):
+        self.max_tracked = max_tracked
+        self.decay_every = decay_every
+        self.decayed_at = time()
+        self.counts = Counter()
+        self.paths = {}   # cache key -> request path (with query string)
+        self.keys = {}    # request path -> cache key
+        self._lock = threading.Lock()
+
+    def record(self, path, cache_key, count=True):
+        with self._lock:
+            if count:
+                self.counts[cache_key] += 1
+            self.paths[cache_key] = path
+            self.keys[path] = cache_key
+            if len(self.paths) > 2 * self.max_tracked:
+                self._trim(halve=False)
+
+    def top(self, k):
+        """Paths of the k most requested cache keys."""
+        with self._lock:
+            if time() - self.decayed_at > self.decay_every:
+                self._trim(halve=True)
+            return [self.paths[key] for key, _ in self.counts.most_common(k) if key in self.paths]
+
+    def key_for(self, path):
+        """Cache key last seen for path, None if it is not tracked."""
+        with self._lock:
+            return self.keys.get(path)
+
+    def _trim(self, halve):
+        if halve:
+            self.decayed_at = time()
+        keep = self.counts.most_common(self.max_tracked)
+        self.counts = Counter({key: (c // 2 if halve else c) for key, c in keep if c > 1 or not halve})
+        self.paths = {key: self.paths[key] for key in self.counts if key in self.paths}
+        self.keys = {path: key for key, path in self.paths.items()}
+
+
+def stale_paths(cache: TTLCache, tracker: PopularityTracker, paths: Iterable[str], margin: float) -> List[str]:
+    """Paths whose cached response is missing or expires within margin seconds."""
+    stale = []
+    for path in dict.fromkeys(paths):
+        key = tracker.key_for(path)
+        age = cache.age(key) if key else None
+        if age is None or age > cache.ttl - margin:
+            stale.append(path)
+    return stale
+
+
+def make_cache_key(base: str, params: dict):
+    """
+    Generates a unique cache key for a route based on query parameters.
+    Converts the params dict to a sorted JSON string and hashes it
+    so even long query strings produce short keys.
+    """
+    serialized = json.dumps(params, sort_keys=True)
+    key_hash = hashlib.md5(serialized.encode()).hexdigest()
+    return f"{base}:{key_hash}"
+
+
+# ---- Request parsing ----
+def parse_date(s):
+    if not s:
+        return None
+    for fmt in ("%Y-%m-%dT%H:%M:%S", "%Y-%m-%dT%H:%M", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(s, fmt)
+        except ValueError:
+            continue
+    return None
+
+
+def split_param(value) -> List[str]:
+    """Comma separated query parameter -> list of non-empty values."""
+    return [v for v in (value or '').split(',') if v]
+
+
+# ---- Query builders ----
+def apply_job_type_filter(query: Dict, job_types: List[str]):
+    """Restrict to new grad or intern submissions when exactly one job type is selected."""
+    if job_types and len(job_types) == 1:
+        if 'new_grad' in job_types:
+            query['new_grad'] = True
+        elif 'intern' in job_types:
+            # Intern records either don't have new_grad field or have it set to false
+            query['$or'] = [{'new_grad': False}, {'new_grad': {'$exists': False}}]
+
+
+def apply_date_filter(query: Dict, start: Optional[datetime], end: Optional[datetime]):
+    if start or end:
+        query['timestamp'] = {}
+        if start:
+            query['timestamp']['$gte'] = start.isoformat()
+        if end:
+            # Make end date inclusive by adding 1 day and using $lt
+            end_inclusive = end + timedelta(days=1)
+            query['timestamp']['$lt'] = end_inclusive.isoformat()
+
+
+def submissions_query(start=None, end=None, companies=None, job_types=None) -> Dict:
+    """Match non-spam, non-App submissions for the dashboard filters."""
+    query = {"spam": False, "stage": {"$ne": "App"}}
+    if companies:
+        query['company'] = {'$in': companies}
+    apply_job_type_filter(query, job_types)
+    apply_date_filter(query, start, end)
+    return query
+
+
+def company_search_pipeline(match_query: Dict) -> List[Dict]:
+    return [
+        {"$match": match_query},
+        {"$group": {"_id": "$company", "count": {"$sum": 1}}},
+        {"$sort": {"count": -1}},
+    ]
+
+
+def weekly_top_pipeline(stage: str, job_types: List[str], now: Optional[datetime] = None) -> List[Dict]:
+    """Top companies by submissions at stage over the last 7 days."""
+    now = now or datetime.utcnow()
+    one_week_ago = now - timedelta(days=7)
+    match_query = {
+        'stage': stage,
+        'timestamp': {
+            '$gte': one_week_ago.isoformat(),
+            '$lte': now.isoformat()
+        },
+        'spam': {'$ne': True}
+    }
+    apply_job_type_filter(match_query, job_types)
+    return [
+        {'$match': match_query},
+        {'$group': {'_id': '$company', 'count': {'$sum': 1}}},
+        {'$sort': {'count': -1}},
+        {'$limit': WEEKLY_TOP_LIMIT}
+    ]
+
+
+def hiring_trends_query(job_types: List[str], now: Optional[datetime] = None) -> Dict:
+    """OA + Offer submissions over the trailing window (ending 2 days ago)."""
+    now = (now or datetime.utcnow()) - timedelta(days=2)
+    start = now - timedelta(days=HIRING_TRENDS_DAYS)
+    match_query = {
+        'stage': {'$in': ['OA', 'Offer']},
+        'timestamp': {
+            '$gte': start.isoformat(),
+            '$lte': now.isoformat()
+        },
+        'spam': {'$ne': True}
+    }
+    apply_job_type_filter(match_query, job_types)
+    return match_query
+
+
+def daily_counts_pipeline(match_query: Dict) -> List[Dict]:
+    """Submissions per calendar day (%Y-%m-%d), skipping unparseable timestamps."""
+    return [
+        {'$match': match_query},
+        {
+            '$addFields': {
+                'timestamp_date': {
+                    '$dateFromString': {
+                        'dateString': '$timestamp',
+                        'onError': None
+                    }
+                }
+            }
+        },
+        {'$match': {'timestamp_date': {'$ne': None}}},
+        {
+            '$group': {
+                '_id': {
+                    '$dateToString': {
+                        'format': '%Y-%m-%d',
+                        'date': '$timestamp_date'
+                    }
+                },
+                'count': {'$sum': 1}
+            }
+        },
+        {'$sort': {'_id': 1}}
+    ]
+
+
+def top_companies_pipeline(match_query: Dict, limit: int = HIRING_TRENDS_TOP_N) -> List[Dict]:
+    return [
+        {'$match': match_query},
+        {'$group': {'_id': '$company', 'total': {'$sum': 1}}},
+        {'$sort': {'total': -1}},
+        {'$limit': limit}
+    ]
+
+
+# ---- Journeys ----
+def to_millis(timestamp) -> Optional[float]:
+    if not timestamp:
+        return None
+    try:
+        ts = datetime.fromisoformat(timestamp) if isinstance(timestamp, str) else timestamp
+        return ts.timestamp() * 1000
+    except (ValueError, TypeError, AttributeError):
+        return None
+
+
+def build_applications(docs: Iterable[Dict]) -> Dict[str, List[Dict]]:
+    """Group submissions into journeys: "company|author" -> [{stage, timestamp ms}]."""
+    applications = {}
+    for doc in docs:
+        company = doc.get('company')
+        author = doc.get('author')
+        if not company or not author:
+            continue
+        applications.setdefault(f"{company}|{author}", []).append(
+            {'stage': doc.get('stage'), 'timestamp': to_millis(doc.get('timestamp'))}
+        )
+    return applications
+
+
+def funnel_counts(docs: Iterable[Dict]) -> Dict[str, int]:
+    stage_counts = {stage: 0 for stage in STAGE_ORDER}
+    for doc in docs:
+        stage = doc.get('stage')
+        if stage in stage_counts:
+            stage_counts[stage] += 1
+    return stage_counts
+
+
+def company_activity(docs: Iterable[Dict]) -> Dict[str, int]:
+    company_counts = {}
+    for doc in docs:
+        company = doc.get('company')
+        if company:
+            company_counts[company] = company_counts.get(company, 0) + 1
+    return company_counts
+
+
+def top_company_names(company_counts: Dict[str, int], top_n: int) -> List[str]:
+    top_companies = sorted(company_counts.items(), key=lambda x: x[1], reverse=True)[:top_n]
+    return [c[0] for c in top_companies]
+
+
+def heatmap_transitions() -> List[str]:
+    """Stage-to-stage transitions shown in the heatmap and timeline (skip ...→Reject)."""
+    transitions = []
+    for i in range(len(STAGE_ORDER) - 1):
+        to_stage = STAGE_ORDER[i + 1]
+        if to_stage.lower() != "reject":
+            transitions.append(f"{STAGE_ORDER[i]}→{to_stage}")
+    transitions.append("Overall→Reject")
+    return transitions
+
+
+def conversion_matrix(applications: Dict[str, List[Dict]], companies: List[str]) -> Dict[str, Dict[str, float]]:
+    """Percentage of candidates reaching each next stage, plus Overall→Reject, per company."""
+    # Track user journeys per company (key: company|author -> set of stages)
+    user_stages = {
+        key: {msg['stage'] for msg in msgs if msg.get('stage')}
+        for key, msgs in applications.items()
+    }
+
+    conv_matrix = {}
+    for company in companies:
+        conv_matrix[company] = {}
+        company_users = [k for k in user_stages.keys() if k.startswith(f"{company}|")]
+
+        for i in range(len(STAGE_ORDER) - 1):
+            from_stage = STAGE_ORDER[i]
+            to_stage = STAGE_ORDER[i + 1]
+            if to_stage.lower() == "reject":
+                continue
+
+            # Users who had from_stage, and those who had BOTH (actual progression)
+            from_count = sum(1 for k in company_users if from_stage in user_stages[k])
+            to_count = sum(1 for k in company_users
+                           if from_stage in user_stages[k] and to_stage in user_stages[k])
+
+            pct = (to_count / from_count * 100) if from_count > 0 else 0
+            conv_matrix[company][f"{from_stage}→{to_stage}"] = round(pct, 1)
+
+    apps_by_company = {company: set() for company in companies}
+    for key in applications.keys():
+        company = key.split('|')[0]
+        if company in apps_by_company:
+            apps_by_company[company].add(key)
+
+    for company in companies:
+        keys = apps_by_company[company]
+        if not keys:
+            conv_matrix[company]["Overall→Reject"] = 0
+            continue
+        rejected = sum(1 for key in keys if 'Reject' in user_stages[key])
+        conv_matrix[company]["Overall→Reject"] = round((rejected / len(keys) * 100), 1)
+
+    return conv_matrix
+
+
+def average_stage_times(applications: Dict[str, List[Dict]]) -> Dict[str, float]:
+    """Average days between consecutive stages (earliest timestamp per stage), plus HM→Reject."""
+    app_earliest = []
+    for msgs in applications.values():
+        stage_map = {}
+        for msg in msgs:
+            stage = msg.get('stage')
+            ts = msg.get('timestamp')
+            if not stage or ts is None:
+                continue
+            if stage not in stage_map or ts < stage_map[stage]:
+                stage_map[stage] = ts
+        app_earliest.append(stage_map)
+
+    transition_days = {
+        f"{STAGE_ORDER[i]}→{STAGE_ORDER[i + 1]}": [] for i in range(len(STAGE_ORDER) - 1)
+    }
+    hm_to_reject_days = []
+    for stage_map in app_earliest:
+        for i in range(len(STAGE_ORDER) - 1):
+            from_stage = STAGE_ORDER[i]
+            to_stage = STAGE_ORDER[i + 1]
+            if from_stage in stage_map and to_stage in stage_map:
+                days = (stage_map[to_stage] - stage_map[from_stage]) / MS_PER_DAY
+                if days >= 0:
+                    transition_days[f"{from_stage}→{to_stage}"].append(days)
+
+        if "HM" in stage_map and "Reject" in stage_map:
+            days = (stage_map["Reject"] - stage_map["HM"]) / MS_PER_DAY
+            if days >= 0:
+                hm_to_reject_days.append(days)
+
+    stage_times = {}
+    for transition, days_list in transition_days.items():
+        avg = sum(days_list) / len(days_list) if days_list else 0
+        stage_times[transition] = round(avg, 1)
+
+    overall_reject_avg = sum(hm_to_reject_days) / len(hm_to_reject_days) if hm_to_reject_days else 0
+    stage_times["Overall→Reject"] = round(overall_reject_avg, 1)
+    return stage_times
+
+
+# ---- Payloads ----
+def heatmap_payload(docs: List[Dict], top_n: int) -> Dict:
+    companies = top_company_names(company_activity(docs), top_n)
+    return {
+        'companies': companies,
+        'transitions': heatmap_transitions(),
+        'conversion_matrix': conversion_matrix(build_applications(docs), companies)
+    }
+
+
+def timeline_payload(docs: List[Dict]) -> Dict:
+    return {
+        'transitions': heatmap_transitions(),
+        'stage_times': average_stage_times(build_applications(docs))
+    }
+
+
+def dashboard_payload(docs: List[Dict], top_n: int) -> Dict:
+    """Funnel, heatmap, timeline and summary computed from one fetch."""
+    company_counts = company_activity(docs)
+    companies = top_company_names(company_counts, top_n)
+    applications = build_applications(docs)
+    return {
+        'funnel': {
+            'stages': STAGE_ORDER,
+            'counts': funnel_counts(docs)
+        },
+        'heatmap': {
+            'companies': companies,
+            'transitions': heatmap_transitions(),
+            'conversion_matrix': conversion_matrix(applications, companies)
+        },
+        'timeline': {
+            'transitions': heatmap_transitions(),
+            'stage_times': average_stage_times(applications)
+        },
+        'summary': {
+            'total_records': len(docs),
+            'unique_companies': len(company_counts),
+            'unique_candidates': len({k.split('|')[1] for k in applications.keys() if '|' in k})
+        }
+    }
+
+
+def company_suggestions(rows: Iterable[Dict], search_term: str) -> Dict:
+    companies = []
+    for r in rows:
+        name = (r.get("_id") or "").strip()
+        if not name:
+            continue
+        if search_term and search_term not in name.lower():
+            continue
+        companies.append({"name": name, "count": r.get("count", 0)})
+
+    companies.sort(key=lambda x: x["count"], reverse=True)
+    return {"companies": companies, "total": len(companies)}
+
+
+def weekly_top_payload(rows: Iterable[Dict]) -> Dict:
+    return {'companies': [{'company': item['_id'], 'count': item['count']} for item in rows]}
+
+
+# ---- Hiring trends ----
+def daily_series(rows: Iterable[Dict]) -> List[Dict]:
+    return [{'date': item['_id'], 'count': item['count']} for item in rows]
+
+
+def fill_missing_dates(data):
+    """Fills in missing days with count=0 to avoid straight line jumps."""
+    if not data:
+        return []
+    fmt = "%Y-%m-%d"
+    filled = []
+    start = datetime.strptime(data[0]['date'], fmt)
+    end = datetime.strptime(data[-1]['date'], fmt)
+    existing = {d['date']: d['count'] for d in data}
+    cur = start
+    while cur <= end:
+        date_str = cur.strftime(fmt)
+        filled.append({'date': date_str, 'count': existing.get(date_str, 0)})
+        cur += timedelta(days=1)
+    return filled
+
+
+def apply_moving_avg(data, window=7):
+    """Centered moving average; series shorter than the window are returned as is."""
+    if len(data) < window:
+        return data
+    smoothed = []
+    for i in range(len(data)):
+        start = max(0, i - window // 2)
+        end = min(len(data), i + window // 2 + 1)
+        avg = sum(d['count'] for d in data[start:end]) / (end - start)
+        smoothed.append({'date': data[i]['date'], 'count': round(avg, 2)})
+    return smoothed
+
+
+def company_trend(rows: Iterable[Dict]) -> List[Dict]:
+    """Smoothed daily series for a single requested company (gaps filled with 0)."""
+    return apply_moving_avg(fill_missing_dates(daily_series(rows)))
+
+
+def hiring_trends_payload(global_rows: Iterable[Dict], company_rows: Dict[str, Iterable[Dict]]) -> Dict:
+    """Global average first, then one smoothed series per top company."""
+    global_smoothed = apply_moving_avg(daily_series(global_rows))
+    if not company_rows and not global_smoothed:
+        return {'companies': {}}
+
+    company_data = {'Global Average': global_smoothed}
+    for company, rows in company_rows.items():
+        company_data[company] = apply_moving_avg(daily_series(rows))
+    return {'companies': company_data}
+
+
+# ---- Submissions ----
+def parse_submission(data: Dict, canonicalize) -> Tuple[Optional[Dict], Optional[str]]:
+    """
+    Validate a dashboard submission.
+
+    Returns (fields, None) on success or (None, error message) otherwise;
+    fields hold username, company (canonicalized), stage, position_type and
+    the noon timestamp string.
+    """
+    username = (data.get('username') or '').strip()
+    company = canonicalize((data.get('company') or '').strip())
+    stage = (data.get('stage') or '').strip()
+    position_type = (data.get('position_type') or '').strip()
+    submission_date = data.get('date')
+
+    if not all([username, company, stage, position_type, submission_date]):
+        return None, 'All fields are required'
+    if stage not in STAGE_ORDER:
+        return None, 'Invalid stage'
+    if position_type not in ['new_grad', 'intern']:
+        return None, 'Invalid position type'
+
+    try:
+        submit_dt = datetime.fromisoformat(submission_date)
+        if submit_dt < SUBMISSION_CUTOFF:
+            return None, 'Date must be after October 27, 2025'
+        # Convert date to ISO format datetime string with time (noon UTC)
+        timestamp_str = datetime.combine(submit_dt.date(), datetime.min.time().replace(hour=12)).isoformat()
+    except (ValueError, TypeError):
+        return None, 'Invalid date format'
+
+    return {
+        'username': username,
+        'company': company,
+        'stage': stage,
+        'position_type': position_type,
+        'timestamp': timestamp_str,
+    }, None
+
+
+def existing_submissions_query(fields: Dict) -> Dict:
+    # Intern and new_grad are treated as separate journeys
+    return {
+        'author': fields['username'],
+        'company': fields['company'],
+        'new_grad': fields['position_type'] == 'new_grad',
+        'spam': False
+    }
+
+
+def submission_conflict(fields: Dict, existing_submissions: List[Dict]) -> Optional[str]:
+    """Reject duplicate stages and stages earlier than one already submitted."""
+    if not existing_submissions:
+        return None
+    stage, company = fields['stage'], fields['company']
+    existing_stages = {sub.get('stage') for sub in existing_submissions if sub.get('stage')}
+
+    if stage in existing_stages:
+        return f"You have already submitted the {stage} stage for {company} ({fields['position_type']})"
+
+    stage_idx = STAGE_ORDER.index(stage)
+    for existing_stage in existing_stages:
+        if existing_stage in STAGE_ORDER:
+            # Allow submitting later stages, but not earlier ones (except Reject can come anytime)
+            if stage != 'Reject' and STAGE_ORDER.index(existing_stage) > stage_idx:
+                return f'You have already submitted {existing_stage} for {company}. Cannot submit earlier stage {stage}.'
+    return None
+
+
+def submission_document(fields: Dict) -> Dict:
+    now = datetime.utcnow()
+    username, company, stage = fields['username'], fields['company'], fields['stage']
+    return {
+        'msg_id': f'submission_{username}_{company}_{stage}_{int(now.timestamp())}',
+        'text': f'{stage} update for {company} (submitted via dashboard)',
+        'timestamp': fields['timestamp'],
+        'author': username,
+        'company': company,
+        'stage': stage,
+        'new_grad': fields['position_type'] == 'new_grad',
+        'spam': False,
+        'submitted_at': now
+    }
+
+
+def feedback_document(data: Dict) -> Tuple[Optional[Dict], Optional[str]]:
+    feedback_text = data.get('feedback', '').strip()
+    email = (data.get('email') or '').strip()
+    rating = data.get('rating')
+
+    if not feedback_text:
+        return None, 'Feedback text is required'
+
+    return {
+        'feedback': feedback_text,
+        'email': email if email else None,
+        'rating': rating if rating else None,
+        'timestamp': datetime.utcnow(),
+        'session_id': data.get('session_id')
+    }, None
@@ -1,10 +1,20 @@
-from pymongo import MongoClient, UpdateOne, IndexModel
+import argparse
+import multiprocessing
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from itertools import groupby
+from pymongo import UpdateOne, DeleteOne, IndexModel
 from datetime import datetime, timedelta, timezone
+from main.Preprocessor.meta_summary import rebuild_meta_summary
+from main.Preprocessor.mongo_pool import get_db
 
 # ---- MongoDB Config ----
 DB_NAME = "JobStats"
 SRC_COLLECTION = "interview_processes"
 DST_COLLECTION = "interview_processes_backfilled"
+STATE_COLLECTION = "backfill_state"
+BATCH_SIZE = 5000
+SHARDS_PER_WORKER = 4  # more shards than workers evens out skewed company ranges
 
 # ---- Stage Order ----
 STAGE_ORDER = ["OA", "Phone/R1", "Onsite", "HM", "Offer", "Reject"]
@@ -35,122 +45,391 @@ def ensure_indexes(coll):
     print("[Backfill] Creating indexes...")
     coll.create_indexes([
         IndexModel([("spam", 1), ("stage", 1), ("company", 1), ("new_grad", 1), ("timestamp", -1)]),
-        IndexModel([("msg_id", 1)], unique=True)
+        IndexModel([("msg_id", 1)], unique=True),
+        IndexModel([("author", 1)])
     ])
 
 
-def build_backfilled():
-    client = MongoClient(MONGO_URI)
-    db = client[DB_NAME]
+BASE_QUERY = {"spam": False, "msg_id": {"$not": {"$regex": "^auto_"}}}
+PROJECTION = {
+    "_id": 0, "msg_id": 1, "text": 1, "timestamp": 1,
+    "author": 1, "company": 1, "stage": 1, "new_grad": 1, "category": 1
+}
+# Source scan order; backed by an index so journeys stream out contiguously
+JOURNEY_SORT = [("company", 1), ("author", 1), ("new_grad", 1)]
+UNSTRIPPED = {"$regex": r"^\s|\s$"}
+
+
+def ensure_source_index(coll):
+    coll.create_index(JOURNEY_SORT)
+
+
+def journey_key(doc):
+    company = (doc.get("company") or "").strip()
+    author = (doc.get("author") or "").strip()
+    return company, author, bool(doc.get("new_grad", False))
+
+
+def iso(ts):
+    return ts.isoformat() if isinstance(ts, datetime) else ts
+
+
+def plan_journey(key, docs):
+    """
+    Desired backfilled documents for one journey: its real docs plus the
+    synthetic stages implied by the furthest real stage.
+
+    Returns (docs, synthetic_count).
+    """
+    company, author, new_grad = key
+    present = {str(x.get("stage", "")).strip() for x in docs if x.get("stage")}
+    real_ts = [to_dt(x.get("timestamp")) for x in docs if x.get("timestamp")]
+    real_ts = [x for x in real_ts if x]
+    latest_real = max(real_ts) if real_ts else None
+
+    has_reject = "Reject" in present
+    has_offer = "Offer" in present
+
+    valid = [s for s in present if s in STAGE_ORDER]
+    if not valid:
+        return [], 0
+
+    stage_pos = {s: i for i, s in enumerate(STAGE_ORDER)}
+    if not has_reject:
+        latest_idx = max(stage_pos[s] for s in valid)
+    else:
+        if present == {"Reject"}:
+            latest_idx = stage_pos["OA"]
+        else:
+            reject_idx = stage_pos["Reject"]
+            prev_real = [stage_pos[s] for s in valid if stage_pos[s] < reject_idx]
+            latest_idx = max(prev_real) if prev_real else stage_pos["OA"]
+
+    out_docs = []
+    offset_days = 0
+    for i in range(latest_idx):
+        st = STAGE_ORDER[i]
+        if st in BASE_NEVER_AUTOGEN or (st == "Interview" and not has_offer):
+            continue
+        if st in present:
+            continue
+
+        offset_days += 3
+        ts = latest_real - timedelta(days=offset_days) if latest_real else None
+        # Keyed on epoch 0 when no real timestamp, so reruns produce the same id
+        auto_id = deterministic_auto_id(company, author, st, latest_real)
+
+        out_docs.append({
+            "msg_id": auto_id,
+            "text": "[Auto-generated since the user submitted next stage]",
+            "timestamp": iso(ts),
+            "author": author,
+            "company": company,
+            "stage": st,
+            "spam": False,
+            "new_grad": new_grad,
+            "category": None,
+            "auto": True
+        })
+    synthetic = len(out_docs)
+
+    # Add all real docs as well
+    for d in docs:
+        out_docs.append({
+            "msg_id": d["msg_id"],
+            "text": d.get("text"),
+            "timestamp": iso(to_dt(d.get("timestamp"))),
+            "author": d["author"],
+            "company": d["company"],
+            "stage": d.get("stage"),
+            "spam": False,
+            "new_grad": bool(d.get("new_grad", False)),
+            "category": d.get("category"),
+            "auto": False
+        })
+    return out_docs, synthetic
+
+
+def is_synthetic(doc):
+    return doc.get("auto") is True or str(doc.get("msg_id", "")).startswith("auto_")
+
+
+def is_unstripped(doc):
+    return any(v != v.strip() for v in (doc.get("company") or "", doc.get("author") or ""))
+
+
+def load_strays(src):
+    """Journeys of the rows whose company/author carry stray whitespace."""
+    strays = {}
+    for doc in src.find({**BASE_QUERY, "$or": [{"company": UNSTRIPPED}, {"author": UNSTRIPPED}]}, PROJECTION):
+        strays.setdefault(journey_key(doc), []).append(doc)
+    return strays
+
+
+def company_range_query(lo=None, hi=None):
+    """Source filter for companies in [lo, hi); the first range also takes missing companies."""
+    bounds = {}
+    if lo is not None:
+        bounds["$gte"] = lo
+    if hi is not None:
+        bounds["$lt"] = hi
+    if lo is None:
+        return {"$or": [{"company": bounds}, {"company": None}]} if bounds else {}
+    return {"company": bounds}
+
+
+def in_company_range(key, lo=None, hi=None):
+    return (lo is None or key[0] >= lo) and (hi is None or key[0] < hi)
+
+
+def iter_journeys(src, lo=None, hi=None, strays=None):
+    """
+    Yield (key, docs) one journey at a time from a scan sorted by JOURNEY_SORT,
+    optionally limited to companies in [lo, hi).
+
+    Rows whose company/author carry stray whitespace sort away from the rest
+    of their journey, so those few are loaded up front (or passed in as
+    strays) and merged back in.
+    """
+    if strays is None:
+        strays = {k: v for k, v in load_strays(src).items() if in_company_range(k, lo, hi)}
+
+    query = {"$and": [BASE_QUERY, company_range_query(lo, hi)]}
+    cursor = src.find(query, PROJECTION).sort(JOURNEY_SORT)
+    for key, docs in groupby((d for d in cursor if not is_unstripped(d)), key=journey_key):
+        yield key, list(docs) + strays.pop(key, [])
+
+    yield from strays.items()
+
+
+class BulkWriter:
+    """
+    Buffer write ops and flush each full batch on a background thread.
+
+    At most one batch is in flight, so memory stays at about two batches
+    while writes overlap with reading the next journeys.
+    """
+
+    def __init__(self, coll, size=BATCH_SIZE):
+        self.coll = coll
+        self.size = size
+        self.ops = []
+        self.written = 0
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._pending = None
+
+    def add(self, op):
+        self.ops.append(op)
+        if len(self.ops) >= self.size:
+            self.flush()
+
+    def _wait(self):
+        if self._pending is not None:
+            self._pending.result()
+            self._pending = None
+
+    def flush(self):
+        self._wait()
+        if self.ops:
+            ops, self.ops = self.ops, []
+            self._pending = self._executor.submit(self.coll.bulk_write, ops, ordered=False)
+            self.written += len(ops)
+
+    def close(self):
+        self.flush()
+        self._wait()
+        self._executor.shutdown()
+        return self.written
+
+
+# ---- Source watermark ----
+def latest_source_id(src):
+    last = src.find_one({}, {"_id": 1}, sort=[("_id", -1)])
+    return last["_id"] if last else None
+
+
+def get_watermark(db):
+    state = db[STATE_COLLECTION].find_one({"_id": SRC_COLLECTION})
+    return state.get("last_source_id") if state else None
+
+
+def set_watermark(db, source_id):
+    if source_id is None:
+        return
+    db[STATE_COLLECTION].update_one(
+        {"_id": SRC_COLLECTION},
+        {"$set": {"last_source_id": source_id, "updated_at": datetime.utcnow()}},
+        upsert=True
+    )
+
+
+def backfill_journeys(journeys, dst) -> Counter:
+    """Plan and upsert a stream of journeys; memory stays O(one journey + one batch)."""
+    writer = BulkWriter(dst)
+    counts = Counter()
+
+    for key, docs in journeys:
+        out_docs, synthetic = plan_journey(key, docs)
+        counts["journeys"] += 1
+        counts["synthetic"] += synthetic
+        for d in out_docs:
+            writer.add(UpdateOne({"msg_id": d["msg_id"]}, {"$set": d}, upsert=True))
+
+    counts["written"] = writer.close()
+    return counts
+
+
+def backfill_shard(lo, hi, strays) -> Counter:
+    """Process-pool entry point: backfill companies in [lo, hi) on the worker process's own client."""
+    db = get_db("batch", DB_NAME)
+    return backfill_journeys(iter_journeys(db[SRC_COLLECTION], lo, hi, strays), db[DST_COLLECTION])
+
+
+def shard_bounds(src, shards):
+    """Split the company key space into about `shards` ranges of similar size."""
+    buckets = src.aggregate([
+        {"$match": BASE_QUERY},
+        {"$bucketAuto": {"groupBy": "$company", "buckets": shards}},
+    ], allowDiskUse=True)
+    cuts = sorted({b["_id"]["min"] for b in buckets if isinstance(b["_id"]["min"], str)})
+    edges = [None] + cuts[1:] + [None]
+    return list(zip(edges[:-1], edges[1:]))
+
+
+def backfill_parallel(src, workers) -> Counter:
+    """Run backfill_shard over company ranges in a pool of worker processes."""
+    bounds = shard_bounds(src, workers * SHARDS_PER_WORKER)
+    strays = load_strays(src)
+    print(f"[Backfill] Running {len(bounds)} shards on {workers} workers...")
+
+    totals = Counter()
+    ctx = multiprocessing.get_context("spawn")  # MongoClient is not fork-safe
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+        futures = [
+            pool.submit(backfill_shard, lo, hi,
+                        {k: v for k, v in strays.items() if in_company_range(k, lo, hi)})
+            for lo, hi in bounds
+        ]
+        for done, future in enumerate(as_completed(futures), 1):
+            totals.update(future.result())
+            print(f"[Backfill] Shard {done}/{len(bounds)} done | "
+                  f"{totals['journeys']} journeys, {totals['written']} upserts")
+    return totals
+
+
+def build_backfilled(workers=1):
+    db = get_db("batch", DB_NAME)
     src = db[SRC_COLLECTION]
     dst = db[DST_COLLECTION]
 
     ensure_indexes(dst)
+    ensure_source_index(src)
+    watermark = latest_source_id(src)
 
-    print("[Backfill] Loading real messages from source collection...")
-    base_query = {"spam": False, "msg_id": {"$not": {"$regex": "^auto_"}}}
-    projection = {
-        "_id": 0, "msg_id": 1, "text": 1, "timestamp": 1,
-        "author": 1, "company": 1, "stage": 1, "new_grad": 1, "category": 1
-    }
-
-    cursor = src.find(base_query, projection)
-    journeys = {}
-
-    for doc in cursor:
-        company = (doc.get("company") or "").strip()
-        author = (doc.get("author") or "").strip()
-        new_grad = bool(doc.get("new_grad", False))
-        ts = to_dt(doc.get("timestamp"))
-        doc["timestamp"] = ts
-        key = (company, author, new_grad)
-        journeys.setdefault(key, []).append(doc)
-
-    print(f"[Backfill] Found {len(journeys)} unique journeys.")
-
-    ops = []
-    synthetic_total = 0
-
-    for (company, author, new_grad), docs in journeys.items():
-        present = {str(x.get("stage", "")).strip() for x in docs if x.get("stage")}
-        real_ts = [to_dt(x.get("timestamp")) for x in docs if x.get("timestamp")]
-        real_ts = [x for x in real_ts if x]
-        latest_real = max(real_ts) if real_ts else None
-
-        has_reject = "Reject" in present
-        has_offer = "Offer" in present
-
-        valid = [s for s in present if s in STAGE_ORDER]
-        if not valid:
-            continue
+    if workers > 1:
+        counts = backfill_parallel(src, workers)
+    else:
+        print("[Backfill] Streaming real messages from source collection...")
+        counts = backfill_journeys(iter_journeys(src), dst)
 
-        stage_pos = {s: i for i, s in enumerate(STAGE_ORDER)}
-        if not has_reject:
-            latest_idx = max(stage_pos[s] for s in valid)
-        else:
-            if present == {"Reject"}:
-                latest_idx = stage_pos["OA"]
-            else:
-                reject_idx = stage_pos["Reject"]
-                prev_real = [stage_pos[s] for s in valid if stage_pos[s] < reject_idx]
-                latest_idx = max(prev_real) if prev_real else stage_pos["OA"]
-
-        offset_days = 0
-        for i in range(latest_idx):
-            st = STAGE_ORDER[i]
-            if st in BASE_NEVER_AUTOGEN or (st == "Interview" and not has_offer):
-                continue
-            if st in present:
-                continue
-
-            offset_days += 3
-            ts = latest_real - timedelta(days=offset_days) if latest_real else None
-            auto_id = deterministic_auto_id(company, author, st, latest_real or datetime.utcnow())
-
-            new_doc = {
-                "msg_id": auto_id,
-                "text": "[Auto-generated since the user submitted next stage]",
-                "timestamp": ts.isoformat() if isinstance(ts, datetime) else ts,
-                "author": author,
-                "company": company,
-                "stage": st,
-                "spam": False,
-                "new_grad": new_grad,
-                "category": None,
-                "auto": True
-            }
-            ops.append(UpdateOne({"msg_id": auto_id}, {"$set": new_doc}, upsert=True))
-            synthetic_total += 1
-
-        # Add all real docs as well
-        for d in docs:
-            out = {
-                "msg_id": d["msg_id"],
-                "text": d.get("text"),
-                "timestamp": (
-                    d["timestamp"].isoformat() if isinstance(d["timestamp"], datetime) else d["timestamp"]
-                ),
-                "author": d["author"],
-                "company": d["company"],
-                "stage": d.get("stage"),
-                "spam": False,
-                "new_grad": bool(d.get("new_grad", False)),
-                "category": d.get("category"),
-                "auto": False
-            }
-            ops.append(UpdateOne({"msg_id": out["msg_id"]}, {"$set": out}, upsert=True))
-
-    print(f"[Backfill] Prepared {len(ops)} upserts ({synthetic_total} synthetic).")
-
-    # Bulk write in batches
-    if ops:
-        for i in range(0, len(ops), 5000):
-            chunk = ops[i:i+5000]
-            dst.bulk_write(chunk, ordered=False)
+    synthetic_total = counts["synthetic"]
+    print(f"[Backfill] Processed {counts['journeys']} unique journeys.")
+    print(f"[Backfill] Wrote {counts['written']} upserts ({synthetic_total} synthetic).")
+    if counts["written"]:
         print("[Backfill] ✅ Backfilled collection updated successfully.")
 
     print(f"[Backfill] Synthetic stages added: {synthetic_total}")
+    set_watermark(db, watermark)
+
+    counts = rebuild_meta_summary(db, source=DST_COLLECTION)
+    print(f"[Backfill] Meta summary rebuilt: {counts}")
+
+
+def build_backfilled_incremental():
+    """
+    Recompute only journeys touched by source documents added since the last run.
+
+    Each touched journey's desired docs are diffed against what is already in
+    the backfilled collection; only changed rows are upserted and synthetic
+    rows that are no longer wanted (e.g. stages superseded by a real one) are
+    deleted. Other rows of the journey that have no source document, such as
+    /api/submit submissions, are left alone. The watermark is the source _id, so it tracks inserts; after
+    in-place rewrites of existing rows (canonicalization, stage merges) run a
+    full build instead.
+    """
+    db = get_db("batch", DB_NAME)
+    src = db[SRC_COLLECTION]
+    dst = db[DST_COLLECTION]
+
+    last_id = get_watermark(db)
+    if last_id is None:
+        print("[Backfill] No watermark yet, running a full build.")
+        return build_backfilled()
+
+    ensure_indexes(dst)
+    watermark = latest_source_id(src)
+    if watermark is None or watermark <= last_id:
+        print("[Backfill] Source unchanged since last run.")
+        return
+
+    new_docs = src.find({**BASE_QUERY, "_id": {"$gt": last_id, "$lte": watermark}},
+                        {"_id": 0, "author": 1, "company": 1, "new_grad": 1})
+    touched = {journey_key(d) for d in new_docs}
+    if not touched:
+        set_watermark(db, watermark)
+        print("[Backfill] No new journeys to update.")
+        return
+    print(f"[Backfill] {len(touched)} journeys touched since last run.")
+
+    # Authors are stored unstripped in places, so match both spellings and
+    # narrow down to the touched keys in memory
+    authors = list({a for _, a, _ in touched})
+    author_query = {"$in": authors + [f" {a}" for a in authors] + [f"{a} " for a in authors]}
+
+    journeys = {key: [] for key in touched}
+    for doc in src.find({**BASE_QUERY, "author": author_query}, PROJECTION):
+        key = journey_key(doc)
+        if key in journeys:
+            journeys[key].append(doc)
+
+    existing = {key: {} for key in touched}
+    for doc in dst.find({"author": author_query}, {"_id": 0}):
+        key = journey_key(doc)
+        if key in existing:
+            existing[key][doc["msg_id"]] = doc
+
+    writer = BulkWriter(dst)
+    upserts = deletes = 0
+    for key, docs in journeys.items():
+        out_docs, _ = plan_journey(key, docs)
+        current = existing[key]
+        for d in out_docs:
+            if current.pop(d["msg_id"], None) != d:
+                writer.add(UpdateOne({"msg_id": d["msg_id"]}, {"$set": d}, upsert=True))
+                upserts += 1
+        for msg_id, doc in current.items():
+            if is_synthetic(doc):
+                writer.add(DeleteOne({"msg_id": msg_id}))
+                deletes += 1
+
+    written = writer.close()
+    set_watermark(db, watermark)
+    print(f"[Backfill] ✅ Incremental update: {upserts} upserts, {deletes} deletes.")
+
+    if written:
+        counts = rebuild_meta_summary(db, source=DST_COLLECTION)
+        print(f"[Backfill] Meta summary rebuilt: {counts}")
 
 
 if __name__ == "__main__":
-    build_backfilled()
+    parser = argparse.ArgumentParser(description="Build interview_processes_backfilled.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only recompute journeys touched since the last run")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="worker processes for a full build (default: 1)")
+    args = parser.parse_args()
+
+    if args.incremental:
+        build_backfilled_incremental()
+    else:
+        build_backfilled(workers=args.workers)
@@ -0,0 +1,259 @@
+"""
+Canonical company names shared by the pipeline and the API.
+
+CANON maps each canonical company name to the spellings, abbreviations and
+typos seen in submissions. ALIAS_INDEX is the reverse lookup compiled once at
+import time; canonicalize() applies it to a single name and is called at write
+time by the parser and /api/submit.
+
+For names already stored, plan_canonicalization() groups the distinct
+non-canonical spellings of a collection and apply_canonicalization() rewrites
+them with one UpdateMany per canonical name.
+"""
+
+from typing import Dict
+
+from pymongo import UpdateMany
+
+# --- Unified Canonical Mapping ---
+
+CANON = {
+    "1Password": ["1Pass"],
+    "2K Games": ["2K", "2k Games"],
+    "AT&T": ["ATT", "At&T", "At&t", "Att"],
+    "AWS": ["Aws", "Amazon Web Services", "Aws Ml"],
+    "Abnormal AI": ["Abnormal.ai"],
+    "Activision Blizzard": ["Activision"],
+    "Adobe": ["Adboe"],
+    "Akuna Capital": ["Akuna", "Akuna Trading"],
+    "AMD": ["Amd"],
+    "Amazon": [
+        "Amazon Prime", "Amazon Robotics", "Amazon Science", "Amazon Warehouse",
+        "ZON", "Zon", "Zon Annapurna"
+    ],
+    "American Express": ["Amex"],
+    "AppFolio": ["Appfolio"],
+    "AppLovin": ["Applovin"],
+    "Arrowstreet Capital": ["Arrowstreet", "Arrow Street", "Arrowst"],
+    "Aurora Innovation": ["Aurora"],
+    "BAE Systems": ["BAE"],
+    "BAM": ["Bam"],
+    "Bank of America": ["Bank Of America", "Boa", "BofA", "Bofa"],
+    "Bank of Ireland": ["Bank Of Ireland"],
+    "BCG": ["Bcg", "Bcg X"],
+    "BB": ["Bb"],
+    "BBG": ["Bbg"],
+    "Belvedere Trading": ["Belvedere"],
+    "Bentley Systems": ["Bentley", "Bentley System"],
+    "BitGo": ["Bitgo"],
+    "Black Edge": ["Blackedge"],
+    "BlackRock": ["Black Rock", "Blackrock"],
+    "Blizzard Entertainment": ["Blizzard"],
+    "Blue Yonder": ["Blueyonder"],
+    "BNSF Railway": ["BNSF", "Bnsf", "BNSF Rail", "BNSF Railways"],
+    "Booz Allen Hamilton": ["Booz", "Booz Allen"],
+    "Bosch": ["Bosch Research"],
+    "ByteDance": ["Bytedance"],
+    "C3.ai": ["C3", "C3.AI", "C3.Ai"],
+    "CBOE": ["Cboe"],
+    "CBRE": ["Cb"],
+    "Character AI": ["Character.ai"],
+    "Chick Fil A": ["Chik Fil A"],
+    "Citadel": ["Citadel Securities"],
+    "CITI": ["Cit", "CitSec", "Citsec"],
+    "CLEAR": ["Clear"],
+    "Co-operators": ["Co-Operators"],
+    "CoStar Group": ["Costar", "Costar Group", "CoStar"],
+    "CTC": ["Ctc"],
+    "CZI": ["Czi"],
+    "CVS": ["Cvs"],
+    "DE Shaw": ["Deshaw"],
+    "DESRES": ["Desres"],
+    "DL Trading": ["Dl Trading"],
+    "Deloitte": ["Deloitte Consulting"],
+    "Dick's Sport": ["Dick's", "Dicks", "Dicks Sporting"],
+    "DoorDash": ["Doordash"],
+    "DraftKings": ["Draftkings", "Draft Kings", "Draftking"],
+    "DRW": ["Drw"],
+    "Dsm Firmenich": ["Dsm-Firmenich"],
+    "EA": ["Electronic Arts"],
+    "Epic Games": ["Epic Game", "Epic"],
+    "EvenUp": ["Evenup"],
+    "ExtraHop": ["Extrahop"],
+    "FedEx": ["Fedex"],
+    "Five Rings": ["Five Gys"],
+    "Flow Traders": ["Flow Trader"],
+    "Future Force": ["Futureforce"],
+    "GE": ["GE Aerospace", "GE Appliances"],
+    "GitHub": ["Github"],
+    "G-Research": ["GResearch", "Gresearch"],
+    "Goldman Sachs": ["Gs"],
+    "Google": ["Google AI Catalyst", "Google DeepMind", "Google AI Catalyst Program"],
+    "Greylock": ["Greylock Techfair", "Grelock Techfair"],
+    "GTS": ["Gts"],
+    "Harvey AI": ["Harvey Ai"],
+    "Headland": ["Headlands"],
+    "HPE": ["Hpe"],
+    "HPR": ["Hpr"],
+    "HubSpot": ["Hubspot", "Hubbob"],
+    "Hudson River Trading": ["HRT"],
+    "IBM": ["Ibm"],
+    "IMC Trading": ["IMC"],
+    "Interactive Brokers": ["Interactive Broker"],
+    "InterSystems": ["Intersystems"],
+    "Intuitive": ["Intutive"],
+    "IXL": ["Ixl"],
+    "Jane Street": ["Janestreet"],
+    "JPMorgan Chase": ["JP Morgan", "JPMC", "JPM", "Jpmorgan", "Jpm", "Jpmc", "JPMorganChase"],
+    "Johnson & Johnson": ["J&J", "Jnj", "Johnson And Johnson", "Johnson and Johnson"],
+    "JS": ["Js"],
+    "Jump Trading": ["Jump"],
+    "KKR": ["Kkr"],
+    "Kohl’s": ["Kohls", "Kohl\u2019s"],
+    "KPMG": ["Kpmg"],
+    "KP Fellow": ["Kp Fellow"],
+    "L3Harris Technologies": ["L3Harris"],
+    "LinkedIn": ["Linkedin"],
+    "LSEG": ["Lseg"],
+    "Lowe’s": ["Lowes"],
+    "Macy’s": ["Macys"],
+    "McDonald’s": ["McDonalds", "Mcdonalds", "Mcdonald's", "Mcds", "Mcodnalds"],
+    "Merge API": ["Merge Api"],
+    "Meta": ["Facebook", "Meta Reality Labs"],
+    "Microsoft": ["Micro", "Microstrategy", "MicroStrategy"],
+    "Millennium": ["Millenium", "Milennium", "Millennium Management"],
+    "MindGeek": ["Mindgeek"],
+    "MongoDB": ["Mongodb", "Mangodb"],
+    "Morgan Stanley": ["Ms"],
+    "NASA": ["Nasa"],
+    "NBCUniversal": ["NBCU", "NBC Universal"],
+    "NCR Voyix": ["Ncr Voyix"],
+    "Neo Scholar": ["Neo Scholars"],
+    "NetApp": ["Netapp"],
+    "Nexthop AI": ["Nexthop Ai"],
+    "NimbleRx": ["Nimblerx"],
+    "Northrop Grumman": ["Northslope", "General Dynamic", "General Dynamics"],
+    "NVIDIA": ["Nvidia"],
+    "OC&C": ["Oc&c"],
+    "OKC": ["Okc"],
+    "OKC Thunder": ["Okc Thunnder"],
+    "OMC": ["Omc"],
+    "OpenAI": ["Open Ai", "Open AI", "Openai", "Oai"],
+    "Optiver": ["Optiver Trading"],
+    "Palantir": ["Pltr"],
+    "PANW": ["Panw"],
+    "PayPal": ["Paypal"],
+    "PDT Partners": ["PJT Partners"],
+    "PNC": ["Pnc"],
+    "PrizePicks": ["Prizepick", "Prizepicks"],
+    "Procter & Gamble": ["Procter And Gamble", "Proctor And Gamble", "Procter and Gamble", "P&G"],
+    "PwC": ["Pwc", "Pwc Cyber"],
+    "Random Startup #1": ["Random Startup #2"],
+    "Riot Games": ["Riot", "Riot Game"],
+    "Robhinhood": ["Robinhood"],
+    "RTX": ["Rtx"],
+    "Salesforce": ["Sales Force"],
+    "Samara": ["Samsara"],
+    "Scale AI": ["Scale Ai", "Scaleai", "Scale.AI", "ScaleAI"],
+    "SeatGeek": ["Seatgeek"],
+    "ServiceNow": ["Servicenow"],
+    "Series A Startup": ["SeriesA Startup"],
+    "SIG": ["Sig"],
+    "SMBC": ["Smbc"],
+    "Snowflake": ["Snow"],
+    "SpaceX": ["Spacex", "Spacex Starlink"],
+    "Stripe": ["Stirpe"],
+    "T-Mobile": ["Tmobile"],
+    "Tesla": ["Tesla Optimus"],
+    "Thinking Machine": ["Thinking Machines"],
+    "TikTok": ["Tik Tok", "Tiktok"],
+    "TGS": ["Tgs"],
+    "TTD": ["Ttd"],
+    "Two Sigma": ["2 Sigma", "2Sig"],
+    "UBS": ["Ubs"],
+    "Uber": ["Uber Freight"],
+    "UKG": ["Ukg"],
+    "USAA": ["Usaa"],
+    "Virtu Financial": ["Virtu", "Virtu Qt"],
+    "Walleye Capital": ["Walleye", "Walleye Capitol", "Walleye Technology"],
+    "Walmart": ["Walmart Global Tech"],
+    "Waymo": ["Waymo Ml Infra"],
+    "Wells Fargo": ["Wells", "Welssfargo", "Wells Fargo St. Louis"],
+    "WF": ["Wf"],
+    "Zeiss": ["Zeuiss"],
+    "Zebra Technologies": ["Zebra", "Zebra Tech"],
+    "Zocdoc": ["Zodoc"],
+    "ZoomInfo": ["Zoominfo"],
+    "ZS Associates": ["ZS"],
+}
+
+
+# --- Normalize Helper ---
+def normalize(s):
+    return s.strip().lower() if isinstance(s, str) else ""
+
+
+def build_alias_index(canon: Dict[str, list] = CANON) -> Dict[str, str]:
+    """Build the normalized alias -> canonical name lookup."""
+    index = {}
+    for canon_name, variants in canon.items():
+        for v in variants:
+            index[normalize(v)] = canon_name
+        index[normalize(canon_name)] = canon_name  # include itself
+    return index
+
+
+ALIAS_INDEX = build_alias_index()
+
+
+def canonicalize(name):
+    """Return the canonical spelling of a company name (stripped, unchanged if unknown)."""
+    if not isinstance(name, str):
+        return name
+    stripped = name.strip()
+    return ALIAS_INDEX.get(normalize(stripped), stripped)
+
+
+# --- Bulk canonicalization of stored documents ---
+
+def plan_canonicalization(coll, alias_index: Dict[str, str] = None) -> Dict[str, Dict[str, int]]:
+    """
+    Find stored company names that are not canonical.
+
+    Works on the distinct names (one $group), not on every document.
+    Returns {canonical name: {stored variant: document count}}.
+    """
+    alias_index = ALIAS_INDEX if alias_index is None else alias_index
+    plan = {}
+    for row in coll.aggregate([
+        {"$match": {"company": {"$type": "string"}}},
+        {"$group": {"_id": "$company", "count": {"$sum": 1}}},
+    ], allowDiskUse=True):
+        name = row["_id"]
+        stripped = name.strip()
+        target = alias_index.get(normalize(stripped), stripped)
+        if target and target != name:
+            plan.setdefault(target, {})[name] = row["count"]
+    return plan
+
+
+def apply_canonicalization(coll, plan: Dict[str, Dict[str, int]]) -> int:
+    """Rewrite every planned variant in one unordered bulk write; returns documents modified."""
+    ops = [
+        UpdateMany({"company": {"$in": sorted(variants)}}, {"$set": {"company": canon_name}})
+        for canon_name, variants in plan.items()
+    ]
+    if not ops:
+        return 0
+    return coll.bulk_write(ops, ordered=False).modified_count
+
+
+def format_plan(plan: Dict[str, Dict[str, int]]) -> str:
+    """Human-readable diff of a canonicalization plan, largest changes first."""
+    lines = []
+    for canon_name, variants in sorted(plan.items(), key=lambda kv: -sum(kv[1].values())):
+        for variant, count in sorted(variants.items(), key=lambda kv: -kv[1]):
+            lines.append(f"  {variant!r} -> {canon_name!r} ({count} docs)")
+    total = sum(sum(v.values()) for v in plan.values())
+    lines.append(f"{sum(len(v) for v in plan.values())} variants, {total} documents")
+    return "\n".join(lines)
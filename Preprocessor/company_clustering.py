@@ -0,0 +1,276 @@
+"""
+Offline fuzzy clustering of company names to grow the CANON map.
+
+This script:
+1. Loads the distinct company names (with submission counts) from MongoDB
+2. Blocks candidate pairs by name prefix and by MinHash LSH over character
+   trigrams, so only plausible pairs are compared instead of all pairs
+3. Scores each candidate pair with Levenshtein (Myers bit-parallel) and
+   Jaro-Winkler similarity
+4. Clusters accepted pairs and prints the proposed alias -> canonical
+   additions to CANON, with submission counts as evidence
+
+Nothing is written to MongoDB; review the diff, then add the entries to
+canonical.py and run merge_companies.py.
+"""
+
+import argparse
+import hashlib
+import json
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from main.Preprocessor.canonical import ALIAS_INDEX, CANON, normalize
+from main.Preprocessor.mongo_pool import get_db
+
+COLLECTION = "interview_processes"
+
+MIN_NAME_LENGTH = 4      # shorter names (HP, EA, ...) collide too easily
+MAX_LENGTH_GAP = 3
+PREFIX_LENGTH = 2        # prefix block catches transpositions like "Adboe"
+MAX_BLOCK_SIZE = 500     # blocks larger than this are left to LSH
+
+# MinHash LSH: 16 bands x 2 rows -> pairs with trigram Jaccard ~0.2+ usually collide
+LSH_BANDS = 16
+LSH_ROWS = 2
+
+JARO_WINKLER_THRESHOLD = 0.92
+EDIT_SIMILARITY_THRESHOLD = 0.8
+
+
+# ---------- Similarity ----------
+def levenshtein_many(pattern: str, candidates: Iterable[str]) -> List[int]:
+    """
+    Edit distance from pattern to each candidate.
+
+    Uses Myers' bit-parallel algorithm: the pattern is compiled into per-char
+    bitmasks once and each candidate costs O(len(candidate)) word operations.
+    """
+    m = len(pattern)
+    if m == 0:
+        return [len(c) for c in candidates]
+
+    peq = defaultdict(int)
+    for i, ch in enumerate(pattern):
+        peq[ch] |= 1 << i
+    mask = (1 << m) - 1
+    last = 1 << (m - 1)
+
+    distances = []
+    for text in candidates:
+        pv, mv, score = mask, 0, m
+        for ch in text:
+            eq = peq.get(ch, 0)
+            xv = eq | mv
+            xh = (((eq & pv) + pv) ^ pv) | eq
+            ph = mv | ~(xh | pv) & mask
+            mh = pv & xh
+            if ph & last:
+                score += 1
+            elif mh & last:
+                score -= 1
+            ph = ((ph << 1) | 1) & mask
+            mh = (mh << 1) & mask
+            pv = mh | ~(xv | ph) & mask
+            mv = ph & xv
+        distances.append(score)
+    return distances
+
+
+def jaro_winkler(a: str, b: str, prefix_scale: float = 0.1) -> float:
+    if a == b:
+        return 1.0
+    la, lb = len(a), len(b)
+    if not la or not lb:
+        return 0.0
+
+    window = max(la, lb) // 2 - 1
+    a_flags, b_flags = [False] * la, [False] * lb
+    matches = 0
+    for i, ch in enumerate(a):
+        for j in range(max(0, i - window), min(lb, i + window + 1)):
+            if not b_flags[j] and b[j] == ch:
+                a_flags[i] = b_flags[j] = True
+                matches += 1
+                break
+    if not matches:
+        return 0.0
+
+    b_matched = (b[j] for j in range(lb) if b_flags[j])
+    transpositions = sum(a[i] != next(b_matched) for i in range(la) if a_flags[i]) / 2
+    jaro = (matches / la + matches / lb + (matches - transpositions) / matches) / 3
+
+    prefix = 0
+    for x, y in zip(a[:4], b[:4]):
+        if x != y:
+            break
+        prefix += 1
+    return jaro + prefix * prefix_scale * (1 - jaro)
+
+
+# ---------- Blocking ----------
+def trigrams(name: str) -> Set[str]:
+    padded = f"  {name} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def minhash_signature(shingles: Set[str], num_hashes: int) -> List[int]:
+    return [
+        min(int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8,
+                                           salt=seed.to_bytes(8, "little")).digest(), "little")
+            for s in shingles)
+        for seed in range(num_hashes)
+    ]
+
+
+def candidate_pairs(names: List[str]) -> Set[Tuple[int, int]]:
+    """Index pairs sharing a prefix block or an LSH band bucket."""
+    blocks = defaultdict(list)
+    for idx, name in enumerate(names):
+        blocks[("prefix", name[:PREFIX_LENGTH])].append(idx)
+        signature = minhash_signature(trigrams(name), LSH_BANDS * LSH_ROWS)
+        for band in range(LSH_BANDS):
+            rows = tuple(signature[band * LSH_ROWS:(band + 1) * LSH_ROWS])
+            blocks[("lsh", band, rows)].append(idx)
+
+    pairs = set()
+    for members in blocks.values():
+        if len(members) < 2 or len(members) > MAX_BLOCK_SIZE:
+            continue
+        for i, a in enumerate(members):
+            for b in members[i + 1:]:
+                if abs(len(names[a]) - len(names[b])) <= MAX_LENGTH_GAP:
+                    pairs.add((a, b))
+    return pairs
+
+
+def score_pairs(names: List[str], pairs: Set[Tuple[int, int]]) -> List[Tuple[int, int, float, float]]:
+    """(a, b, edit similarity, jaro-winkler) for pairs above either threshold."""
+    by_left = defaultdict(list)
+    for a, b in pairs:
+        by_left[a].append(b)
+
+    accepted = []
+    for a, others in by_left.items():
+        distances = levenshtein_many(names[a], [names[b] for b in others])
+        for b, dist in zip(others, distances):
+            longest = max(len(names[a]), len(names[b]))
+            edit_sim = 1 - dist / longest
+            jw = jaro_winkler(names[a], names[b])
+            # One edit is a big change in a short name ("meta" ~ "mesa"), so
+            # short names only match on Jaro-Winkler, which tolerates swaps
+            if longest <= 6:
+                matched = jw >= JARO_WINKLER_THRESHOLD
+            else:
+                matched = edit_sim >= EDIT_SIMILARITY_THRESHOLD or jw >= JARO_WINKLER_THRESHOLD
+            if matched:
+                accepted.append((a, b, edit_sim, jw))
+    return accepted
+
+
+# ---------- Clustering ----------
+def cluster_names(counts: Dict[str, int], alias_index: Dict[str, str] = None) -> Dict[str, Dict[str, int]]:
+    """
+    Propose {canonical: {new alias: submissions}} from stored names and counts.
+
+    Clusters are joined greedily from the most similar pair down, and never
+    merge two different existing canonical names.
+    """
+    alias_index = ALIAS_INDEX if alias_index is None else alias_index
+
+    # One entry per normalized spelling; keep the most used original casing
+    display, best, totals = {}, {}, defaultdict(int)
+    for name, count in counts.items():
+        key = normalize(name)
+        if len(key) < MIN_NAME_LENGTH:
+            continue
+        totals[key] += count
+        if count > best.get(key, -1):
+            display[key], best[key] = name.strip(), count
+    for canon_name in CANON:
+        key = normalize(canon_name)
+        if len(key) >= MIN_NAME_LENGTH:
+            display.setdefault(key, canon_name)
+
+    names = sorted(display)
+    parent = list(range(len(names)))
+    canon_of = [alias_index.get(n) for n in names]
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    scored = score_pairs(names, candidate_pairs(names))
+    for a, b, edit_sim, jw in sorted(scored, key=lambda s: -(s[2] + s[3])):
+        ra, rb = find(a), find(b)
+        if ra == rb:
+            continue
+        if canon_of[ra] and canon_of[rb] and canon_of[ra] != canon_of[rb]:
+            continue
+        parent[rb] = ra
+        canon_of[ra] = canon_of[ra] or canon_of[rb]
+
+    clusters = defaultdict(list)
+    for i in range(len(names)):
+        clusters[find(i)].append(i)
+
+    proposals = {}
+    for root, members in clusters.items():
+        if len(members) < 2:
+            continue
+        target = canon_of[root] or display[max((names[i] for i in members), key=lambda n: totals[n])]
+        for i in members:
+            if alias_index.get(names[i]) or normalize(target) == names[i]:
+                continue
+            proposals.setdefault(target, {})[display[names[i]]] = totals[names[i]]
+    return proposals
+
+
+def format_proposals(proposals: Dict[str, Dict[str, int]], counts: Dict[str, int]) -> str:
+    """Reviewable diff against CANON, biggest clusters first."""
+    totals = defaultdict(int)
+    for name, count in counts.items():
+        totals[normalize(name)] += count
+
+    lines = []
+    for target, aliases in sorted(proposals.items(), key=lambda kv: -sum(kv[1].values())):
+        status = "~" if target in CANON else "+"
+        lines.append(f"{status} {target!r} ({totals[normalize(target)]} submissions)")
+        for alias, count in sorted(aliases.items(), key=lambda kv: -kv[1]):
+            lines.append(f"    + {alias!r} ({count} submissions)")
+    lines.append(f"{sum(len(a) for a in proposals.values())} new aliases in {len(proposals)} clusters")
+    return "\n".join(lines)
+
+
+def load_company_counts(coll) -> Dict[str, int]:
+    return {
+        row["_id"]: row["count"]
+        for row in coll.aggregate([
+            {"$match": {"spam": False, "company": {"$type": "string"}}},
+            {"$group": {"_id": "$company", "count": {"$sum": 1}}},
+        ], allowDiskUse=True)
+    }
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Propose new CANON aliases from fuzzy matches.")
+    parser.add_argument("--collection", default=COLLECTION)
+    parser.add_argument("--json", dest="json_path", help="also write the proposals to this JSON file")
+    args = parser.parse_args(argv)
+
+    counts = load_company_counts(get_db("batch")[args.collection])
+    print(f"🔎 Clustering {len(counts)} distinct company names...")
+
+    proposals = cluster_names(counts)
+    print(format_proposals(proposals, counts))
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(proposals, f, indent=2, sort_keys=True)
+        print(f"💾 Wrote proposals to {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
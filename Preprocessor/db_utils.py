@@ -8,13 +8,55 @@ This module provides:
 - Message tracking utilities
 """
 
-from pymongo import MongoClient, ASCENDING
-from pymongo.server_api import ServerApi
+from pymongo import ASCENDING, ReplaceOne, UpdateOne
+from pymongo.errors import BulkWriteError, OperationFailure
+import logging
 import time
-from datetime import datetime
+from datetime import datetime, timedelta
 from typing import List, Dict, Optional
 
-# MongoDB connection string
+log = logging.getLogger(__name__)
+
+# How long a parser worker owns the messages it claimed before others may retry them
+CLAIM_LEASE = timedelta(minutes=10)
+
+# How long get_stats() reuses its last result
+STATS_TTL = 60
+
+
+def _counts_by(coll, field: str) -> Dict:
+    """One $group pass: value of field -> document count."""
+    return {row["_id"]: row["count"] for row in coll.aggregate([
+        {"$group": {"_id": f"${field}", "count": {"$sum": 1}}}
+    ])}
+
+
+def collect_pipeline_stats(db) -> Dict:
+    """
+    Pipeline statistics in one pass per collection.
+
+    Totals come from estimated_document_count() (collection metadata, no
+    scan); breakdowns use a single $group per collection.
+    """
+    processed, interviews = db["processed_ids"], db["interview_processes"]
+    unprocessed, archive = db["unprocessed_messages"], db["archive"]
+
+    processed_by_spam = _counts_by(processed, "spam")
+    archive_by_spam = _counts_by(archive, "spam")
+    unprocessed_by_channel = _counts_by(unprocessed, "channel")
+
+    return {
+        "total_processed": processed.estimated_document_count(),
+        "total_interviews": interviews.estimated_document_count(),
+        "spam_messages": processed_by_spam.get(True, 0),
+        "non_spam_messages": processed_by_spam.get(False, 0),
+        "unprocessed_messages": sum(unprocessed_by_channel.values()),
+        "unprocessed_by_channel": {str(k): v for k, v in unprocessed_by_channel.items()},
+        "archived_messages": archive.estimated_document_count(),
+        "archived_spam": archive_by_spam.get(True, 0),
+        "archived_non_spam": archive_by_spam.get(False, 0),
+        "generated_at": datetime.utcnow().isoformat()
+    }
 
 
 class DatabaseManager:
@@ -22,12 +64,20 @@ class DatabaseManager:
 
     def __init__(self):
         """Initialize database connection."""
-        self.client = MongoClient(MONGO_URI, server_api=ServerApi('1'))
+        # Imported here so the API server can use this module's helpers
+        # without the Preprocessor package path
+        from main.Preprocessor.mongo_pool import get_client
+        self.client = get_client("worker")
         self.db = self.client["JobStats"]
         self.interview_collection = self.db["interview_processes"]
         self.processed_collection = self.db["processed_ids"]
         self.unprocessed_collection = self.db["unprocessed_messages"]
         self.archive_collection = self.db["archive"]
+        self.harvest_state_collection = self.db["harvest_state"]
+        self.backfilled_collection = self.db["interview_processes_backfilled"]
+        # Cleared once the server rejects $merge (MongoDB < 4.2)
+        self.merge_supported = True
+        self._stats_cache = None  # (monotonic time, stats)
 
         # Ensure indexes exist
         self._ensure_indexes()
@@ -37,12 +87,22 @@ class DatabaseManager:
         try:
             # Index on msg_id for processed_ids collection
             self.processed_collection.create_index([("msg_id", ASCENDING)], unique=True)
+            # Index on processed_at for seeding the harvester's recent-id filter
+            self.processed_collection.create_index([("processed_at", ASCENDING)])
             # Index on msg_id for unprocessed_messages collection
             self.unprocessed_collection.create_index([("msg_id", ASCENDING)], unique=True)
             # Index on msg_id for archive collection
             self.archive_collection.create_index([("msg_id", ASCENDING)])
             # Index on channel for unprocessed_messages
             self.unprocessed_collection.create_index([("channel", ASCENDING)])
+            # Index on (channel, lease_until) for claiming unleased messages
+            self.unprocessed_collection.create_index([("channel", ASCENDING), ("lease_until", ASCENDING)])
+            # Index on (author, company, stage) for parser duplicate checks and upserts
+            self.interview_collection.create_index(
+                [("author", ASCENDING), ("company", ASCENDING), ("stage", ASCENDING)]
+            )
+            # Index on msg_id for replacing the entries of edited messages
+            self.interview_collection.create_index([("msg_id", ASCENDING)])
         except Exception as e:
             # Indexes might already exist
             pass
@@ -51,10 +111,10 @@ class DatabaseManager:
         """Test MongoDB connection."""
         try:
             self.client.admin.command('ping')
-            print("✅ Connected to MongoDB!")
+            log.info("connected to MongoDB")
             return True
         except Exception as e:
-            print(f"❌ Connection failed: {e}")
+            log.error("MongoDB connection failed", extra={"error": str(e)})
             return False
 
     def is_message_processed(self, msg_id: str) -> bool:
@@ -93,6 +153,26 @@ class DatabaseManager:
         processed_set = {doc["msg_id"] for doc in processed}
         return {msg_id: msg_id in processed_set for msg_id in msg_ids}
 
+    def get_processed_times(self, msg_ids: List[str]) -> Dict[str, str]:
+        """
+        Look up when each processed message was (last) processed.
+
+        Args:
+            msg_ids: List of Discord message IDs
+
+        Returns:
+            Dictionary mapping msg_id -> processed_at (naive UTC ISO string);
+            ids that were never processed are left out
+        """
+        if not msg_ids:
+            return {}
+
+        processed = self.processed_collection.find(
+            {"msg_id": {"$in": msg_ids}},
+            {"msg_id": 1, "processed_at": 1, "_id": 0}
+        )
+        return {doc["msg_id"]: doc.get("processed_at") or "" for doc in processed}
+
     def mark_message_processed(self, msg_id: str, spam: bool = False, source: str = "harvesting"):
         """
         Mark a single message as processed.
@@ -112,12 +192,15 @@ class DatabaseManager:
         except Exception as e:
             # Duplicate key error is fine - message already processed
             if "duplicate key" not in str(e).lower():
-                print(f"⚠️  Error marking message {msg_id} as processed: {e}")
+                log.warning("error marking message as processed", extra={"msg_id": msg_id, "error": str(e)})
 
     def mark_messages_processed(self, msg_ids: List[str], spam: bool = False, source: str = "harvesting"):
         """
         Mark multiple messages as processed (batch operation).
 
+        Uses one unordered bulk upsert, so already-processed ids are skipped
+        server-side instead of surfacing as duplicate key errors.
+
         Args:
             msg_ids: List of Discord message IDs
             spam: Whether these messages were classified as spam
@@ -126,20 +209,87 @@ class DatabaseManager:
         if not msg_ids:
             return
 
-        docs = [{
-            "msg_id": msg_id,
-            "processed_at": datetime.utcnow().isoformat(),
-            "spam": spam,
-            "source": source
-        } for msg_id in msg_ids]
+        processed_at = datetime.utcnow().isoformat()
+        ops = [UpdateOne(
+            {"msg_id": msg_id},
+            {"$setOnInsert": {
+                "msg_id": msg_id,
+                "processed_at": processed_at,
+                "spam": spam,
+                "source": source
+            }},
+            upsert=True
+        ) for msg_id in dict.fromkeys(msg_ids)]
 
         try:
-            # ordered=False allows continuing even if some are duplicates
-            self.processed_collection.insert_many(docs, ordered=False)
-        except Exception as e:
-            # Duplicate key errors are expected for already-processed messages
-            if "duplicate key" not in str(e).lower():
-                print(f"⚠️  Error marking messages as processed: {e}")
+            self.processed_collection.bulk_write(ops, ordered=False)
+        except BulkWriteError as e:
+            # Concurrent upserts of the same id can still race on the unique index
+            if any(err.get("code") != 11000 for err in e.details.get("writeErrors", [])):
+                log.warning("error marking messages as processed", extra={"error": str(e)})
+
+    def get_recent_processed_ids(self, since: datetime):
+        """
+        Stream ids of messages processed at or after `since`.
+
+        Every message with a timestamp >= since was necessarily processed
+        after since, so this covers all processed messages in that window.
+        """
+        cursor = self.processed_collection.find(
+            {"processed_at": {"$gte": since.replace(tzinfo=None).isoformat()}},
+            {"msg_id": 1, "_id": 0}
+        )
+        for doc in cursor:
+            yield doc["msg_id"]
+
+    def get_harvest_watermark(self, channel: str) -> Optional[int]:
+        """
+        Get the newest Discord message id (snowflake) harvested for a channel.
+
+        Returns:
+            The watermark snowflake, or None if the channel was never harvested
+        """
+        doc = self.harvest_state_collection.find_one({"_id": channel})
+        return doc.get("last_message_id") if doc else None
+
+    def set_harvest_watermark(self, channel: str, msg_id: int):
+        """Advance a channel's harvest watermark (never moves it backwards)."""
+        self.harvest_state_collection.update_one(
+            {"_id": channel},
+            {
+                "$max": {"last_message_id": int(msg_id)},
+                "$set": {"updated_at": datetime.utcnow().isoformat()}
+            },
+            upsert=True
+        )
+
+    def record_harvested_page(self, messages: List[Dict], msg_ids: List[str], channel: str,
+                              watermark: Optional[int] = None, edited: Optional[List[Dict]] = None) -> int:
+        """
+        Persist one harvested page as a unit.
+
+        New messages are queued in unprocessed_messages before any id is marked
+        processed, and the channel watermark only advances after both, so a
+        failure in between leaves ids unmarked (re-harvested and deduplicated by
+        the unique msg_id index next run) rather than marked but never queued.
+
+        Args:
+            messages: New messages to queue for parsing
+            msg_ids: Every id on the page that should be marked processed
+            channel: Channel identifier
+            watermark: Newest message id on the page, if the watermark should advance
+            edited: Already processed messages edited since, to parse again
+
+        Returns:
+            Number of messages added to unprocessed_messages
+        """
+        added = self.add_unprocessed_messages(messages, channel=channel) if messages else 0
+        if edited:
+            self.requeue_edited_messages(edited, channel=channel)
+        self.mark_messages_processed(msg_ids, spam=False, source="harvesting")
+        if watermark is not None:
+            self.set_harvest_watermark(channel, watermark)
+        return added
 
     def safe_insert_one(self, doc: Dict, retries: int = 3) -> Optional[object]:
         """
@@ -154,14 +304,12 @@ class DatabaseManager:
         """
         for attempt in range(retries):
             try:
-                result = self.interview_collection.insert_one(doc)
-                print(f"✅ Inserted document for {doc.get('author')} - {doc.get('company')}")
-                return result
+                return self.interview_collection.insert_one(doc)
             except Exception as e:
-                print(f"⚠️  Insert failed (attempt {attempt+1}/{retries}): {e}")
+                log.warning("insert failed", extra={"attempt": attempt + 1, "retries": retries, "error": str(e)})
                 time.sleep(2)
 
-        print("❌ Failed to insert document after retries.")
+        log.error("failed to insert document after retries")
         return None
 
     def safe_insert_many(self, docs: List[Dict], retries: int = 3) -> Optional[object]:
@@ -181,15 +329,73 @@ class DatabaseManager:
         for attempt in range(retries):
             try:
                 result = self.interview_collection.insert_many(docs, ordered=False)
-                print(f"✅ Batch inserted {len(result.inserted_ids)} documents")
+                log.debug("batch inserted", extra={"docs": len(result.inserted_ids)})
                 return result
             except Exception as e:
-                print(f"⚠️  Batch insert failed (attempt {attempt+1}/{retries}): {e}")
+                log.warning("batch insert failed", extra={"attempt": attempt + 1, "retries": retries, "error": str(e)})
                 time.sleep(2)
 
-        print("❌ Failed to insert batch after retries.")
+        log.error("failed to insert batch after retries", extra={"docs": len(docs)})
         return None
 
+    def bulk_upsert_entries(self, docs: List[Dict], retries: int = 3) -> int:
+        """
+        Insert interview_processes documents unless their (author, company, stage) exists.
+
+        One unordered bulk write of $setOnInsert upserts, so re-running a batch
+        never creates duplicates.
+
+        Args:
+            docs: Documents to insert
+            retries: Number of retry attempts
+
+        Returns:
+            Number of documents actually inserted
+        """
+        if not docs:
+            return 0
+
+        ops = [UpdateOne(
+            {"author": doc["author"], "company": doc["company"], "stage": doc["stage"]},
+            {"$setOnInsert": doc},
+            upsert=True
+        ) for doc in docs]
+
+        for attempt in range(retries):
+            try:
+                result = self.interview_collection.bulk_write(ops, ordered=False)
+                log.debug("bulk upsert", extra={"ops": len(ops), "upserted": result.upserted_count})
+                return result.upserted_count
+            except Exception as e:
+                log.warning("bulk upsert failed", extra={"attempt": attempt + 1, "retries": retries, "error": str(e)})
+                time.sleep(2)
+
+        log.error("failed to upsert batch after retries", extra={"ops": len(ops)})
+        return 0
+
+    def get_existing_entry_keys(self, authors: List[str]) -> set:
+        """
+        Load every (author, company, stage) already stored for the given authors.
+
+        Lets callers dedupe a whole batch in memory with a single query instead
+        of one check_duplicate_entry() call per row.
+
+        Args:
+            authors: Discord usernames
+
+        Returns:
+            Set of (author, company, stage) tuples
+        """
+        authors = list(dict.fromkeys(a for a in authors if a))
+        if not authors:
+            return set()
+
+        cursor = self.interview_collection.find(
+            {"author": {"$in": authors}},
+            {"author": 1, "company": 1, "stage": 1, "_id": 0}
+        )
+        return {(doc.get("author"), doc.get("company"), doc.get("stage")) for doc in cursor}
+
     def check_duplicate_entry(self, author: str, company: str, stage: str) -> bool:
         """
         Check if a specific entry already exists in interview_processes.
@@ -234,17 +440,88 @@ class DatabaseManager:
             # ordered=False allows continuing even if some are duplicates
             result = self.unprocessed_collection.insert_many(messages, ordered=False)
             count = len(result.inserted_ids)
-            print(f"✅ Added {count} messages to unprocessed_messages")
+            log.debug("queued messages", extra={"channel": channel, "added": count})
             return count
-        except Exception as e:
-            # Handle duplicate key errors
-            if "duplicate key" in str(e).lower():
-                # Count successful inserts before error
-                print(f"⚠️  Some messages already in unprocessed_messages")
-                return 0
+        except BulkWriteError as e:
+            # Duplicate key errors are expected; everything else still got inserted
+            count = e.details.get("nInserted", 0)
+            if any(err.get("code") != 11000 for err in e.details.get("writeErrors", [])):
+                log.error("error adding to unprocessed_messages", extra={"channel": channel, "error": str(e)})
             else:
-                print(f"❌ Error adding to unprocessed_messages: {e}")
-                return 0
+                log.debug("some messages already queued", extra={"channel": channel, "added": count})
+            return count
+        except Exception as e:
+            log.error("error adding to unprocessed_messages", extra={"channel": channel, "error": str(e)})
+            return 0
+
+    def requeue_edited_messages(self, messages: List[Dict], channel: str) -> int:
+        """
+        Queue edited messages for parsing again, replacing any queued copy.
+
+        The queued documents carry edited=True so the parser replaces the
+        entries parsed from the earlier text. A copy currently leased by a
+        parser is left alone (its archive step would delete the edit); the
+        duplicate key error for it is swallowed and its processed_at is not
+        bumped, so the next harvest picks the edit up again. For every queued
+        edit processed_at is bumped to now, so it is not queued twice.
+
+        Args:
+            messages: Edited Discord message documents
+            channel: Channel identifier
+
+        Returns:
+            Number of messages queued
+        """
+        if not messages:
+            return 0
+
+        now = datetime.utcnow()
+        not_leased = {"$or": [{"lease_until": {"$exists": False}}, {"lease_until": {"$lt": now}}]}
+        msg_ids, ops = [], []
+        for msg in messages:
+            doc = {k: v for k, v in msg.items() if k != "_id"}
+            doc.update(channel=channel, harvested_at=now.isoformat(), edited=True)
+            msg_ids.append(msg["msg_id"])
+            ops.append(ReplaceOne({"msg_id": msg["msg_id"], **not_leased}, doc, upsert=True))
+
+        leased = set()
+        try:
+            self.unprocessed_collection.bulk_write(ops, ordered=False)
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            if any(err.get("code") != 11000 for err in errors):
+                raise
+            leased = {msg_ids[err["index"]] for err in errors}
+
+        queued = [mid for mid in msg_ids if mid not in leased]
+        if queued:
+            self.processed_collection.update_many(
+                {"msg_id": {"$in": queued}},
+                {"$set": {"processed_at": now.isoformat(), "source": "edit"}}
+            )
+        log.debug("requeued edited messages", extra={"channel": channel, "edited": len(queued),
+                                                      "leased": len(leased)})
+        return len(queued)
+
+    def delete_entries_for_messages(self, msg_ids: List[str]) -> int:
+        """
+        Delete the entries parsed from the given messages.
+
+        Removes them from interview_processes and their copies from
+        interview_processes_backfilled, which neither backfill mode deletes.
+        Synthetic stages the backfill derived from them stay until their
+        journey is recomputed (e.g. by a full build after dropping the
+        collection).
+
+        Returns:
+            Number of interview_processes entries deleted
+        """
+        if not msg_ids:
+            return 0
+        deleted = self.interview_collection.delete_many({"msg_id": {"$in": msg_ids}}).deleted_count
+        if deleted:
+            self.backfilled_collection.delete_many({"msg_id": {"$in": msg_ids}})
+        return deleted
 
     def get_unprocessed_messages(self, channel: Optional[str] = None, limit: Optional[int] = None) -> List[Dict]:
         """
@@ -267,6 +544,74 @@ class DatabaseManager:
 
         return list(cursor)
 
+    def claim_unprocessed_messages(self, worker_id: str, channel: Optional[str] = None,
+                                   batch_size: int = 500, lease: timedelta = CLAIM_LEASE) -> List[Dict]:
+        """
+        Atomically lease up to batch_size unclaimed (or expired) messages.
+
+        Candidates are picked with one query and leased with one update_many
+        that re-checks the lease per document, so concurrent workers never get
+        the same message; the won documents are then read back.
+
+        Args:
+            worker_id: Identifier of the claiming worker
+            channel: Optional channel filter
+            batch_size: Maximum number of messages to claim
+            lease: How long the claim is valid
+
+        Returns:
+            Claimed message documents (empty when the queue is drained)
+        """
+        now = datetime.utcnow()
+        available = {"$or": [{"lease_until": {"$exists": False}}, {"lease_until": {"$lt": now}}]}
+        if channel:
+            available["channel"] = channel
+
+        candidate_ids = [doc["_id"] for doc in
+                         self.unprocessed_collection.find(available, {"_id": 1}).limit(batch_size)]
+        if not candidate_ids:
+            return []
+
+        lease_until = now + lease
+        self.unprocessed_collection.update_many(
+            {**available, "_id": {"$in": candidate_ids}},
+            {"$set": {"claimed_by": worker_id, "lease_until": lease_until}}
+        )
+        return list(self.unprocessed_collection.find({
+            "_id": {"$in": candidate_ids},
+            "claimed_by": worker_id,
+            "lease_until": lease_until
+        }))
+
+    def iter_unprocessed_messages(self, worker_id: str, channel: Optional[str] = None,
+                                  batch_size: int = 500, lease: timedelta = CLAIM_LEASE):
+        """
+        Stream the queue as successive claimed batches.
+
+        Leased messages are skipped, so the stream ends once every message is
+        claimed; memory stays bounded by batch_size.
+        """
+        while True:
+            batch = self.claim_unprocessed_messages(worker_id, channel, batch_size, lease)
+            if not batch:
+                return
+            yield batch
+
+    def release_claims(self, worker_id: str, channel: Optional[str] = None) -> int:
+        """
+        Release every message still claimed by worker_id so others can take it.
+
+        Returns:
+            Number of messages released
+        """
+        query = {"claimed_by": worker_id}
+        if channel:
+            query["channel"] = channel
+        result = self.unprocessed_collection.update_many(
+            query, {"$unset": {"claimed_by": "", "lease_until": ""}}
+        )
+        return result.modified_count
+
     def count_unprocessed_messages(self, channel: Optional[str] = None) -> int:
         """
         Count unprocessed messages.
@@ -292,77 +637,111 @@ class DatabaseManager:
             spam: Whether message was classified as spam
             classification: Optional classification data
         """
-        # Find message in unprocessed
-        msg = self.unprocessed_collection.find_one({"msg_id": msg_id})
-        if not msg:
-            print(f"⚠️  Message {msg_id} not found in unprocessed_messages")
-            return
-
-        # Prepare archive document
-        archive_doc = msg.copy()
-        archive_doc["archived_at"] = datetime.utcnow().isoformat()
-        archive_doc["spam"] = spam
-        if classification:
-            archive_doc["classification"] = classification
-
-        # Insert into archive
-        try:
-            self.archive_collection.insert_one(archive_doc)
-        except Exception as e:
-            print(f"⚠️  Error archiving message {msg_id}: {e}")
-            return
-
-        # Remove from unprocessed
-        self.unprocessed_collection.delete_one({"msg_id": msg_id})
+        classifications = {msg_id: classification} if classification else None
+        if not self.archive_messages_batch([msg_id], spam=spam, classifications=classifications):
+            log.warning("message not found in unprocessed_messages", extra={"msg_id": msg_id})
 
-    def archive_messages_batch(self, msg_ids: List[str], spam: bool = False):
+    def archive_messages_batch(self, msg_ids: List[str], spam: bool = False,
+                               classifications: Optional[Dict[str, object]] = None) -> int:
         """
         Archive multiple messages at once.
 
+        The copy happens server-side in one aggregation ($match + $merge into
+        archive, keyed on _id so a retried move is harmless), followed by one
+        delete_many. Classification payloads are attached in the same pass.
+        Falls back to read/insert/delete on servers without $merge.
+
         Args:
             msg_ids: List of Discord message IDs
             spam: Whether messages were classified as spam
+            classifications: Optional msg_id -> classification payload
+
+        Returns:
+            Number of messages moved
         """
         if not msg_ids:
-            return
-
-        # Find messages in unprocessed
-        messages = list(self.unprocessed_collection.find({"msg_id": {"$in": msg_ids}}))
+            return 0
 
-        if not messages:
-            return
+        archived_at = datetime.utcnow().isoformat()
+        copied = False
+        if self.merge_supported:
+            try:
+                self.unprocessed_collection.aggregate(
+                    self._archive_pipeline(msg_ids, spam, archived_at, classifications)
+                )
+                copied = True
+            except OperationFailure as e:
+                log.warning("$merge archive failed, falling back to client-side copy", extra={"error": str(e)})
+                if e.code == 40324:  # unrecognized pipeline stage: server predates $merge
+                    self.merge_supported = False
+        if not copied and not self._archive_copy(msg_ids, spam, archived_at, classifications):
+            return 0
 
-        # Prepare archive documents
+        # Remove from unprocessed
+        moved = self.unprocessed_collection.delete_many({"msg_id": {"$in": msg_ids}}).deleted_count
+        log.debug("archived messages", extra={"requested": len(msg_ids), "moved": moved})
+        return moved
+
+    def _archive_pipeline(self, msg_ids: List[str], spam: bool, archived_at: str,
+                          classifications: Optional[Dict[str, object]]) -> List[Dict]:
+        fields = {"archived_at": archived_at, "spam": spam}
+        if classifications:
+            keys = list(classifications)
+            # Look each document's payload up by position in a literal array;
+            # ids without a payload ($indexOfArray -1) get no classification field
+            fields["classification"] = {"$let": {
+                "vars": {"i": {"$indexOfArray": [{"$literal": keys}, "$msg_id"]}},
+                "in": {"$cond": [
+                    {"$gte": ["$$i", 0]},
+                    {"$arrayElemAt": [{"$literal": [classifications[k] for k in keys]}, "$$i"]},
+                    "$$REMOVE"
+                ]}
+            }}
+        return [
+            {"$match": {"msg_id": {"$in": msg_ids}}},
+            {"$set": fields},
+            {"$unset": ["claimed_by", "lease_until"]},
+            {"$merge": {"into": self.archive_collection.name, "on": "_id",
+                        "whenMatched": "replace", "whenNotMatched": "insert"}},
+        ]
+
+    def _archive_copy(self, msg_ids: List[str], spam: bool, archived_at: str,
+                      classifications: Optional[Dict[str, object]]) -> bool:
+        """Client-side archive copy for servers without $merge (MongoDB < 4.2)."""
         archive_docs = []
-        for msg in messages:
-            archive_doc = msg.copy()
-            archive_doc["archived_at"] = datetime.utcnow().isoformat()
-            archive_doc["spam"] = spam
-            archive_docs.append(archive_doc)
-
-        # Insert into archive
+        for msg in self.unprocessed_collection.find({"msg_id": {"$in": msg_ids}}):
+            msg.pop("claimed_by", None)
+            msg.pop("lease_until", None)
+            msg["archived_at"] = archived_at
+            msg["spam"] = spam
+            if classifications and msg["msg_id"] in classifications:
+                msg["classification"] = classifications[msg["msg_id"]]
+            archive_docs.append(msg)
+
+        if not archive_docs:
+            return False
         try:
-            self.archive_collection.insert_many(archive_docs, ordered=False)
-            print(f"✅ Archived {len(archive_docs)} messages")
+            self.archive_collection.bulk_write(
+                [ReplaceOne({"_id": doc["_id"]}, doc, upsert=True) for doc in archive_docs],
+                ordered=False
+            )
+            return True
         except Exception as e:
-            print(f"⚠️  Error archiving messages: {e}")
-            return
+            log.warning("error archiving messages", extra={"error": str(e)})
+            return False
 
-        # Remove from unprocessed
-        self.unprocessed_collection.delete_many({"msg_id": {"$in": msg_ids}})
-
-    def get_stats(self) -> Dict:
-        """Get statistics about processed messages and interview data."""
-        return {
-            "total_processed": self.processed_collection.count_documents({}),
-            "total_interviews": self.interview_collection.count_documents({}),
-            "spam_messages": self.processed_collection.count_documents({"spam": True}),
-            "non_spam_messages": self.processed_collection.count_documents({"spam": False}),
-            "unprocessed_messages": self.unprocessed_collection.count_documents({}),
-            "archived_messages": self.archive_collection.count_documents({}),
-            "archived_spam": self.archive_collection.count_documents({"spam": True}),
-            "archived_non_spam": self.archive_collection.count_documents({"spam": False})
-        }
+    def get_stats(self, max_age: float = STATS_TTL) -> Dict:
+        """
+        Get statistics about processed messages and interview data.
+
+        Results are cached for max_age seconds; pass 0 to force a refresh.
+        """
+        now = time.monotonic()
+        if self._stats_cache and now - self._stats_cache[0] < max_age:
+            return self._stats_cache[1]
+        stats = collect_pipeline_stats(self.db)
+        self._stats_cache = (now, stats)
+        return stats
 
     def close(self):
         """Close database connection."""
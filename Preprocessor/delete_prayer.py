@@ -1,33 +1,35 @@
-from pymongo import MongoClient
 from pprint import pprint
 
-# ---- Connect to MongoDB ----
-client = MongoClient(uri)
-db = client["JobStats"]
-collection = db["interview_processes_backfilled"]
+from main.Preprocessor.maintenance import Rule, run_cli
 
-# ---- Step 1: Find all messages containing "prayer" (case-insensitive) ----
-cursor = collection.find({"text": {"$regex": "prayer", "$options": "i"}})
 
-count = 0
-for doc in cursor:
+def review(doc):
+    """Ask before marking each message; the answer decides whether the rule applies."""
     print("\n----------------------------------------")
     pprint(doc)
     print("----------------------------------------")
 
     ans = input("Mark this message as spam=True? (y/n/q): ").strip().lower()
-    if ans == "y":
-        result = collection.update_one({"_id": doc["_id"]}, {"$set": {"spam": True}})
-        if result.modified_count > 0:
-            print("✅ Marked as spam")
-        else:
-            print("⚠️ No change (maybe already spam=True)")
-        count += 1
-    elif ans == "q":
+    if ans == "q":
         print("\n⏹️ Quitting review.")
-        break
-    else:
-        print("⏭️ Skipped.")
+        return None
+    if ans == "y":
+        return True
+    print("⏭️ Skipped.")
+    return False
+
 
-print(f"\nFinished. Total marked as spam=True: {count}")
+# Messages containing "prayer" (case-insensitive) are reviewed one by one;
+# approved ones are marked spam in bulk per chunk
+RULES = [
+    Rule(
+        "prayer_spam",
+        match={"text": {"$regex": "prayer", "$options": "i"}, "spam": {"$ne": True}},
+        update={"$set": {"spam": True}},
+        review=review,
+    )
+]
 
+if __name__ == "__main__":
+    results = run_cli(RULES, description="Review 'prayer' messages and mark them as spam.")
+    print(f"\nFinished. Total marked as spam=True: {results[RULES[0].name].get('modified', 0)}")
@@ -2,16 +2,38 @@
 Efficient Discord message harvesting - saves directly to MongoDB.
 
 Auto version:
-1. Harvests all configured channels
-2. Uses cutoff date = 2 days before today
+1. Harvests all configured channels concurrently (asyncio + httpx)
+2. Pages forward (after=) from a per-channel watermark stored in MongoDB,
+   re-reading a short backfill window behind it to pick up edits; the first
+   run of a channel starts at cutoff date = 2 days before today
 3. Saves to MongoDB automatically without CLI args
+
+Requests share one pooled HTTP client and go through a RateLimitScheduler that
+follows Discord's X-RateLimit-* / Retry-After headers instead of sleeping
+blindly. Set DISCORD_API_BASE to point the harvester at a local fake server.
+
+Processed-id bookkeeping is written once per page, and a Bloom filter of
+recently processed ids lets most dedup checks skip MongoDB.
+
+Progress is logged per channel as throughput (pages, messages/s, API calls)
+every few seconds rather than once per page.
 """
 
-import requests
+import asyncio
+import hashlib
+import logging
+import math
+import os
 import time
-import random
 from datetime import datetime, timezone, timedelta
+from typing import Dict, Optional
+
+import httpx
+
 from main.Preprocessor.db_utils import get_db_manager
+from main.Preprocessor.log_setup import ThroughputMeter, configure_logging
+
+log = logging.getLogger("jobstats.harvest")
 
 # Channel configurations
 CHANNELS = {
@@ -21,102 +43,307 @@ CHANNELS = {
     "intern_26": {"id": "1395661226507505745"},
 }
 
-BASE_URL_TEMPLATE = "https://discord.com/api/v9/channels/{channel_id}/messages"
+DISCORD_API_BASE = os.getenv("DISCORD_API_BASE", "https://discord.com/api/v9")
+BASE_URL_TEMPLATE = "{api_base}/channels/{channel_id}/messages"
 HEADERS = {
     "Cookie": "",
     "Authorization": ""
 }
 
+# Discord allows 50 requests/s globally per token; per-route limits come from headers
+GLOBAL_RATE_PER_SEC = 50
+MAX_RETRIES = 5
+PAGE_SIZE = 100  # Discord's maximum for the messages endpoint
+
+# Re-read this much history behind the watermark to pick up edits to
+# messages already harvested; bounded so runs stay O(new). Edits to older
+# messages are not seen.
+BACKFILL_WINDOW = timedelta(hours=6)
+DISCORD_EPOCH_MS = 1420070400000
+
+
+def snowflake_at(dt: datetime) -> int:
+    """Smallest Discord snowflake id that could be created at dt."""
+    return max(0, int(dt.timestamp() * 1000) - DISCORD_EPOCH_MS) << 22
+
+
+def snowflake_time(snowflake) -> datetime:
+    """Creation time encoded in a Discord snowflake id."""
+    return datetime.fromtimestamp(((int(snowflake) >> 22) + DISCORD_EPOCH_MS) / 1000, tz=timezone.utc)
+
+
+def harvest_start(watermark: Optional[int], cutoff_date: datetime,
+                  backfill_window: timedelta = BACKFILL_WINDOW) -> datetime:
+    """Where a channel's forward pass begins: behind its watermark, or at the cutoff."""
+    if watermark is None:
+        return cutoff_date
+    return snowflake_time(watermark) - backfill_window
+
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter over message ids.
+
+    Never yields false negatives: an id that is not "in" the filter was never
+    added. Positives may be false, so callers must confirm them elsewhere.
+    """
+
+    def __init__(self, capacity: int = 200_000, error_rate: float = 0.01):
+        self.size = max(8, int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, key: str):
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def update(self, keys):
+        for key in keys:
+            self.add(key)
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+
+class RecentIdFilter(BloomFilter):
+    """
+    Bloom filter seeded with every id processed since `since`.
+
+    For messages newer than `since` a miss is authoritative (not processed);
+    older messages and filter hits still have to be checked in MongoDB.
+    """
+
+    def __init__(self, since: datetime, **kwargs):
+        super().__init__(**kwargs)
+        self.since = since
+
+    def needs_lookup(self, msg: Dict) -> bool:
+        return msg["id"] in self or datetime.fromisoformat(msg["timestamp"]) < self.since
+
+
+def edited_since(msg: Dict, processed_at: str) -> bool:
+    """Whether msg was edited after it was processed (processed_at is naive UTC)."""
+    edited = msg.get("edited_timestamp")
+    if not edited or not processed_at:
+        return False
+    processed = datetime.fromisoformat(processed_at)
+    if processed.tzinfo is None:
+        processed = processed.replace(tzinfo=timezone.utc)
+    return datetime.fromisoformat(edited) > processed
+
+
+def load_recent_id_filter(db, since: datetime) -> RecentIdFilter:
+    seen = RecentIdFilter(since)
+    seen.update(db.get_recent_processed_ids(since))
+    return seen
+
+
+class RateLimitScheduler:
+    """
+    Rate-limit-aware request scheduler shared by all channel harvesters.
+
+    A token bucket enforces the global request rate. Per-route buckets are
+    tracked from X-RateLimit-Remaining / X-RateLimit-Reset-After, and 429
+    responses pause the route (or everything, for global limits) for exactly
+    Retry-After seconds.
+    """
+
+    def __init__(self, rate: float = GLOBAL_RATE_PER_SEC, burst: Optional[int] = None):
+        self.rate = rate
+        self.capacity = burst or max(1, int(rate))
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.global_reset_at = 0.0
+        self.routes = {}  # route -> (remaining, reset_at monotonic)
+        self._lock = asyncio.Lock()
 
-def harvest_channel(channel_key, target=10000, cutoff_date=None, batch_save_size=100):
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, route: str):
+        """Wait until a request on route is allowed, then consume a token."""
+        while True:
+            async with self._lock:
+                now = time.monotonic()
+                wait = max(self.global_reset_at - now, 0.0)
+                remaining, reset_at = self.routes.get(route, (None, 0.0))
+                if remaining == 0 and reset_at > now:
+                    wait = max(wait, reset_at - now)
+
+                if wait <= 0:
+                    self._refill(now)
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        if remaining:
+                            self.routes[route] = (remaining - 1, reset_at)
+                        return
+                    wait = (1 - self.tokens) / self.rate
+            await asyncio.sleep(wait)
+
+    def update(self, route: str, response: httpx.Response):
+        """Record rate-limit state from a response's headers."""
+        headers = response.headers
+        now = time.monotonic()
+
+        remaining = headers.get("X-RateLimit-Remaining")
+        reset_after = headers.get("X-RateLimit-Reset-After")
+        if remaining is not None and reset_after is not None:
+            self.routes[route] = (int(remaining), now + float(reset_after))
+
+        if response.status_code == 429:
+            retry_after = headers.get("Retry-After")
+            is_global = headers.get("X-RateLimit-Global") == "true"
+            try:
+                body = response.json()
+                retry_after = body.get("retry_after", retry_after)
+                is_global = is_global or bool(body.get("global"))
+            except ValueError:
+                pass
+            delay = float(retry_after or 1)
+            if is_global:
+                self.global_reset_at = now + delay
+            else:
+                self.routes[route] = (0, now + delay)
+
+
+async def fetch_page(client: httpx.AsyncClient, scheduler: RateLimitScheduler,
+                     route: str, url: str, params: Dict) -> Optional[list]:
+    """Fetch one page of messages, retrying on rate limits and transient errors."""
+    for attempt in range(MAX_RETRIES):
+        await scheduler.acquire(route)
+        try:
+            resp = await client.get(url, params=params)
+        except httpx.HTTPError as e:
+            log.warning("request failed", extra={"route": route, "attempt": attempt + 1, "error": str(e)})
+            await asyncio.sleep(2 ** attempt)
+            continue
+
+        scheduler.update(route, resp)
+        if resp.status_code == 429:
+            log.info("rate limited, retrying after Retry-After", extra={"route": route})
+            continue
+        if resp.status_code != 200:
+            log.error("unexpected response", extra={"route": route, "status": resp.status_code, "body": resp.text})
+            return None
+        return resp.json()
+
+    log.error("giving up", extra={"route": route, "attempts": MAX_RETRIES})
+    return None
+
+
+async def harvest_channel(client, scheduler, db, channel_key, target=10000,
+                          cutoff_date=None, start_at=None, seen_ids=None, api_base=DISCORD_API_BASE):
     if channel_key not in CHANNELS:
-        print(f"❌ Unknown channel: {channel_key}")
+        log.error("unknown channel", extra={"channel": channel_key})
         return
 
     channel_id = CHANNELS[channel_key]["id"]
-    base_url = BASE_URL_TEMPLATE.format(channel_id=channel_id)
-
-    db = get_db_manager()
-    if not db.test_connection():
-        print("❌ Cannot connect to DB")
-        return
+    base_url = BASE_URL_TEMPLATE.format(api_base=api_base, channel_id=channel_id)
 
     if cutoff_date is None:
         cutoff_date = datetime.now(timezone.utc) - timedelta(days=2)
+    if start_at is None:
+        watermark = await asyncio.to_thread(db.get_harvest_watermark, channel_key)
+        start_at = harvest_start(watermark, cutoff_date)
+    if seen_ids is None:
+        seen_ids = await asyncio.to_thread(load_recent_id_filter, db, start_at)
 
-    existing_unprocessed = db.count_unprocessed_messages(channel=channel_key)
-    print(f"\n{'='*60}\n🚀 Harvesting {channel_key} | Cutoff: {cutoff_date}\n{'='*60}")
+    log.info("harvest started", extra={"channel": channel_key, "start_at": start_at.isoformat()})
 
-    last_id = None
-    new_messages, total_new_count = [], 0
-    skipped_processed = skipped_before_cutoff = api_calls = 0
+    after = snowflake_at(start_at)
+    counts = dict.fromkeys(["new", "dupes", "edited", "api_calls", "mongo_checks", "pages", "messages"], 0)
+    meter = ThroughputMeter(log, "harvest", counts, rates=("messages", "new", "api_calls"), channel=channel_key)
 
-    while total_new_count < target:
-        params = {"limit": 50}
-        if last_id:
-            params["before"] = last_id
+    while counts["new"] < target:
+        params = {"limit": PAGE_SIZE, "after": str(after)}
 
-        time.sleep(random.randint(1, 3))
-        api_calls += 1
-        try:
-            resp = requests.get(base_url, headers=HEADERS, params=params)
-            if resp.status_code != 200:
-                print(f"❌ {resp.status_code}: {resp.text}")
-                break
-            batch = resp.json()
-            if not batch:
-                break
-        except Exception as e:
-            print(f"❌ Request failed: {e}")
+        counts["api_calls"] += 1
+        batch = await fetch_page(client, scheduler, channel_id, base_url, params)
+        if not batch:
             break
+        batch.sort(key=lambda m: int(m["id"]))
 
-        batch_ids = [m["id"] for m in batch]
-        processed_status = db.are_messages_processed(batch_ids)
-        new_in_batch, stop_harvest = 0, False
+        # Filter misses inside the seeded window are definitely new; only
+        # possible hits and older messages need a MongoDB lookup
+        to_check = [m["id"] for m in batch if seen_ids.needs_lookup(m)]
+        processed_times = {}
+        if to_check:
+            processed_times = await asyncio.to_thread(db.get_processed_times, to_check)
+            counts["mongo_checks"] += len(to_check)
+
+        page_messages, page_processed_ids, page_edited = [], [], []
 
         for msg in batch:
             msg_id = msg["id"]
-            if processed_status.get(msg_id):
-                skipped_processed += 1
-                if skipped_processed > 100:
-                    stop_harvest = True
-                    break
-                continue
-
-            timestamp = datetime.fromisoformat(msg["timestamp"])
-            if timestamp < cutoff_date:
-                skipped_before_cutoff += 1
-                db.mark_message_processed(msg_id, source="harvesting")
-                if skipped_before_cutoff > 50:
-                    stop_harvest = True
-                    break
+            msg["msg_id"] = msg_id
+            if msg_id in processed_times:
+                if edited_since(msg, processed_times[msg_id]):
+                    page_edited.append(msg)
+                    counts["edited"] += 1
+                else:
+                    counts["dupes"] += 1
                 continue
 
-            msg["msg_id"] = msg_id
-            new_messages.append(msg)
-            db.mark_message_processed(msg_id, spam=False, source="harvesting")
-            total_new_count += 1
-            new_in_batch += 1
+            page_messages.append(msg)
+            page_processed_ids.append(msg_id)
+            counts["new"] += 1
 
-            if len(new_messages) >= batch_save_size:
-                db.add_unprocessed_messages(new_messages, channel=channel_key)
-                new_messages = []
+        after = int(batch[-1]["id"])
+        await asyncio.to_thread(db.record_harvested_page, page_messages, page_processed_ids,
+                                channel_key, watermark=after, edited=page_edited)
+        seen_ids.update(page_processed_ids)
 
-        if stop_harvest:
+        meter.add(pages=1, messages=len(batch))
+        if len(batch) < PAGE_SIZE:
             break
-        last_id = batch[-1]["id"]
-        print(f"📊 {channel_key}: {total_new_count} new | {api_calls} calls | Skipped {skipped_processed}")
-        time.sleep(1.5)
 
-    if new_messages:
-        db.add_unprocessed_messages(new_messages, channel=channel_key)
+    meter.report(final=True)
+    return {"channel": channel_key, "new": counts["new"], "dupes": counts["dupes"],
+            "edited": counts["edited"], "api_calls": counts["api_calls"],
+            "mongo_checks": counts["mongo_checks"]}
+
+
+async def harvest_all(channels=None, cutoff_date=None, api_base=DISCORD_API_BASE):
+    """Harvest all channels concurrently over one pooled HTTP client."""
+    channels = [ch for ch in (channels or CHANNELS.keys()) if ch in CHANNELS]
+
+    db = get_db_manager()
+    if not db.test_connection():
+        log.error("cannot connect to DB")
+        return []
+
+    if cutoff_date is None:
+        cutoff_date = datetime.now(timezone.utc) - timedelta(days=2)
+    starts = {ch: harvest_start(db.get_harvest_watermark(ch), cutoff_date) for ch in channels}
+    seen_ids = await asyncio.to_thread(load_recent_id_filter, db, min(starts.values()))
+
+    scheduler = RateLimitScheduler()
+    limits = httpx.Limits(max_connections=len(channels), max_keepalive_connections=len(channels))
+    started = time.monotonic()
+
+    async with httpx.AsyncClient(headers=HEADERS, limits=limits, timeout=30.0) as client:
+        results = await asyncio.gather(*(
+            harvest_channel(client, scheduler, db, ch, cutoff_date=cutoff_date,
+                            start_at=starts[ch], seen_ids=seen_ids, api_base=api_base)
+            for ch in channels
+        ))
+
+    log.info("harvest finished", extra={"channels": len(channels),
+                                        "elapsed_s": round(time.monotonic() - started, 1)})
+    return [r for r in results if r]
 
-    print(f"\n✅ Done {channel_key}: {total_new_count} new, {skipped_processed} dupes, {api_calls} calls\n")
 
 def main():
+    configure_logging()
     cutoff = datetime.now(timezone.utc) - timedelta(days=2)
-    for ch in CHANNELS.keys():
-        harvest_channel(ch, cutoff_date=cutoff)
+    asyncio.run(harvest_all(cutoff_date=cutoff))
 
 if __name__ == "__main__":
     main()
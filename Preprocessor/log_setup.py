@@ -0,0 +1,219 @@
+"""
+Structured logging for the API servers and the pipeline scripts.
+
+configure_logging() sends every logger through a queue: the calling thread
+(a request handler, the event loop, a parser batch) only enqueues the record,
+and a QueueListener thread formats it and writes it to stdout. By default
+each record is one JSON object per line, with any `extra={...}` fields as
+top-level keys.
+
+Environment:
+- LOG_LEVEL: root level (default INFO; DEBUG also logs full MongoDB queries)
+- LOG_FORMAT: json (default) or text
+- LOG_SAMPLE_RATES: fraction of requests access-logged per route, e.g.
+  "/api/session/heartbeat=0.01,/api/viewers/count=0.05,*=1"
+  Errors (5xx) and requests slower than LOG_SLOW_SECONDS are always logged.
+
+Pipeline scripts report progress with ThroughputMeter (totals and rates every
+few seconds, then a summary) rather than a line per message or page.
+"""
+
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Iterable, Optional
+
+DEFAULT_SAMPLE_RATES = "/api/session/heartbeat=0.01,/api/viewers/count=0.01,/metrics=0.01,*=1"
+DEFAULT_SLOW_SECONDS = 1.0
+
+# Attributes every LogRecord has; anything else came from extra={...}
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "taskName"}
+
+
+class StructuredFormatter(logging.Formatter):
+    """One JSON object per record, or a text line with extras appended as key=value."""
+
+    def __init__(self, json_output: bool = True):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+        self.json_output = json_output
+
+    def format(self, record: logging.LogRecord) -> str:
+        extras = {k: v for k, v in record.__dict__.items() if k not in _RESERVED}
+        exc = record.exc_text or (self.formatException(record.exc_info) if record.exc_info else None)
+        if not self.json_output:
+            line = super().format(record)
+            if extras:
+                line += " " + " ".join(f"{k}={v}" for k, v in extras.items())
+            return line
+
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        payload.update(extras)
+        if exc:
+            payload["exc"] = exc
+        return json.dumps(payload, default=str)
+
+
+class _DeferredQueueHandler(QueueHandler):
+    """Enqueue a copy with the message rendered; extras are serialized on the listener thread."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+_state = {"pid": None, "listener": None, "options": None}
+
+
+def configure_logging(level: Optional[str] = None, fmt: Optional[str] = None):
+    """Route the root logger through a background writer; once per process (again after fork)."""
+    if _state["pid"] == os.getpid():
+        return
+    level = (level or os.environ.get("LOG_LEVEL", "INFO")).upper()
+    fmt = (fmt or os.environ.get("LOG_FORMAT", "json")).lower()
+
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(StructuredFormatter(json_output=fmt != "text"))
+    records = queue.SimpleQueue()
+    listener = QueueListener(records, stream)
+    listener.start()
+
+    root = logging.getLogger()
+    for handler in [h for h in root.handlers if isinstance(h, _DeferredQueueHandler)]:
+        root.removeHandler(handler)
+    root.addHandler(_DeferredQueueHandler(records))
+    root.setLevel(level)
+
+    if _state["options"] is None:
+        atexit.register(_stop_listener)
+    _state.update(pid=os.getpid(), listener=listener, options=(level, fmt))
+
+
+def _stop_listener():
+    """Flush queued records at exit."""
+    if _state["pid"] == os.getpid() and _state["listener"] is not None:
+        _state["listener"].stop()
+        _state["listener"] = None
+
+
+def _restart_after_fork():
+    # The listener thread doesn't survive fork; give the child its own
+    if _state["options"] is not None:
+        _state["pid"] = _state["listener"] = None
+        configure_logging(*_state["options"])
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_after_fork)
+
+
+# ---- Access log ----
+def parse_sample_rates(spec: str) -> Dict[str, float]:
+    """'route=rate,...' -> {route: rate}; '*' is the default for unlisted routes."""
+    rates = {}
+    for part in spec.split(","):
+        route, sep, rate = part.strip().rpartition("=")
+        if sep and route:
+            try:
+                rates[route] = min(max(float(rate), 0.0), 1.0)
+            except ValueError:
+                continue
+    return rates
+
+
+class AccessLogger:
+    """Per-request JSON access log, sampled per route; 5xx and slow requests always pass."""
+
+    def __init__(self, name: str = "jobstats.access", rates: Optional[Dict[str, float]] = None,
+                 slow_seconds: Optional[float] = None):
+        self.log = logging.getLogger(name)
+        if rates is None:
+            rates = parse_sample_rates(os.environ.get("LOG_SAMPLE_RATES", DEFAULT_SAMPLE_RATES))
+        self.rates = rates
+        self.default_rate = rates.get("*", 1.0)
+        if slow_seconds is None:
+            slow_seconds = float(os.environ.get("LOG_SLOW_SECONDS", DEFAULT_SLOW_SECONDS))
+        self.slow_seconds = slow_seconds
+
+    def record(self, timer, path: str, status: int, elapsed: float, response_bytes: Optional[int]):
+        """timer is the request's metrics.RequestTimer (route, method, db time)."""
+        rate = self.rates.get(timer.route, self.default_rate)
+        if status < 500 and elapsed < self.slow_seconds and random.random() >= rate:
+            return
+        if not self.log.isEnabledFor(logging.INFO):
+            return
+        self.log.info("request", extra={
+            "route": timer.route,
+            "path": path,
+            "method": timer.method,
+            "status": status,
+            "duration_ms": round(elapsed * 1000, 2),
+            "db_ms": round(timer.db[0] * 1000, 2),
+            "db_commands": timer.db[1],
+            "bytes": response_bytes,
+            "sample_rate": rate,
+        })
+
+
+# ---- Pipeline throughput ----
+class ThroughputMeter:
+    """
+    Running counters for a pipeline stage, logged with per-second rates.
+
+    Callers bump counts (add(), or mutate .counts directly and call tick());
+    a progress line is logged at most every `every` seconds, and report(final=True)
+    logs the totals with rates over the whole run.
+    """
+
+    def __init__(self, logger: logging.Logger, stage: str, counts: Optional[Dict[str, int]] = None,
+                 rates: Iterable[str] = (), every: float = 10.0, **labels):
+        self.log = logger
+        self.stage = stage
+        self.counts = counts if counts is not None else {}
+        self.rate_keys = tuple(rates)
+        self.every = every
+        self.labels = labels
+        self.started = self.last_report = time.monotonic()
+        self.last_counts = dict(self.counts)
+        self._lock = threading.Lock()
+
+    def add(self, **counts):
+        with self._lock:
+            for key, n in counts.items():
+                self.counts[key] = self.counts.get(key, 0) + n
+        self.tick()
+
+    def tick(self):
+        if time.monotonic() - self.last_report >= self.every:
+            self.report()
+
+    def report(self, final: bool = False, **extra):
+        now = time.monotonic()
+        with self._lock:
+            counts = dict(self.counts)
+            since, base = (self.started, {}) if final else (self.last_report, self.last_counts)
+            self.last_report, self.last_counts = now, counts
+        seconds = max(now - since, 1e-9)
+        fields = dict(self.labels, stage=self.stage, elapsed_s=round(now - self.started, 1), **counts)
+        for key in self.rate_keys:
+            fields[f"{key}_per_s"] = round((counts.get(key, 0) - base.get(key, 0)) / seconds, 2)
+        fields.update(extra)
+        self.log.info(f"{self.stage} {'done' if final else 'progress'}", extra=fields)
@@ -0,0 +1,187 @@
+"""
+Declarative, batched data maintenance for the JobStats collections.
+
+Each fix is a Rule: a match filter, an update document, an optional backup
+collection and an optional per-document review hook. run_rule():
+1. Walks the matching documents in _id order, one chunk at a time
+2. Copies each chunk to the backup collection (idempotent upserts)
+3. Applies the update to the whole chunk with one update_many
+4. Saves a checkpoint after every chunk, so an interrupted run resumes
+   where it stopped; a completed run clears it, so rules stay re-runnable
+
+dry_run() only counts (one aggregation) and shows a few sample documents.
+After a rule changes the backfilled collection the meta summary is rebuilt,
+which bumps the dataset version that the API server watches to drop its
+response cache.
+"""
+
+import argparse
+from datetime import datetime
+from pprint import pprint
+from typing import Callable, Dict, List, Optional
+
+from pymongo import ASCENDING, ReplaceOne
+
+from main.Preprocessor.meta_summary import SOURCE_COLLECTION, rebuild_meta_summary
+from main.Preprocessor.mongo_pool import get_db
+
+CHECKPOINT_COLLECTION = "maintenance_checkpoints"
+CHUNK_SIZE = 1000
+SAMPLE_SIZE = 3
+
+
+class Rule:
+    """
+    One declarative data fix.
+
+    Args:
+        name: Unique name, also the checkpoint key
+        match: Filter selecting the documents to fix
+        update: Update document applied to every matched document
+        backup: Optional collection that receives a copy of each document first
+        collection: Target collection
+        review: Optional hook called per document; return True to apply,
+            False to skip, None to stop the run
+    """
+
+    def __init__(self, name: str, match: Dict, update: Dict, backup: Optional[str] = None,
+                 collection: str = SOURCE_COLLECTION, review: Optional[Callable[[Dict], Optional[bool]]] = None):
+        self.name = name
+        self.match = match
+        self.update = update
+        self.backup = backup
+        self.collection = collection
+        self.review = review
+
+    def __repr__(self):
+        return f"Rule({self.name!r}, {self.match!r} -> {self.update!r})"
+
+
+# ---------- Checkpoints ----------
+def load_checkpoint(db, rule: Rule) -> Optional[Dict]:
+    return db[CHECKPOINT_COLLECTION].find_one({"_id": rule.name})
+
+
+def save_checkpoint(db, rule: Rule, last_id, counts: Dict[str, int]):
+    db[CHECKPOINT_COLLECTION].update_one(
+        {"_id": rule.name},
+        {"$set": {"last_id": last_id, "updated_at": datetime.utcnow()}, "$inc": counts},
+        upsert=True
+    )
+
+
+def reset_checkpoint(db, rule: Rule):
+    db[CHECKPOINT_COLLECTION].delete_one({"_id": rule.name})
+
+
+# ---------- Dry run ----------
+def dry_run(db, rule: Rule) -> Dict:
+    """Count (and sample) what a rule would touch without writing anything."""
+    result = next(db[rule.collection].aggregate([
+        {"$match": rule.match},
+        {"$facet": {
+            "count": [{"$count": "n"}],
+            "sample": [{"$limit": SAMPLE_SIZE}],
+        }},
+    ]), {})
+    count = result.get("count") or [{"n": 0}]
+    return {"rule": rule.name, "matched": count[0]["n"], "sample": result.get("sample", [])}
+
+
+# ---------- Execution ----------
+def iter_chunks(coll, match: Dict, after=None, chunk_size: int = CHUNK_SIZE, projection=None):
+    """Yield lists of matching documents in _id order, resuming after `after`."""
+    while True:
+        query = {"$and": [match, {"_id": {"$gt": after}}]} if after is not None else match
+        chunk = list(coll.find(query, projection).sort("_id", ASCENDING).limit(chunk_size))
+        if not chunk:
+            return
+        yield chunk
+        after = chunk[-1]["_id"]
+
+
+def run_rule(db, rule: Rule, chunk_size: int = CHUNK_SIZE, restart: bool = False) -> Dict[str, int]:
+    """Apply a rule chunk by chunk, resuming an interrupted run unless restart is set."""
+    if restart:
+        reset_checkpoint(db, rule)
+    checkpoint = load_checkpoint(db, rule) or {}
+
+    coll = db[rule.collection]
+    needs_docs = rule.backup or rule.review
+    projection = None if needs_docs else {"_id": 1}
+    totals = {"matched": 0, "backed_up": 0, "modified": 0}
+    last_id = checkpoint.get("last_id")
+    if last_id is not None:
+        print(f"⏩ {rule.name}: resuming after {last_id}")
+
+    stopped = False
+    for chunk in iter_chunks(coll, rule.match, last_id, chunk_size, projection):
+        if rule.review:
+            approved = []
+            for doc in chunk:
+                decision = rule.review(doc)
+                if decision is None:
+                    stopped = True
+                    break
+                last_id = doc["_id"]
+                if decision:
+                    approved.append(doc)
+            chunk_docs = approved
+        else:
+            chunk_docs = chunk
+            last_id = chunk[-1]["_id"]
+
+        counts = {"matched": len(chunk_docs), "backed_up": 0, "modified": 0}
+        if chunk_docs and rule.backup:
+            db[rule.backup].bulk_write(
+                [ReplaceOne({"_id": doc["_id"]}, doc, upsert=True) for doc in chunk_docs],
+                ordered=False
+            )
+            counts["backed_up"] = len(chunk_docs)
+        if chunk_docs:
+            ids = [doc["_id"] for doc in chunk_docs]
+            counts["modified"] = coll.update_many({"_id": {"$in": ids}}, rule.update).modified_count
+
+        save_checkpoint(db, rule, last_id, counts)
+        for key, value in counts.items():
+            totals[key] += value
+        print(f"📦 {rule.name}: {totals['matched']} matched | {totals['modified']} modified")
+        if stopped:
+            break
+
+    if not stopped:
+        reset_checkpoint(db, rule)
+    print(f"✅ {rule.name}: {totals['modified']} modified, {totals['backed_up']} backed up"
+          + (" (stopped early, will resume)" if stopped else ""))
+    return totals
+
+
+def run_rules(rules: List[Rule], dry: bool = False, chunk_size: int = CHUNK_SIZE,
+              restart: bool = False) -> Dict[str, Dict]:
+    """Run (or dry-run) rules in order, then refresh derived data for changed collections."""
+    db = get_db("batch")
+    results = {}
+    for rule in rules:
+        if dry:
+            report = dry_run(db, rule)
+            print(f"🔍 {rule.name}: {report['matched']} documents would change ({rule.update})")
+            for doc in report["sample"]:
+                pprint(doc)
+            results[rule.name] = report
+        else:
+            results[rule.name] = run_rule(db, rule, chunk_size, restart)
+
+    if not dry and any(results[r.name]["modified"] and r.collection == SOURCE_COLLECTION for r in rules):
+        counts = rebuild_meta_summary(db)
+        print(f"📊 Meta summary rebuilt, API caches will refresh: {counts}")
+    return results
+
+
+def run_cli(rules: List[Rule], description: str = None, argv: Optional[List[str]] = None):
+    """Shared command line for maintenance scripts: --dry-run, --restart, --chunk-size."""
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--dry-run", action="store_true", help="only count matching documents")
+    parser.add_argument("--restart", action="store_true", help="discard checkpoints of interrupted runs")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args(argv)
+    return run_rules(rules, dry=args.dry_run, chunk_size=args.chunk_size, restart=args.restart)
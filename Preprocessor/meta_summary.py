@@ -0,0 +1,242 @@
+"""
+Incrementally maintained summary behind /api/meta.
+
+Instead of scanning every submission on each request, the summary is kept up to
+date on every write:
+- meta_summary holds one document per job type ("all", "new_grad", "intern")
+  with the submission count, min/max timestamp and a HyperLogLog sketch of
+  distinct authors
+- meta_companies holds one (job_type, company) -> count row per company, so
+  company names containing dots never have to be used as field paths
+
+record_submission() is called for single writes (the /api/submit route);
+rebuild_meta_summary() recomputes everything after bulk rewrites such as the
+backfill job, swapping the company rows in with a collection rename, and bumps the dataset version so API servers drop cached
+responses built from the old data.
+"""
+
+import hashlib
+import math
+from datetime import datetime
+from typing import Dict, Optional
+
+from pymongo import ASCENDING, ReturnDocument, UpdateOne
+
+META_COLLECTION = "meta_summary"
+VERSION_COLLECTION = "dataset_version"
+COMPANIES_COLLECTION = "meta_companies"
+COMPANIES_STAGING_COLLECTION = "meta_companies_rebuild"
+SOURCE_COLLECTION = "interview_processes_backfilled"
+
+JOB_TYPES = ("all", "new_grad", "intern")
+STAGE_ORDER = ["OA", "Phone/R1", "Onsite", "HM", "Offer", "Reject"]
+
+# 2^11 registers -> ~2.3% standard error, ~1% while linear counting applies
+HLL_PRECISION = 11
+HLL_REGISTERS = 1 << HLL_PRECISION
+
+
+# ---- Helpers ----
+def job_type_keys(new_grad) -> list:
+    """Summary documents a submission contributes to."""
+    return ["all", "new_grad" if new_grad is True else "intern"]
+
+
+def normalize_timestamp(ts) -> Optional[str]:
+    """Format a stored timestamp (ISO string or datetime) as %Y-%m-%dT%H:%M:%S."""
+    if not ts:
+        return None
+    if isinstance(ts, datetime):
+        return ts.strftime("%Y-%m-%dT%H:%M:%S")
+    try:
+        return datetime.fromisoformat(str(ts).replace("Z", "+00:00")).strftime("%Y-%m-%dT%H:%M:%S")
+    except ValueError:
+        return None
+
+
+def author_register(author: str):
+    """Map an author to its (register index, rank) in the HyperLogLog sketch."""
+    h = int.from_bytes(hashlib.sha1(author.encode("utf-8")).digest()[:8], "big")
+    idx = h >> (64 - HLL_PRECISION)
+    rest = h & ((1 << (64 - HLL_PRECISION)) - 1)
+    rank = (64 - HLL_PRECISION) - rest.bit_length() + 1
+    return idx, rank
+
+
+def estimate_distinct(registers: Dict[str, int]) -> int:
+    """Estimate the number of distinct authors from a stored sketch."""
+    m = HLL_REGISTERS
+    values = [int(registers.get(str(i), 0)) for i in range(m)]
+    zeros = values.count(0)
+    if zeros == m:
+        return 0
+    alpha = 0.7213 / (1 + 1.079 / m)
+    raw = alpha * m * m / sum(2.0 ** -v for v in values)
+    if raw <= 2.5 * m and zeros:
+        # Linear counting is far more accurate for small cardinalities
+        return round(m * math.log(m / zeros))
+    return round(raw)
+
+
+def ensure_meta_indexes(db, collection: str = COMPANIES_COLLECTION):
+    db[collection].create_index(
+        [("job_type", ASCENDING), ("company", ASCENDING)], unique=True
+    )
+
+
+# ---- Dataset version ----
+def get_dataset_version(db, source: str = SOURCE_COLLECTION) -> int:
+    doc = db[VERSION_COLLECTION].find_one({"_id": source})
+    return doc.get("version", 0) if doc else 0
+
+
+def bump_dataset_version(db, source: str = SOURCE_COLLECTION) -> int:
+    """Mark source as rewritten; returns the new version."""
+    doc = db[VERSION_COLLECTION].find_one_and_update(
+        {"_id": source},
+        {"$inc": {"version": 1}, "$set": {"updated_at": datetime.utcnow()}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return doc["version"]
+
+
+# ---- Incremental updates ----
+def record_submission(db, doc: Dict):
+    """Fold one newly inserted submission into the summary documents."""
+    if doc.get("spam") or doc.get("stage") == "App":
+        return
+
+    ts = normalize_timestamp(doc.get("timestamp"))
+    company = (doc.get("company") or "").strip()
+    author = (doc.get("author") or "").strip()
+
+    summary_ops, company_ops = [], []
+    for key in job_type_keys(doc.get("new_grad")):
+        update = {"$inc": {"count": 1}}
+        if ts:
+            update["$min"] = {"min_timestamp": ts}
+            update["$max"] = {"max_timestamp": ts}
+        if author:
+            idx, rank = author_register(author)
+            update.setdefault("$max", {})[f"author_hll.{idx}"] = rank
+        summary_ops.append(UpdateOne({"_id": key}, update, upsert=True))
+
+        if company:
+            company_ops.append(UpdateOne(
+                {"job_type": key, "company": company},
+                {"$inc": {"count": 1}},
+                upsert=True
+            ))
+
+    db[META_COLLECTION].bulk_write(summary_ops, ordered=False)
+    if company_ops:
+        db[COMPANIES_COLLECTION].bulk_write(company_ops, ordered=False)
+
+
+def rebuild_meta_summary(db, source: str = SOURCE_COLLECTION) -> Dict[str, int]:
+    """
+    Recompute all summary documents from the source collection.
+
+    Used after bulk rewrites (backfill, canonicalization) where replaying
+    individual writes is not practical. Returns submission counts per job type.
+    """
+    ensure_meta_indexes(db)
+    coll = db[source]
+    match = {"spam": False, "stage": {"$ne": "App"}}
+    job_type_expr = {"$cond": [{"$eq": ["$new_grad", True]}, "new_grad", "intern"]}
+
+    company_rows = coll.aggregate([
+        {"$match": match},
+        {"$group": {
+            "_id": {"company": "$company", "job_type": job_type_expr},
+            "count": {"$sum": 1},
+            "min_ts": {"$min": "$timestamp"},
+            "max_ts": {"$max": "$timestamp"},
+        }},
+    ], allowDiskUse=True)
+
+    summaries = {key: {"_id": key, "count": 0, "min_timestamp": None,
+                       "max_timestamp": None, "author_hll": {}} for key in JOB_TYPES}
+    company_counts = {key: {} for key in JOB_TYPES}
+
+    for row in company_rows:
+        job_type = row["_id"]["job_type"]
+        company = (row["_id"].get("company") or "").strip()
+        min_ts = normalize_timestamp(row.get("min_ts"))
+        max_ts = normalize_timestamp(row.get("max_ts"))
+        for key in ("all", job_type):
+            summary = summaries[key]
+            summary["count"] += row["count"]
+            if min_ts and (summary["min_timestamp"] is None or min_ts < summary["min_timestamp"]):
+                summary["min_timestamp"] = min_ts
+            if max_ts and (summary["max_timestamp"] is None or max_ts > summary["max_timestamp"]):
+                summary["max_timestamp"] = max_ts
+            if company:
+                company_counts[key][company] = company_counts[key].get(company, 0) + row["count"]
+
+    author_rows = coll.aggregate([
+        {"$match": match},
+        {"$group": {"_id": {"author": "$author", "job_type": job_type_expr}}},
+    ], allowDiskUse=True)
+
+    for row in author_rows:
+        author = (row["_id"].get("author") or "").strip()
+        if not author:
+            continue
+        idx, rank = author_register(author)
+        for key in ("all", row["_id"]["job_type"]):
+            registers = summaries[key]["author_hll"]
+            if rank > registers.get(str(idx), 0):
+                registers[str(idx)] = rank
+
+    # Company rows are built in a staging collection and renamed over the live
+    # one, so readers never see a partial list
+    staging = db[COMPANIES_STAGING_COLLECTION]
+    staging.drop()
+    ensure_meta_indexes(db, COMPANIES_STAGING_COLLECTION)
+    rows = [{"job_type": key, "company": name, "count": count}
+            for key in JOB_TYPES for name, count in company_counts[key].items()]
+    if rows:
+        staging.insert_many(rows, ordered=False)
+        staging.rename(COMPANIES_COLLECTION, dropTarget=True)
+    else:
+        db[COMPANIES_COLLECTION].delete_many({})
+
+    meta_coll = db[META_COLLECTION]
+    for key in JOB_TYPES:
+        meta_coll.replace_one({"_id": key}, summaries[key], upsert=True)
+
+    bump_dataset_version(db, source)
+    return {key: summaries[key]["count"] for key in JOB_TYPES}
+
+
+# ---- Reads ----
+def load_meta(db, job_type: str = "all") -> Optional[Dict]:
+    """
+    Build the /api/meta payload from the summary documents.
+
+    Returns None when no summary has been built yet.
+    """
+    summary = db[META_COLLECTION].find_one({"_id": job_type})
+    if summary is None:
+        return None
+
+    company_counts = {}
+    for row in db[COMPANIES_COLLECTION].find(
+        {"job_type": job_type, "count": {"$gt": 0}},
+        {"company": 1, "count": 1, "_id": 0}
+    ).sort("company", ASCENDING):
+        company_counts[row["company"]] = company_counts.get(row["company"], 0) + row["count"]
+
+    count = summary.get("count", 0)
+    return {
+        'companies': sorted(company_counts),
+        'company_counts': company_counts,
+        'stages': STAGE_ORDER,
+        'min_timestamp': summary.get("min_timestamp"),
+        'max_timestamp': summary.get("max_timestamp"),
+        'count': count,
+        'author_count': estimate_distinct(summary.get("author_hll") or {}),
+        'submission_count': count
+    }
@@ -0,0 +1,299 @@
+"""
+In-process request, MongoDB and cache metrics for the API servers.
+
+Exported as Prometheus text (the /metrics route of server.py and
+server_async.py):
+- http_request_duration_seconds {route, method, status}: handler latency
+- http_request_db_seconds {route}: time spent in MongoDB commands per request
+- http_response_bytes {route}: response body size
+- mongodb_command_duration_seconds {command, collection}
+- mongodb_documents_returned_total {command, collection}: documents in
+  cursor batches of find / aggregate / getMore, and the result of count;
+  writes are not counted
+- mongodb_command_failures_total {command, collection}
+- cache_requests_total {cache, result}: hit / miss
+- cache_entries {cache}
+
+MongoDB timings come from a PyMongo CommandListener, registered globally by
+install_command_listener() so every client created afterwards reports.
+Commands are attributed to the request whose context issued them (a
+contextvar, so it works for threads and asyncio tasks alike).
+
+Documents scanned are not reported: command replies don't carry them, and
+a listener can't run explain per command. Use the server's profiler
+(system.profile docsExamined, e.g. setProfilingLevel 1 with slowms) to
+find the filters that scan.
+
+Each process keeps its own registry: with several gunicorn workers each
+/metrics scrape reports the worker that served it.
+
+When the opentelemetry-api package is installed, every request and every
+MongoDB command is also recorded as a span (request spans are parents).
+Exporting is configured by the deployment (SDK / opentelemetry-instrument,
+e.g. OTLP to the Datadog agent); without it tracing is a no-op.
+"""
+
+import contextvars
+import threading
+import time
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from pymongo import monitoring
+
+try:
+    from opentelemetry import context as otel_context
+    from opentelemetry import trace
+    _tracer = trace.get_tracer("jobstats.api")
+except ImportError:
+    otel_context = trace = _tracer = None
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+_lock = threading.Lock()
+REGISTRY = []
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], le: Optional[str] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if le is not None:
+        pairs.append(f'le="{le}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.values = {}
+        REGISTRY.append(self)
+
+    def _key(self, labels: Dict) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labels)
+
+    def samples(self):
+        for key, value in sorted(self.values.items()):
+            yield f"{self.name}{_format_labels(self.labels, key)} {value}"
+
+    def render(self) -> str:
+        with _lock:
+            lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+            lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """Gauge read at scrape time from collect() -> {label values tuple: value}."""
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, labels: Iterable[str] = (),
+                 collect: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None):
+        super().__init__(name, help_text, labels)
+        self.collect = collect
+
+    def samples(self):
+        if self.collect:
+            self.values = dict(self.collect())
+        return super().samples()
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: Iterable[str] = (), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with _lock:
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def samples(self):
+        for key, (counts, total, count) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                yield f"{self.name}_bucket{_format_labels(self.labels, key, str(bound))} {cumulative}"
+            yield f"{self.name}_bucket{_format_labels(self.labels, key, '+Inf')} {count}"
+            yield f"{self.name}_sum{_format_labels(self.labels, key)} {total}"
+            yield f"{self.name}_count{_format_labels(self.labels, key)} {count}"
+
+
+def render_prometheus() -> str:
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# ---- Metrics ----
+REQUEST_SECONDS = Histogram("http_request_duration_seconds", "API request latency",
+                            ("route", "method", "status"))
+REQUEST_DB_SECONDS = Histogram("http_request_db_seconds", "Time spent in MongoDB commands per request",
+                               ("route",))
+RESPONSE_BYTES = Histogram("http_response_bytes", "API response body size", ("route",), SIZE_BUCKETS)
+MONGO_SECONDS = Histogram("mongodb_command_duration_seconds", "MongoDB command duration",
+                          ("command", "collection"))
+MONGO_DOCUMENTS = Counter("mongodb_documents_returned_total", "Documents returned by MongoDB commands",
+                          ("command", "collection"))
+MONGO_FAILURES = Counter("mongodb_command_failures_total", "Failed MongoDB commands",
+                         ("command", "collection"))
+CACHE_REQUESTS = Counter("cache_requests_total", "Response cache lookups", ("cache", "result"))
+
+_caches = {}
+CACHE_ENTRIES = Gauge("cache_entries", "Entries held per cache", ("cache",),
+                      collect=lambda: {(name,): len(cache) for name, cache in _caches.items()})
+
+
+def register_cache(name: str, cache):
+    """Report len(cache) as cache_entries{cache=name}."""
+    _caches[name] = cache
+
+
+def record_cache_lookup(name: str, hit: bool):
+    CACHE_REQUESTS.inc(cache=name, result="hit" if hit else "miss")
+
+
+# ---- Requests ----
+# [db seconds, db commands] for the request being handled in this context
+_request_db = contextvars.ContextVar("request_db", default=None)
+
+
+class RequestTimer:
+    """Started when a request begins (before_request), finished once its response is known."""
+
+    def __init__(self, route: str, method: str):
+        self.route = route
+        self.method = method
+        self.started = time.perf_counter()
+        self.db = [0.0, 0]
+        self._db_token = _request_db.set(self.db)
+        self.span = self._otel_token = None
+        if _tracer is not None:
+            self.span = _tracer.start_span(f"{method} {route}", kind=trace.SpanKind.SERVER,
+                                           attributes={"http.method": method, "http.route": route})
+            self._otel_token = otel_context.attach(trace.set_span_in_context(self.span))
+
+    def finish(self, status: int, response_bytes: Optional[int]) -> float:
+        """Record the request; returns its duration in seconds."""
+        elapsed = time.perf_counter() - self.started
+        REQUEST_SECONDS.observe(elapsed, route=self.route, method=self.method, status=status)
+        REQUEST_DB_SECONDS.observe(self.db[0], route=self.route)
+        if response_bytes is not None:
+            RESPONSE_BYTES.observe(response_bytes, route=self.route)
+        if self.span is not None:
+            self.span.set_attribute("http.status_code", status)
+            self.span.set_attribute("db.time_seconds", self.db[0])
+            self.span.set_attribute("db.commands", self.db[1])
+            self.span.end()
+        self.close()
+        return elapsed
+
+    def close(self):
+        """Detach from the current context; safe to call more than once."""
+        if self._db_token is not None:
+            try:
+                _request_db.reset(self._db_token)
+            except ValueError:  # finished from another context
+                _request_db.set(None)
+            self._db_token = None
+        if self._otel_token is not None:
+            otel_context.detach(self._otel_token)
+            self._otel_token = None
+
+
+# ---- MongoDB ----
+def _command_collection(event: monitoring.CommandStartedEvent) -> str:
+    target = event.command.get(event.command_name)
+    if event.command_name == "getMore":
+        target = event.command.get("collection")
+    return target if isinstance(target, str) else ""
+
+
+# Read commands whose replies carry the documents (or count) they return
+READ_COMMANDS = {"find", "aggregate", "getMore", "count"}
+
+
+def _documents_returned(command: str, reply: Dict) -> int:
+    if command not in READ_COMMANDS:
+        return 0
+    cursor = reply.get("cursor")
+    if isinstance(cursor, dict):
+        return len(cursor.get("firstBatch") or cursor.get("nextBatch") or [])
+    n = reply.get("n")
+    return n if command == "count" and isinstance(n, int) else 0
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Times every MongoDB command and charges it to the current request."""
+
+    def __init__(self):
+        self._pending = {}
+
+    def started(self, event):
+        span = None
+        if _tracer is not None:
+            span = _tracer.start_span(f"mongodb.{event.command_name}", kind=trace.SpanKind.CLIENT,
+                                      attributes={"db.system": "mongodb", "db.name": event.database_name,
+                                                  "db.operation": event.command_name})
+        self._pending[(event.request_id, event.connection_id)] = (_command_collection(event), span)
+
+    def _finish(self, event, failed: bool):
+        collection, span = self._pending.pop((event.request_id, event.connection_id), ("", None))
+        seconds = event.duration_micros / 1e6
+        MONGO_SECONDS.observe(seconds, command=event.command_name, collection=collection)
+        if failed:
+            MONGO_FAILURES.inc(command=event.command_name, collection=collection)
+        elif event.command_name in READ_COMMANDS:
+            MONGO_DOCUMENTS.inc(_documents_returned(event.command_name, event.reply),
+                                command=event.command_name, collection=collection)
+
+        acc = _request_db.get()
+        if acc is not None:
+            acc[0] += seconds
+            acc[1] += 1
+        if span is not None:
+            span.set_attribute("db.mongodb.collection", collection)
+            if failed:
+                span.set_status(trace.Status(trace.StatusCode.ERROR))
+            span.end()
+
+    def succeeded(self, event):
+        self._finish(event, failed=False)
+
+    def failed(self, event):
+        self._finish(event, failed=True)
+
+
+_listener_state = {"installed": False}
+
+
+def install_command_listener():
+    """Register the MongoDB listener once; affects clients created afterwards."""
+    if not _listener_state["installed"]:
+        monitoring.register(MongoCommandMetrics())
+        _listener_state["installed"] = True
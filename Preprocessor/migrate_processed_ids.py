@@ -8,12 +8,13 @@ This script:
 4. Creates an index on msg_id for fast lookups
 """
 
-from pymongo import MongoClient, ASCENDING
-from pymongo.server_api import ServerApi
+from pymongo import ASCENDING
 import time
 
+from main.Preprocessor.mongo_pool import get_client
+
 # MongoDB connection
-client = MongoClient(uri, server_api=ServerApi('1'))
+client = get_client("batch")
 
 # Test connection
 try:
@@ -0,0 +1,184 @@
+"""
+Shared MongoDB client factory for the API server and the Preprocessor jobs.
+
+Clients are created lazily, one per (process, role), so nothing opened before
+a fork (gunicorn --preload, multiprocessing) is ever reused in a child. Each
+role carries its own pool size, read preference and per-operation timeout
+(timeoutMS, applied to every operation issued through the client).
+
+Roles:
+- api: request handlers that read their own writes (primary)
+- analytics: heavy dashboard aggregations (secondaryPreferred)
+- worker: harvester / parser processes
+- batch: backfill and maintenance scripts (no operation timeout)
+
+Wire compression uses zstd and/or snappy when their Python packages are
+installed, and always falls back to zlib.
+
+The ASGI server (server_async.py) gets the same roles from get_async_client(),
+backed by PyMongo's native asyncio driver (AsyncMongoClient, PyMongo 4.9+).
+"""
+
+import os
+from typing import Dict, Tuple
+
+from pymongo import MongoClient
+from pymongo.server_api import ServerApi
+
+try:
+    from pymongo import AsyncMongoClient
+except ImportError:  # PyMongo < 4.9
+    AsyncMongoClient = None
+
+MONGO_URI = os.getenv("MONGO_URI", "")
+DB_NAME = "JobStats"
+
+ROLE_OPTIONS: Dict[str, Dict] = {
+    "api": {
+        "maxPoolSize": int(os.getenv("MONGO_API_POOL_SIZE", 20)),
+        "minPoolSize": 0,
+        "timeoutMS": 5000,
+    },
+    "analytics": {
+        "maxPoolSize": int(os.getenv("MONGO_ANALYTICS_POOL_SIZE", 10)),
+        "minPoolSize": 0,
+        "readPreference": "secondaryPreferred",
+        "timeoutMS": 15000,
+    },
+    "worker": {
+        "maxPoolSize": int(os.getenv("MONGO_WORKER_POOL_SIZE", 10)),
+        "timeoutMS": 60000,
+    },
+    "batch": {
+        "maxPoolSize": int(os.getenv("MONGO_BATCH_POOL_SIZE", 4)),
+    },
+}
+
+_clients: Dict[Tuple[int, str], MongoClient] = {}
+_async_clients: Dict[Tuple[int, str], "AsyncMongoClient"] = {}
+
+
+def available_compressors() -> str:
+    """Compressors to offer the server, best first, limited to installed codecs."""
+    compressors = []
+    try:
+        import zstandard  # noqa: F401
+        compressors.append("zstd")
+    except ImportError:
+        pass
+    try:
+        import snappy  # noqa: F401
+        compressors.append("snappy")
+    except ImportError:
+        pass
+    compressors.append("zlib")
+    return ",".join(compressors)
+
+
+def client_options(role: str) -> Dict:
+    return dict(
+        server_api=ServerApi("1"),
+        serverSelectionTimeoutMS=5000,
+        compressors=available_compressors(),
+        appname=f"csoffers-{role}",
+        **ROLE_OPTIONS[role]
+    )
+
+
+def get_client(role: str = "api") -> MongoClient:
+    """Return this process's client for role, creating it on first use."""
+    key = (os.getpid(), role)
+    client = _clients.get(key)
+    if client is None:
+        client = MongoClient(MONGO_URI, **client_options(role))
+        _clients[key] = client
+    return client
+
+
+def get_db(role: str = "api", name: str = DB_NAME):
+    return get_client(role)[name]
+
+
+def get_async_client(role: str = "api") -> "AsyncMongoClient":
+    """
+    Return this process's asyncio client for role, creating it on first use.
+
+    An AsyncMongoClient is bound to the event loop it first runs on, so use it
+    from a single loop per process (one ASGI worker = one loop).
+    """
+    if AsyncMongoClient is None:
+        raise RuntimeError("The async API server requires pymongo>=4.9 (AsyncMongoClient)")
+    key = (os.getpid(), role)
+    client = _async_clients.get(key)
+    if client is None:
+        client = AsyncMongoClient(MONGO_URI, **client_options(role))
+        _async_clients[key] = client
+    return client
+
+
+def get_async_db(role: str = "api", name: str = DB_NAME):
+    return get_async_client(role)[name]
+
+
+def close_clients():
+    """Close every client this process opened."""
+    pid = os.getpid()
+    for key in [k for k in _clients if k[0] == pid]:
+        _clients.pop(key).close()
+
+
+async def close_async_clients():
+    """Close every asyncio client this process opened."""
+    pid = os.getpid()
+    for key in [k for k in _async_clients if k[0] == pid]:
+        await _async_clients.pop(key).close()
+
+
+def _forget_inherited_clients():
+    # A forked child must not touch the parent's sockets; drop (don't close) them
+    _clients.clear()
+    _async_clients.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_inherited_clients)
+
+
+class LazyDatabase:
+    """
+    Module-level stand-in for a Database that resolves per process on use.
+
+    Lets server.py keep `db` / `collection` globals without opening a client
+    at import time (before gunicorn forks its workers). With asynchronous=True
+    it resolves to the AsyncMongoClient database instead (server_async.py).
+    """
+
+    def __init__(self, role: str = "api", name: str = DB_NAME, asynchronous: bool = False):
+        self._role = role
+        self._name = name
+        self._asynchronous = asynchronous
+
+    def resolve(self):
+        if self._asynchronous:
+            return get_async_db(self._role, self._name)
+        return get_db(self._role, self._name)
+
+    def __getitem__(self, name: str) -> "LazyCollection":
+        return LazyCollection(self, name)
+
+    def __getattr__(self, attr):
+        return getattr(self.resolve(), attr)
+
+
+class LazyCollection:
+    """Collection proxy bound to a LazyDatabase."""
+
+    def __init__(self, database: LazyDatabase, name: str):
+        self._database = database
+        self._name = name
+
+    def resolve(self):
+        return self._database.resolve()[self._name]
+
+    def __getattr__(self, attr):
+        return getattr(self.resolve(), attr)
@@ -7,50 +7,72 @@ This script:
 3. Inserts valid updates into interview_processes
 4. Archives all processed messages
 5. Runs automatically for all channels
-"""
 
-import time
-from typing import List
-from openai import OpenAI
-from pydantic import BaseModel
-from main.Preprocessor.db_utils import get_db_manager
+Obvious messages (!stats, chatter, plain "!process <company> <stage>" with a
+known company) are resolved by a local rule-based pre-classifier; only the
+ambiguous rest is sent to the model. Model results are cached by normalized
+message text (see ClassificationCache), so repeated texts cost one call.
 
-# ✅ OpenAI API config
-# ✅ Channel keys to auto-parse
-CHANNELS = ["grad_25", "grad_26", "intern_25", "intern_26"]
+Classification is pipelined: a bounded pool of async workers keeps several
+structured-output requests in flight under a tokens-per-minute limiter, and a
+separate writer stage does the DB bookkeeping. Set OPENAI_BASE_URL to run
+against a local mock of the chat completions endpoint.
 
+Messages are claimed from the queue in leased batches (claimed_by /
+lease_until), so several parser processes can share one backlog.
 
-# ---------- Models ----------
-class InterviewProcess(BaseModel):
-    msg_id: str
-    company: str
-    stage: str
-    spam: bool
+Requests are packed up to a token budget rather than a fixed message count.
+A batch whose parse fails is split in halves and retried; a single message
+that still fails is left in unprocessed_messages for the next run.
 
+Progress is logged per channel as throughput (messages/s, LLM calls/s, bulk
+write sizes) every few seconds rather than once per batch.
+"""
 
-class InterviewProcessList(BaseModel):
-    classifications: List[InterviewProcess]
-
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import socket
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional
+from openai import AsyncOpenAI
+from pydantic import BaseModel
+from pymongo import ASCENDING, UpdateOne
+try:
+    import tiktoken
+except ImportError:  # optional: fall back to a character-count estimate
+    tiktoken = None
+from main.Preprocessor.canonical import ALIAS_INDEX, canonicalize, normalize
+from main.Preprocessor.db_utils import get_db_manager
+from main.Preprocessor.log_setup import ThroughputMeter, configure_logging
 
+log = logging.getLogger("jobstats.parse")
 
-def classify_batch(client: OpenAI, text_block: str) -> List[InterviewProcess]:
-    """
-    Classify a batch of messages using OpenAI structured outputs.
+# ✅ OpenAI API config
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL")
+MODEL = "gpt-4o-2024-08-06"
+CLASSIFY_CONCURRENCY = 8        # classification requests in flight
+TOKENS_PER_MINUTE = 200_000     # account TPM budget shared by all workers
+OUTPUT_TOKENS_PER_MESSAGE = 25  # rough size of one classification in the response
+BATCH_TOKEN_BUDGET = 3000       # message + expected output tokens packed into one request
+MAX_BATCH_MESSAGES = 60         # cap on lines per request, however short they are
+
+# Each run leases messages from unprocessed_messages in claims of this size
+CLAIM_SIZE = 500
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+# Classification cache (MongoDB collection shared by all parser runs)
+CACHE_COLLECTION = "classification_cache"
+CACHE_MAX_ENTRIES = 50_000
 
-    Args:
-        client: OpenAI client
-        text_block: Multiple lines in format "msg_id:: message_text"
+# ✅ Channel keys to auto-parse
+CHANNELS = ["grad_25", "grad_26", "intern_25", "intern_26"]
 
-    Returns:
-        List of InterviewProcess objects
-    """
-    try:
-        response = client.beta.chat.completions.parse(
-            model="gpt-4o-2024-08-06",
-            messages=[
-                {
-                    "role": "system",
-                    "content": """
+SYSTEM_PROMPT = """
                         You are an interview data extractor.
                         Each line has the format: msg_id:: text
                         Each text may contain multiple interview updates or none.
@@ -87,147 +109,627 @@ def classify_batch(client: OpenAI, text_block: str) -> List[InterviewProcess]:
                         ✅ Rule: Always write the official company name in Title Case exactly as it appears on the company’s Careers or LinkedIn page — no abbreviations, no locations, no extra words.
                        Example: Use “JPMorgan Chase”, “HubSpot”, “Procter & Gamble”,
                         """
-                },
+
+
+# ---------- Models ----------
+class InterviewProcess(BaseModel):
+    msg_id: str
+    company: str
+    stage: str
+    spam: bool
+
+
+class InterviewProcessList(BaseModel):
+    classifications: List[InterviewProcess]
+
+
+# ---------- Rule-based pre-classifier ----------
+# Company abbreviations from SYSTEM_PROMPT
+ABBREVIATIONS = {
+    "db": "Databricks", "ca": "Capital One", "imc": "IMC",
+    "hrt": "HRT", "gs": "Goldman Sachs", "ms": "Microsoft",
+}
+_ABBREVIATION_TARGETS = {normalize(name): canonicalize(name) for name in ABBREVIATIONS.values()}
+
+# Stage spellings -> stage (includes the STAGE_MAP synonyms from stages_merged)
+STAGE_SYNONYMS = {
+    "app": "App", "applied": "App", "application": "App",
+    "oa": "OA", "online assessment": "OA",
+    "phone": "Phone/R1", "phone screen": "Phone/R1", "phone/r1": "Phone/R1", "r1": "Phone/R1",
+    "tech": "Phone/R1",
+    "onsite": "Onsite", "vo": "Onsite", "virtual onsite": "Onsite", "r2": "Onsite",
+    "hm": "HM", "hiring manager": "HM", "behavioral": "HM",
+    "offer": "Offer",
+    "reject": "Reject", "rejected": "Reject", "rejection": "Reject",
+}
+
+# Words that may trail a "!process <company> <stage>" update without changing it
+TRAILING_FILLERS = ("done", "complete", "completed", "received", "recieved", "today", "yesterday")
+
+_STAGE_ALT = "|".join(re.escape(s) for s in sorted(STAGE_SYNONYMS, key=len, reverse=True))
+_FILLER_ALT = "|".join(TRAILING_FILLERS)
+PROCESS_RE = re.compile(
+    rf"^!process\s+(?P<company>.+?)\s+(?P<stage>{_STAGE_ALT})(?:\s+(?:{_FILLER_ALT}))*[\s.!]*$",
+    re.IGNORECASE
+)
+
+
+def resolve_company(phrase: str) -> Optional[str]:
+    """
+    Resolve a company phrase to its canonical name, or None if not confident.
+
+    Only names known to the abbreviation table or the CANON map resolve; an
+    abbreviation that CANON maps elsewhere (e.g. "ms") is left to the model.
+    """
+    key = normalize(re.sub(r"\s+", " ", phrase))
+    known = ALIAS_INDEX.get(key) or _ABBREVIATION_TARGETS.get(key)
+    if key in ABBREVIATIONS:
+        expanded = canonicalize(ABBREVIATIONS[key])
+        if known and known != expanded:
+            return None
+        return expanded
+    return known
+
+
+def pre_classify(msg_id: str, text: str) -> Optional[List[InterviewProcess]]:
+    """
+    Classify a message locally when the rules in SYSTEM_PROMPT make it unambiguous.
+
+    Returns:
+        Classifications for the message, or None if it should go to the model
+    """
+    stripped = (text or "").strip()
+    lowered = stripped.lower()
+    spam = [InterviewProcess(msg_id=msg_id, company="", stage="", spam=True)]
+
+    if not stripped or lowered.startswith("!stats"):
+        return spam
+    if not lowered.startswith("!process"):
+        # Outside the !process format is spam, unless it might be a mistyped command
+        return None if "process" in lowered else spam
+    if "?" in lowered:
+        return spam
+    if "prayer" in lowered:
+        # Prayers are only updates when answered - needs the model's judgement
+        return None
+
+    match = PROCESS_RE.match(stripped)
+    if not match:
+        return None
+    company = resolve_company(match.group("company"))
+    if not company:
+        return None
+    stage = STAGE_SYNONYMS[normalize(match.group("stage"))]
+    return [InterviewProcess(msg_id=msg_id, company=company, stage=stage, spam=False)]
+
+
+# ---------- Classification cache ----------
+# Any change to the model or prompt invalidates every cached answer
+CACHE_VERSION = hashlib.sha1(f"{MODEL}\n{SYSTEM_PROMPT}".encode("utf-8")).hexdigest()[:12]
+
+
+def normalize_message_text(text: str) -> str:
+    """Lowercase and collapse whitespace so trivially different texts share a cache entry."""
+    return re.sub(r"\s+", " ", (text or "").strip().lower())
+
+
+class ClassificationCache:
+    """
+    Persistent cache of model classifications keyed by normalized message text.
+
+    Keys include CACHE_VERSION, so cached answers never outlive the prompt or
+    model that produced them. Entries record last_used and the collection is
+    trimmed back to max_entries least-recently-used first.
+    """
+
+    def __init__(self, collection, version: str = CACHE_VERSION, max_entries: int = CACHE_MAX_ENTRIES):
+        self.collection = collection
+        self.version = version
+        self.max_entries = max_entries
+        try:
+            self.collection.create_index([("last_used", ASCENDING)])
+        except Exception:
+            # Index might already exist
+            pass
+
+    def key(self, text: str) -> str:
+        return hashlib.sha1(f"{self.version}\n{normalize_message_text(text)}".encode("utf-8")).hexdigest()
+
+    def lookup(self, id_map: Dict[str, Dict]) -> Dict[str, List[InterviewProcess]]:
+        """Return cached classifications for every message in id_map that has one."""
+        if not id_map:
+            return {}
+        keys = {mid: self.key(meta["text"]) for mid, meta in id_map.items()}
+        found = {
+            doc["_id"]: doc["results"]
+            for doc in self.collection.find({"_id": {"$in": list(set(keys.values()))}})
+        }
+        if not found:
+            return {}
+
+        self.collection.update_many(
+            {"_id": {"$in": list(found)}},
+            {"$set": {"last_used": datetime.utcnow()}, "$inc": {"hits": 1}}
+        )
+        return {
+            mid: [InterviewProcess(msg_id=mid, **r) for r in found[key]]
+            for mid, key in keys.items() if key in found
+        }
+
+    def store(self, id_map: Dict[str, Dict], classifications: List[InterviewProcess]):
+        """Cache the model's answers for the messages in one classified batch."""
+        results = {}
+        for c in classifications:
+            if c.msg_id in id_map:
+                results.setdefault(c.msg_id, []).append(
+                    {"company": c.company, "stage": c.stage, "spam": c.spam}
+                )
+        if not results:
+            return
+
+        now = datetime.utcnow()
+        ops = [UpdateOne(
+            {"_id": self.key(id_map[mid]["text"])},
+            {
+                "$set": {"results": rs, "version": self.version, "last_used": now},
+                "$setOnInsert": {"created_at": now, "hits": 0}
+            },
+            upsert=True
+        ) for mid, rs in results.items()]
+        self.collection.bulk_write(ops, ordered=False)
+
+    def evict(self) -> int:
+        """Trim the cache to max_entries, dropping the least recently used entries."""
+        excess = self.collection.estimated_document_count() - self.max_entries
+        if excess <= 0:
+            return 0
+        stale = [doc["_id"] for doc in
+                 self.collection.find({}, {"_id": 1}).sort("last_used", ASCENDING).limit(excess)]
+        return self.collection.delete_many({"_id": {"$in": stale}}).deleted_count
+
+
+# ---------- Rate limiting ----------
+def _load_encoding():
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(MODEL)
+    except Exception:
+        return None
+
+
+_ENCODING = _load_encoding()
+
+
+def estimate_tokens(text: str) -> int:
+    """Token count from the local tokenizer, or ~4 characters per token without tiktoken."""
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text, disallowed_special=())) + 1
+    return len(text) // 4 + 1
+
+
+def format_line(mid: str, meta: Dict) -> str:
+    return f"{mid}:: {meta['text']}"
+
+
+def pack_batches(id_map: Dict[str, Dict], token_budget: int = BATCH_TOKEN_BUDGET,
+                 max_messages: int = MAX_BATCH_MESSAGES) -> List[Dict[str, Dict]]:
+    """
+    Greedily pack messages (in order) into batches of at most token_budget tokens.
+
+    Each message costs its line plus OUTPUT_TOKENS_PER_MESSAGE for the answer;
+    a message larger than the budget on its own gets a batch to itself.
+    """
+    batches, current, used = [], {}, 0
+    for mid, meta in id_map.items():
+        cost = estimate_tokens(format_line(mid, meta)) + OUTPUT_TOKENS_PER_MESSAGE
+        if current and (used + cost > token_budget or len(current) >= max_messages):
+            batches.append(current)
+            current, used = {}, 0
+        current[mid] = meta
+        used += cost
+    if current:
+        batches.append(current)
+    return batches
+
+
+PROMPT_TOKENS = estimate_tokens(SYSTEM_PROMPT)
+
+
+class TokenRateLimiter:
+    """
+    Async token bucket for an OpenAI tokens-per-minute budget.
+
+    Workers reserve their estimated request size before calling the API and
+    settle the difference once the response reports actual usage.
+    """
+
+    def __init__(self, tokens_per_minute: int = TOKENS_PER_MINUTE):
+        self.capacity = tokens_per_minute
+        self.rate = tokens_per_minute / 60.0
+        self.tokens = float(tokens_per_minute)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: int):
+        amount = min(amount, self.capacity)
+        while True:
+            async with self._lock:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.rate
+            await asyncio.sleep(wait)
+
+    def settle(self, estimated: int, actual: Optional[int]):
+        """Return (or charge) the difference between the estimate and real usage."""
+        if actual is not None:
+            self.tokens = min(self.capacity, self.tokens + estimated - actual)
+
+
+async def classify_batch(client: AsyncOpenAI, text_block: str,
+                         limiter: Optional[TokenRateLimiter] = None) -> List[InterviewProcess]:
+    """
+    Classify a batch of messages using OpenAI structured outputs.
+
+    Args:
+        client: Async OpenAI client
+        text_block: Multiple lines in format "msg_id:: message_text"
+        limiter: Optional shared tokens-per-minute limiter
+
+    Returns:
+        List of InterviewProcess objects
+    """
+    n_lines = text_block.count("\n") + 1
+    estimated = PROMPT_TOKENS + estimate_tokens(text_block) + OUTPUT_TOKENS_PER_MESSAGE * n_lines
+    if limiter:
+        await limiter.acquire(estimated)
+
+    try:
+        response = await client.beta.chat.completions.parse(
+            model=MODEL,
+            messages=[
+                {"role": "system", "content": SYSTEM_PROMPT},
                 {"role": "user", "content": text_block.strip()},
             ],
             response_format=InterviewProcessList,
         )
+        if limiter and response.usage:
+            limiter.settle(estimated, response.usage.total_tokens)
         return response.choices[0].message.parsed.classifications if response.choices[0].message.parsed else []
     except Exception as e:
-        print(f"❌ OpenAI API error: {e}")
+        log.warning("OpenAI API error", extra={"error": str(e)})
         return []
 
 
-# ---------- Parser ----------
-def parse_unprocessed_messages(
-    channel: str = None,
-    batch_size: int = 30,
-    insert_batch_size: int = 5
-):
-    is_new_grad = channel and "grad" in channel.lower()
-    client = OpenAI(api_key=OPENAI_API_KEY)
-    db = get_db_manager()
-    if not db.test_connection():
-        print("❌ DB connection failed.")
-        return
-
-    print(f"\n📂 Fetching unprocessed messages for {channel} ...")
-    unprocessed = db.get_unprocessed_messages(channel=channel)
-
-    if not unprocessed:
-        print(f"✅ No unprocessed messages found for {channel}")
-        return
+# ---------- Writer stage ----------
+def new_stats() -> Dict[str, int]:
+    return dict.fromkeys([
+        "processed", "valid", "spam", "duplicates", "inserted", "replaced", "archived", "skipped_leetbot",
+        "resolved_locally", "cache_hits", "cache_misses", "split_retries", "failed",
+        "llm_calls", "bulk_writes", "bulk_docs"
+    ], 0)
 
-    print(f"🚀 Parsing {len(unprocessed)} messages from {channel}...\n")
 
-    processed_count = spam_count = valid_count = archived_count = 0
-    duplicate_entries = skipped_leetbot = inserted_count = 0
-    pending_docs, processed_msg_ids = [], []
+def write_classified_batch(db, id_map: Dict[str, Dict], classifications: List[InterviewProcess],
+                           is_new_grad: bool, stats: Dict[str, int]):
+    """
+    Record processed ids, insert valid updates and archive one classified batch.
+
+    Existing (author, company, stage) keys for the batch's authors are loaded
+    with one query, so duplicates (including repeats within the batch) are
+    dropped in memory. Entries parsed earlier from messages that were since
+    edited are deleted first, so the new text replaces them. Only messages
+    with a classification are touched; anything else in id_map stays
+    unprocessed.
+    """
+    classifications = [c for c in classifications if c.msg_id in id_map]
+    edited = list({c.msg_id for c in classifications if id_map[c.msg_id].get("edited")})
+    if edited:
+        stats["replaced"] += db.delete_entries_for_messages(edited)
+    existing = db.get_existing_entry_keys(
+        [id_map[c.msg_id]["author"] for c in classifications if not c.spam]
+    )
+
+    # msg_id -> spam; a message counts as spam only if every update in it is
+    spam_by_msg, pending_docs = {}, []
+    for c in classifications:
+        meta = id_map[c.msg_id]
+        stats["processed"] += 1
+        spam_by_msg[c.msg_id] = spam_by_msg.get(c.msg_id, True) and c.spam
+
+        if c.spam:
+            stats["spam"] += 1
+            continue
 
-    for i in range(0, len(unprocessed), batch_size):
-        batch = unprocessed[i:i + batch_size]
-        id_map = {}
+        stats["valid"] += 1
+        company = canonicalize(c.company)
+        key = (meta["author"], company, c.stage)
+        if key in existing:
+            stats["duplicates"] += 1
+            continue
+        existing.add(key)
+
+        pending_docs.append({
+            "msg_id": c.msg_id,
+            "text": meta["text"],
+            "timestamp": meta["timestamp"],
+            "author": meta["author"],
+            "company": company,
+            "stage": c.stage,
+            "spam": False,
+            "new_grad": is_new_grad,
+            "category": meta["channel"]
+        })
 
-        # Filter messages
-        for msg in batch:
-            author = msg.get("author", {})
-            username = author.get("username") if isinstance(author, dict) else str(author)
-            if username == "leetbot":
-                skipped_leetbot += 1
-                processed_msg_ids.append(msg["msg_id"])
-                continue
+    if pending_docs:
+        stats["inserted"] += db.bulk_upsert_entries(pending_docs)
+        stats["bulk_writes"] += 1
+        stats["bulk_docs"] += len(pending_docs)
 
-            id_map[msg["msg_id"]] = {
-                "author": username,
-                "text": msg.get("content", ""),
-                "timestamp": msg.get("timestamp", ""),
-                "channel": msg.get("channel", channel)
-            }
+    payloads = {}
+    for c in classifications:
+        payloads.setdefault(c.msg_id, []).append(c.model_dump())
 
-        if not id_map:
-            if processed_msg_ids:
-                db.archive_messages_batch(processed_msg_ids, spam=True)
-                archived_count += len(processed_msg_ids)
-                processed_msg_ids = []
+    for spam in (True, False):
+        msg_ids = [mid for mid, is_spam in spam_by_msg.items() if is_spam is spam]
+        if not msg_ids:
             continue
+        db.mark_messages_processed(msg_ids, spam=spam, source="parsing")
+        db.archive_messages_batch(msg_ids, spam=spam,
+                                  classifications={mid: payloads[mid] for mid in msg_ids})
+        stats["archived"] += len(msg_ids)
 
-        text_block = "\n".join(f"{mid}:: {meta['text']}" for mid, meta in id_map.items())
-        print(f"🤖 Classifying batch {i//batch_size + 1} ({len(id_map)} msgs)...")
 
-        classifications = classify_batch(client, text_block)
-        if not classifications:
-            batch_msg_ids = list(id_map.keys())
-            db.mark_messages_processed(batch_msg_ids, spam=True, source="parsing")
-            db.archive_messages_batch(batch_msg_ids, spam=True)
-            archived_count += len(batch_msg_ids)
+# ---------- Parser ----------
+async def parse_claimed_messages(
+    client: AsyncOpenAI,
+    db,
+    unprocessed: List[Dict],
+    channel: str,
+    stats: Dict[str, int],
+    semaphore: asyncio.Semaphore,
+    token_budget: int = BATCH_TOKEN_BUDGET,
+    max_batch_messages: int = MAX_BATCH_MESSAGES,
+    concurrency: int = CLASSIFY_CONCURRENCY,
+    limiter: Optional[TokenRateLimiter] = None,
+    cache: Optional[ClassificationCache] = None,
+    meter: Optional[ThroughputMeter] = None
+):
+    """Classify, store and archive one batch of claimed messages, updating stats."""
+    is_new_grad = bool(channel and "grad" in channel.lower())
+
+    # Filter messages
+    id_map, leetbot_ids = {}, []
+    for msg in unprocessed:
+        author = msg.get("author", {})
+        username = author.get("username") if isinstance(author, dict) else str(author)
+        if username == "leetbot":
+            stats["skipped_leetbot"] += 1
+            leetbot_ids.append(msg["msg_id"])
             continue
 
-        for c in classifications:
-            meta = id_map.get(c.msg_id)
-            if not meta:
-                continue
-
-            db.mark_message_processed(c.msg_id, spam=c.spam, source="parsing")
-            processed_count += 1
-            processed_msg_ids.append(c.msg_id)
-
-            if c.spam:
-                spam_count += 1
-                continue
-
-            valid_count += 1
-            if db.check_duplicate_entry(meta["author"], c.company, c.stage):
-                duplicate_entries += 1
-                continue
-
-            doc = {
-                "msg_id": c.msg_id,
-                "text": meta["text"],
-                "timestamp": meta["timestamp"],
-                "author": meta["author"],
-                "company": c.company,
-                "stage": c.stage,
-                "spam": False,
-                "new_grad": is_new_grad,
-                "category": meta["channel"]
-            }
-            pending_docs.append(doc)
-
-            if len(pending_docs) >= insert_batch_size:
-                db.safe_insert_many(pending_docs)
-                inserted_count += len(pending_docs)
-                pending_docs = []
-                time.sleep(0.5)
-
-        if processed_msg_ids:
-            db.archive_messages_batch(processed_msg_ids, spam=False)
-            archived_count += len(processed_msg_ids)
-            processed_msg_ids = []
-
-        print(f"✅ Batch {i//batch_size + 1} done | "
-              f"Processed: {processed_count} | Valid: {valid_count} | Spam: {spam_count}")
+        id_map[msg["msg_id"]] = {
+            "author": username,
+            "text": msg.get("content", ""),
+            "timestamp": msg.get("timestamp", ""),
+            "channel": msg.get("channel", channel),
+            "edited": msg.get("edited", False)
+        }
+
+    if leetbot_ids:
+        await asyncio.to_thread(db.archive_messages_batch, leetbot_ids, spam=True)
+        stats["archived"] += len(leetbot_ids)
+
+    # Resolve obvious messages locally; only ambiguous ones go to the model
+    local_map, local_results = {}, []
+    for mid, meta in list(id_map.items()):
+        local = pre_classify(mid, meta["text"])
+        if local is not None:
+            local_map[mid] = id_map.pop(mid)
+            local_results.extend(local)
+
+    if local_map:
+        stats["resolved_locally"] += len(local_map)
+        log.debug("pre-classified locally", extra={"channel": channel, "local": len(local_map),
+                                                   "remaining": len(id_map)})
+        await asyncio.to_thread(write_classified_batch, db, local_map, local_results, is_new_grad, stats)
+
+    # Messages whose text the model has already classified skip the API entirely
+    if cache and id_map:
+        cached = await asyncio.to_thread(cache.lookup, id_map)
+        stats["cache_hits"] += len(cached)
+        stats["cache_misses"] += len(id_map) - len(cached)
+        if cached:
+            hit_map = {mid: id_map.pop(mid) for mid in cached}
+            hit_results = [c for results in cached.values() for c in results]
+            await asyncio.to_thread(write_classified_batch, db, hit_map, hit_results, is_new_grad, stats)
+
+    # Identical texts within this claim are classified once and fanned out
+    representatives, followers = {}, {}
+    for mid, meta in id_map.items():
+        rep_mid = representatives.setdefault(normalize_message_text(meta["text"]), mid)
+        if rep_mid != mid:
+            followers.setdefault(rep_mid, []).append(mid)
+
+    batches = pack_batches({mid: id_map[mid] for mid in representatives.values()},
+                           token_budget, max_batch_messages)
+
+    # The semaphore bounds requests in flight across every channel sharing it
+    classify_queue = asyncio.Queue()
+    write_queue = asyncio.Queue(maxsize=concurrency * 2)
+    for n, batch in enumerate(batches, 1):
+        classify_queue.put_nowait((n, batch))
+
+    async def classify_with_split(n, batch):
+        text_block = "\n".join(format_line(mid, meta) for mid, meta in batch.items())
+        async with semaphore:
+            classifications = await classify_batch(client, text_block, limiter)
+        stats["llm_calls"] += 1
+
+        answered = {c.msg_id for c in classifications if c.msg_id in batch}
+        if answered:
+            await write_queue.put((n, {mid: batch[mid] for mid in batch if mid in answered},
+                                   [c for c in classifications if c.msg_id in answered]))
+
+        missing = {mid: meta for mid, meta in batch.items() if mid not in answered}
+        if not missing:
+            return
+        if len(batch) == 1:
+            # Give up for this run; the message stays in unprocessed_messages
+            stats["failed"] += 1
+            log.warning("could not classify message, leaving it for the next run",
+                        extra={"channel": channel, "batch": n, "msg_id": next(iter(batch))})
+            return
+
+        stats["split_retries"] += 1
+        if answered:
+            # Partial answer: retry just the lines the model skipped
+            await classify_with_split(n, missing)
+        else:
+            mids = list(batch)
+            half = len(mids) // 2
+            log.debug("batch failed, splitting", extra={"channel": channel, "batch": n,
+                                                        "left": half, "right": len(mids) - half})
+            await classify_with_split(n, {mid: batch[mid] for mid in mids[:half]})
+            await classify_with_split(n, {mid: batch[mid] for mid in mids[half:]})
+
+    async def classifier():
+        while True:
+            try:
+                n, batch = classify_queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            log.debug("classifying batch", extra={"channel": channel, "batch": n,
+                                                  "batches": len(batches), "messages": len(batch)})
+            await classify_with_split(n, batch)
+
+    async def writer():
+        while True:
+            item = await write_queue.get()
+            if item is None:
+                return
+            n, batch, classifications = item
+            if cache:
+                await asyncio.to_thread(cache.store, batch, classifications)
+            fanned_out = [c.model_copy(update={"msg_id": mid})
+                          for c in classifications for mid in followers.get(c.msg_id, [])]
+            batch.update({mid: id_map[mid] for rep_mid in list(batch) for mid in followers.get(rep_mid, [])})
+            classifications = classifications + fanned_out
+            await asyncio.to_thread(write_classified_batch, db, batch, classifications, is_new_grad, stats)
+            if meter:
+                meter.tick()
+
+    writer_task = asyncio.create_task(writer())
+    classify_task = asyncio.ensure_future(asyncio.gather(*(classifier() for _ in range(max(1, concurrency)))))
+    try:
+        # The writer only returns after the None below, so finishing first means
+        # a write failed; raise it rather than leave classifiers blocked on the full queue
+        await asyncio.wait({writer_task, classify_task}, return_when=asyncio.FIRST_COMPLETED)
+        if writer_task.done():
+            writer_task.result()
+        await classify_task
+        await write_queue.put(None)
+        await writer_task
+    finally:
+        classify_task.cancel()
+        writer_task.cancel()
+
+
+async def parse_unprocessed_messages(
+    client: AsyncOpenAI,
+    channel: str = None,
+    token_budget: int = BATCH_TOKEN_BUDGET,
+    max_batch_messages: int = MAX_BATCH_MESSAGES,
+    concurrency: int = CLASSIFY_CONCURRENCY,
+    limiter: Optional[TokenRateLimiter] = None,
+    semaphore: Optional[asyncio.Semaphore] = None,
+    cache: Optional[ClassificationCache] = None,
+    claim_size: int = CLAIM_SIZE,
+    worker_id: str = WORKER_ID
+):
+    """
+    Drain a channel's queue in leased claims of claim_size messages.
 
-    if pending_docs:
-        db.safe_insert_many(pending_docs)
-        inserted_count += len(pending_docs)
+    Claims are exclusive, so several parser processes can work the same
+    channel; messages still claimed when the run ends (classification
+    failed) are released for the next run.
+    """
+    db = get_db_manager()
+    stats = new_stats()
+    semaphore = semaphore or asyncio.Semaphore(concurrency)
+    meter = ThroughputMeter(log, "parse", stats, rates=("processed", "llm_calls", "inserted"), channel=channel)
+    claimed_total = 0
 
-    print(f"\n📊 Summary for {channel}:")
-    print(f"  - Processed: {processed_count}")
-    print(f"  - Valid: {valid_count}")
-    print(f"  - Spam: {spam_count}")
-    print(f"  - Duplicates: {duplicate_entries}")
-    print(f"  - Inserted: {inserted_count}")
-    print(f"  - Archived: {archived_count}")
-    print(f"  - Skipped leetbot: {skipped_leetbot}\n")
+    log.info("claiming unprocessed messages", extra={"channel": channel, "worker_id": worker_id})
+    try:
+        while True:
+            claimed = await asyncio.to_thread(
+                db.claim_unprocessed_messages, worker_id, channel=channel, batch_size=claim_size
+            )
+            if not claimed:
+                break
+            claimed_total += len(claimed)
+            log.debug("parsing claimed messages", extra={"channel": channel, "claimed": len(claimed)})
+            await parse_claimed_messages(
+                client, db, claimed, channel, stats, semaphore,
+                token_budget=token_budget, max_batch_messages=max_batch_messages,
+                concurrency=concurrency, limiter=limiter, cache=cache, meter=meter
+            )
+    finally:
+        await asyncio.to_thread(db.release_claims, worker_id, channel=channel)
+
+    if not claimed_total:
+        log.info("no unprocessed messages", extra={"channel": channel})
+        return stats
+
+    lookups = stats['cache_hits'] + stats['cache_misses']
+    meter.report(final=True, claimed=claimed_total,
+                 cache_hit_rate=round(stats['cache_hits'] / lookups, 3) if lookups else 0.0,
+                 avg_bulk_write=round(stats['bulk_docs'] / stats['bulk_writes'], 1) if stats['bulk_writes'] else 0.0)
+    return stats
 
 
 # ---------- Auto Runner ----------
-def main():
-    for channel in CHANNELS:
-        parse_unprocessed_messages(channel=channel)
-        time.sleep(2)  # avoid rate spike between channels
+async def parse_all(channels=CHANNELS, concurrency: int = CLASSIFY_CONCURRENCY,
+                    tokens_per_minute: int = TOKENS_PER_MINUTE):
+    """Parse all channels concurrently, sharing one client and one TPM budget."""
+    db = get_db_manager()
+    if not db.test_connection():
+        log.error("DB connection failed")
+        return
+
+    client = AsyncOpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL, max_retries=5)
+    limiter = TokenRateLimiter(tokens_per_minute)
+    semaphore = asyncio.Semaphore(concurrency)
+    cache = ClassificationCache(db.db[CACHE_COLLECTION])
+    started = time.monotonic()
+    try:
+        await asyncio.gather(*(
+            parse_unprocessed_messages(client, channel=channel, concurrency=concurrency,
+                                       limiter=limiter, semaphore=semaphore, cache=cache)
+            for channel in channels
+        ))
+    finally:
+        await client.close()
 
-    print("\n✅ All channels parsed successfully!")
+    evicted = await asyncio.to_thread(cache.evict)
+    if evicted:
+        log.info("evicted least recently used cache entries", extra={"evicted": evicted})
+
+    log.info("all channels parsed", extra={"channels": len(channels),
+                                           "elapsed_s": round(time.monotonic() - started, 1)})
+
+
+def main():
+    configure_logging()
+    asyncio.run(parse_all())
 
 
 if __name__ == "__main__":
@@ -1,8 +1,4 @@
-from pymongo import MongoClient, UpdateOne, IndexModel
-# ---- MongoDB Config ----
-MONGO_URI = ""
-DB_NAME = "JobStats"
-COLLECTION_NAME = "interview_processes_backfilled"
+from main.Preprocessor.maintenance import Rule, run_cli
 
 # ---- Stage mapping ----
 STAGE_MAP = {
@@ -12,20 +8,15 @@ STAGE_MAP = {
     "VO": "Onsite"
 }
 
-def update_stages():
-    client = MongoClient(MONGO_URI)
-    db = client[DB_NAME]
-    coll = db[COLLECTION_NAME]
+RULES = [
+    Rule(f"stage_{old_stage}_to_{new_stage}", {"stage": old_stage}, {"$set": {"stage": new_stage}})
+    for old_stage, new_stage in STAGE_MAP.items()
+]
 
-    total_updates = 0
-    for old_stage, new_stage in STAGE_MAP.items():
-        result = coll.update_many(
-            {"stage": old_stage},
-            {"$set": {"stage": new_stage}}
-        )
-        print(f"Updated {result.modified_count} documents: {old_stage} → {new_stage}")
-        total_updates += result.modified_count
 
+def update_stages(argv=None):
+    results = run_cli(RULES, description="Merge legacy stage names into the current stages.", argv=argv)
+    total_updates = sum(r.get("modified", 0) for r in results.values())
     print(f"\n✅ Total stages updated: {total_updates}")
 
 if __name__ == "__main__":
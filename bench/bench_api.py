@@ -0,0 +1,110 @@
+"""
+Every /api/* route through Flask's test client.
+
+GET routes run cold (response cache cleared before each round, so the
+MongoDB work is measured) and warm (served from the cache). Dates in the
+query strings are relative to the dataset's anchor day.
+"""
+
+import itertools
+
+import pytest
+
+from Preprocessor.meta_summary import rebuild_meta_summary
+
+ROUNDS = 20
+
+GET_ROUTES = [
+    "/api/meta",
+    "/api/meta?job_types=intern",
+    "/api/ops/stats",
+    "/api/messages?companies=Google,Meta",
+    "/api/messages?start={month_ago}&stages=OA,Offer",
+    "/api/funnel",
+    "/api/funnel?job_types=new_grad",
+    "/api/heatmap",
+    "/api/timeline",
+    "/api/companies/search?q=goo",
+    "/api/dashboard",
+    "/api/dashboard?start={month_ago}&job_types=intern",
+    "/api/top-oa-companies?job_types=new_grad,intern",
+    "/api/top-offer-companies?job_types=new_grad,intern",
+    "/api/top-companies?job_types=new_grad,intern",
+    "/api/hiring-trends?job_types=new_grad,intern",
+    "/api/hiring-trends?company=Google",
+    "/api/viewers/count",
+]
+
+# Route prefix -> backend features it needs
+ROUTE_REQUIRES = {
+    "/api/hiring-trends": ("date_from_string",),
+}
+
+
+def get_ok(client, path):
+    response = client.get(path)
+    assert response.status_code == 200, f"{path}: {response.status_code} {response.get_data(as_text=True)[:200]}"
+    return response
+
+
+def post_ok(client, path, body):
+    response = client.post(path, json=body)
+    assert response.status_code == 200, f"{path}: {response.status_code} {response.get_data(as_text=True)[:200]}"
+    return response
+
+
+def route_path(route, dataset, require):
+    for prefix, features in ROUTE_REQUIRES.items():
+        if route.startswith(prefix):
+            require(*features)
+    return route.format(**dataset.params)
+
+
+@pytest.mark.parametrize("route", GET_ROUTES)
+def bench_get_cold(benchmark, api, dataset, require, route):
+    path = route_path(route, dataset, require)
+    client = api.app.test_client()
+    benchmark.pedantic(get_ok, args=(client, path), setup=api.CACHE.clear, rounds=ROUNDS, warmup_rounds=1)
+
+
+@pytest.mark.parametrize("route", GET_ROUTES)
+def bench_get_warm(benchmark, api, dataset, require, route):
+    path = route_path(route, dataset, require)
+    client = api.app.test_client()
+    get_ok(client, path)
+    benchmark(get_ok, client, path)
+
+
+def bench_session_start(benchmark, api, dataset):
+    client = api.app.test_client()
+    ids = itertools.count()
+    benchmark(lambda: post_ok(client, "/api/session/start", {"session_id": f"bench-{next(ids)}"}))
+
+
+def bench_session_heartbeat(benchmark, api, dataset):
+    client = api.app.test_client()
+    post_ok(client, "/api/session/start", {"session_id": "bench-heartbeat"})
+    benchmark(post_ok, client, "/api/session/heartbeat", {"session_id": "bench-heartbeat"})
+
+
+def bench_feedback(benchmark, api, dataset):
+    client = api.app.test_client()
+    benchmark(post_ok, client, "/api/feedback", {"feedback": "benchmark", "rating": 5, "session_id": "bench"})
+
+
+@pytest.fixture
+def submissions_cleanup(dataset):
+    yield
+    # /api/submit writes straight into the backfilled collection and the meta summary
+    dataset.db["interview_processes_backfilled"].delete_many({"author": {"$regex": "^bench-submit-"}})
+    rebuild_meta_summary(dataset.db, source="interview_processes_backfilled")
+
+
+def bench_submit(benchmark, api, dataset, require, submissions_cleanup):
+    require("bulk_update_one")
+    client = api.app.test_client()
+    ids = itertools.count()
+    benchmark(lambda: post_ok(client, "/api/submit", {
+        "username": f"bench-submit-{next(ids)}", "company": "Google", "stage": "OA",
+        "position_type": "intern", "date": dataset.params["today"],
+    }))
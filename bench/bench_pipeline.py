@@ -0,0 +1,119 @@
+"""
+Batch jobs against the seeded dataset: build_backfilled, merge_companies and
+the parser with a mocked LLM.
+
+The mock answers structured-output requests from the message text after
+BENCH_LLM_LATENCY seconds (default 0.05), so the parser's batching,
+concurrency and DB writes are measured without calling OpenAI.
+"""
+
+import asyncio
+import os
+import re
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+from main.Preprocessor import merge_companies
+from main.Preprocessor import parse_messages_v3 as parser
+from main.Preprocessor.backfill_to_new_collection import DST_COLLECTION, SRC_COLLECTION, build_backfilled
+from main.Preprocessor.canonical import CANON
+from main.Preprocessor.db_utils import get_db_manager
+from synth import STAGE_WORDS, generate_messages
+
+LLM_LATENCY = float(os.environ.get("BENCH_LLM_LATENCY", 0.05))
+PARSE_MESSAGES = 2000
+
+
+def bench_build_backfilled(benchmark, dataset, require):
+    require("bulk_update_one")
+    benchmark.pedantic(build_backfilled, rounds=3, iterations=1)
+
+
+# ---- merge_companies ----
+def restore_alias_spellings(db):
+    """Put back the alias spellings synth.py stored, which merge_companies rewrites."""
+    src, dst = db[SRC_COLLECTION], db[DST_COLLECTION]
+    for alias in src.distinct("bench_alias"):
+        src.update_many({"bench_alias": alias}, {"$set": {"company": alias}})
+        msg_ids = src.distinct("msg_id", {"bench_alias": alias})
+        # Synthetic stages carry the journey's company in their id
+        dst.update_many({"$or": [{"msg_id": {"$in": msg_ids}},
+                                 {"msg_id": {"$regex": f"^auto_{re.escape(alias)}_"}}]},
+                        {"$set": {"company": alias}})
+
+
+@pytest.fixture
+def alias_spellings(dataset):
+    restore_alias_spellings(dataset.db)
+    yield
+    restore_alias_spellings(dataset.db)
+
+
+def bench_merge_companies(benchmark, dataset, alias_spellings, monkeypatch):
+    monkeypatch.setattr(sys, "argv", ["merge_companies.py"])
+    benchmark.pedantic(merge_companies.main, setup=lambda: restore_alias_spellings(dataset.db),
+                       rounds=3, iterations=1)
+
+
+# ---- Parser ----
+_COMPANIES = sorted(list(CANON) + [f"Company {i:04d}" for i in range(1000)], key=len, reverse=True)
+_STAGES = {word: stage for stage, word in STAGE_WORDS.items()}
+_STAGES.update({stage.lower(): stage for stage in STAGE_WORDS})
+
+
+def mock_classify(line):
+    """Classification the model would give one "msg_id:: text" line."""
+    msg_id, _, text = line.partition(":: ")
+    lowered = text.lower()
+    company = next((name for name in _COMPANIES if name.lower() in lowered), None)
+    stage = next((stage for word, stage in _STAGES.items() if word in lowered), None)
+    if not company or not stage:
+        return parser.InterviewProcess(msg_id=msg_id, company="", stage="", spam=True)
+    return parser.InterviewProcess(msg_id=msg_id, company=company, stage=stage, spam=False)
+
+
+class MockLLM:
+    """Stands in for AsyncOpenAI's beta.chat.completions.parse."""
+
+    def __init__(self, latency=LLM_LATENCY):
+        self.latency = latency
+        self.beta = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(parse=self.parse)))
+
+    async def parse(self, model, messages, response_format):
+        await asyncio.sleep(self.latency)
+        lines = [line for line in messages[-1]["content"].splitlines() if ":: " in line]
+        parsed = response_format(classifications=[mock_classify(line) for line in lines])
+        tokens = sum(parser.estimate_tokens(m["content"]) for m in messages)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(parsed=parsed))],
+                               usage=SimpleNamespace(total_tokens=tokens + 25 * len(lines)))
+
+
+def reset_parser_queue(db, messages):
+    """Empty the parser's collections and queue a fresh copy of messages."""
+    for coll in (db.unprocessed_collection, db.processed_collection, db.archive_collection):
+        coll.delete_many({})
+    db.interview_collection.delete_many({"msg_id": {"$regex": "^bench-"}})
+    db.add_unprocessed_messages([dict(m) for m in messages], channel="grad_26")
+
+
+@pytest.fixture
+def parser_db(dataset, capabilities):
+    db = get_db_manager()
+    db.merge_supported = "merge" in capabilities
+    yield db
+    reset_parser_queue(db, [])
+
+
+def bench_parse_messages(benchmark, parser_db, require):
+    require("bulk_update_one")
+    messages = list(generate_messages(PARSE_MESSAGES))
+    results = {}
+
+    def run():
+        results["stats"] = asyncio.run(parser.parse_unprocessed_messages(MockLLM(), channel="grad_26"))
+
+    benchmark.pedantic(run, setup=lambda: reset_parser_queue(parser_db, messages), rounds=3, iterations=1)
+    # Counters of the last round (llm_calls, bulk_writes, inserted, ...)
+    benchmark.extra_info.update(messages=len(messages), **results["stats"])
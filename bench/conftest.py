@@ -0,0 +1,206 @@
+"""
+Fixtures for the benchmark suite (see README.md in this directory).
+
+The synthetic dataset (synth.py) is written to the JobStats database of
+- a local mongod when BENCH_MONGO_URI is set (use this for 100K / 1M rows;
+  the seeded data is reused across runs until rows, seed or date change), or
+- an in-process mongomock client otherwise.
+
+mongomock lacks some server features ($dateFromString, $merge, and with
+recent PyMongo, bulk UpdateOne); scenarios that need them are skipped there.
+"""
+
+import importlib.util
+import os
+import sys
+import types
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, Set
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_MONGO_URI = os.environ.get("BENCH_MONGO_URI")
+
+# Everything below reads MONGO_URI at import time
+if BENCH_MONGO_URI:
+    os.environ["MONGO_URI"] = BENCH_MONGO_URI
+# Keep per-request access log lines out of the output
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+sys.path.insert(0, REPO_ROOT)
+# The Preprocessor scripts import main.Preprocessor.*; alias the checkout when it isn't named main
+try:
+    _has_main = importlib.util.find_spec("main.Preprocessor") is not None
+except ModuleNotFoundError:
+    _has_main = False
+if not _has_main:
+    _main = types.ModuleType("main")
+    _main.__path__ = [REPO_ROOT]
+    sys.modules["main"] = _main
+
+from pymongo import MongoClient, UpdateOne, uri_parser  # noqa: E402
+from pymongo.errors import OperationFailure  # noqa: E402
+
+from Preprocessor import mongo_pool  # noqa: E402
+from Preprocessor.meta_summary import rebuild_meta_summary  # noqa: E402
+from main.Preprocessor import mongo_pool as script_mongo_pool  # noqa: E402
+from main.Preprocessor.backfill_to_new_collection import (  # noqa: E402
+    DST_COLLECTION, SRC_COLLECTION, ensure_indexes, ensure_source_index, iter_journeys, plan_journey,
+)
+from synth import default_anchor, generate_submissions  # noqa: E402
+
+STATE_COLLECTION = "bench_state"
+SYNTH_VERSION = 1
+INSERT_BATCH = 10_000
+SCRATCH_COLLECTIONS = ["active_sessions", "feedback"]
+SEEDED_COLLECTIONS = [SRC_COLLECTION, DST_COLLECTION, "unprocessed_messages", "processed_ids", "archive"]
+LOCAL_HOSTS = {"localhost", "127.0.0.1", "::1"}
+
+
+def pytest_addoption(parser):
+    parser.addoption("--rows", type=int, default=int(os.environ.get("BENCH_ROWS", 10_000)),
+                     help="synthetic interview_processes rows (10000, 100000, 1000000)")
+    parser.addoption("--bench-seed", type=int, default=int(os.environ.get("BENCH_SEED", 42)),
+                     help="random seed for the synthetic dataset")
+
+
+def pytest_benchmark_update_machine_info(config, machine_info):
+    # Saved with every result file, so runs are only compared like for like
+    machine_info["bench_rows"] = config.getoption("--rows")
+    machine_info["bench_seed"] = config.getoption("--bench-seed")
+    machine_info["bench_backend"] = "mongod" if BENCH_MONGO_URI else "mongomock"
+
+
+# ---- MongoDB ----
+def _require_local(uri: str):
+    hosts = {host for host, _ in uri_parser.parse_uri(uri)["nodelist"]}
+    if not hosts <= LOCAL_HOSTS and not os.environ.get("BENCH_ALLOW_REMOTE"):
+        pytest.exit("BENCH_MONGO_URI must point at a local scratch mongod: the suite rewrites the "
+                    "JobStats collections (set BENCH_ALLOW_REMOTE=1 to override)")
+
+
+def probe_capabilities(db) -> Set[str]:
+    """Server features some scenarios need and mongomock may lack."""
+    scratch = db["bench_probe"]
+    scratch.drop()
+    scratch.insert_one({"_id": 1, "ts": "2025-01-01T00:00:00+00:00"})
+    caps = {"mongod"} if BENCH_MONGO_URI else set()
+    try:
+        scratch.bulk_write([UpdateOne({"_id": 1}, {"$set": {"x": 1}}, upsert=True)])
+        caps.add("bulk_update_one")
+    except (TypeError, NotImplementedError):
+        pass
+    try:
+        list(scratch.aggregate([{"$project": {"d": {"$dateFromString": {"dateString": "$ts"}}}}]))
+        caps.add("date_from_string")
+    except (NotImplementedError, OperationFailure):
+        pass
+    try:
+        list(scratch.aggregate([{"$match": {}}, {"$merge": {"into": "bench_probe_out"}}]))
+        caps.add("merge")
+    except (NotImplementedError, OperationFailure):
+        pass
+    scratch.drop()
+    db["bench_probe_out"].drop()
+    return caps
+
+
+@pytest.fixture(scope="session")
+def mongo_client():
+    if BENCH_MONGO_URI:
+        _require_local(BENCH_MONGO_URI)
+        client = MongoClient(BENCH_MONGO_URI)
+    else:
+        import mongomock
+        client = mongomock.MongoClient()
+        # Every role of both import paths shares the one in-memory client
+        for module in (mongo_pool, script_mongo_pool):
+            module.MongoClient = lambda *args, **kwargs: client
+    yield client
+    mongo_pool.close_clients()
+    script_mongo_pool.close_clients()
+    client.close()
+
+
+@pytest.fixture(scope="session")
+def capabilities(mongo_client) -> Set[str]:
+    return probe_capabilities(mongo_client[mongo_pool.DB_NAME])
+
+
+@pytest.fixture
+def require(capabilities):
+    """require("merge", ...) skips the benchmark unless the backend supports them."""
+    def check(*names):
+        missing = [name for name in names if name not in capabilities]
+        if missing:
+            pytest.skip(f"backend lacks {', '.join(missing)}; run against a mongod (BENCH_MONGO_URI)")
+    return check
+
+
+# ---- Dataset ----
+@dataclass
+class Dataset:
+    db: object
+    rows: int
+    seed: int
+    anchor: datetime
+    params: Dict[str, str] = field(default_factory=dict)
+
+
+def _batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def seed_dataset(db, rows: int, seed: int, anchor: datetime):
+    """Generate the source collection, then its backfilled copy and meta summary."""
+    for name in SEEDED_COLLECTIONS:
+        db[name].drop()
+
+    src, dst = db[SRC_COLLECTION], db[DST_COLLECTION]
+    for batch in _batched(generate_submissions(rows, seed, anchor), INSERT_BATCH):
+        src.insert_many(batch, ordered=False)
+    ensure_source_index(src)
+
+    # The same journeys build_backfilled() writes, inserted directly
+    planned = (doc for key, docs in iter_journeys(src) for doc in plan_journey(key, docs)[0])
+    for batch in _batched(planned, INSERT_BATCH):
+        dst.insert_many(batch, ordered=False)
+    ensure_indexes(dst)
+    rebuild_meta_summary(db, source=DST_COLLECTION)
+
+
+@pytest.fixture(scope="session")
+def dataset(mongo_client, request) -> Dataset:
+    rows = request.config.getoption("--rows")
+    seed = request.config.getoption("--bench-seed")
+    anchor = default_anchor()
+    db = mongo_client[mongo_pool.DB_NAME]
+
+    spec = {"rows": rows, "seed": seed, "anchor": anchor.isoformat(), "version": SYNTH_VERSION}
+    state = db[STATE_COLLECTION].find_one({"_id": "dataset"})
+    if not state or state.get("spec") != spec:
+        seed_dataset(db, rows, seed, anchor)
+        db[STATE_COLLECTION].replace_one({"_id": "dataset"}, {"_id": "dataset", "spec": spec}, upsert=True)
+    for name in SCRATCH_COLLECTIONS:
+        db[name].delete_many({})
+
+    return Dataset(db, rows, seed, anchor, params={
+        "month_ago": (anchor - timedelta(days=30)).strftime("%Y-%m-%d"),
+        "today": anchor.strftime("%Y-%m-%d"),
+    })
+
+
+@pytest.fixture(scope="session")
+def api(dataset):
+    """The Flask app module, imported once the database is in place."""
+    import server
+    return server
@@ -0,0 +1,91 @@
+"""
+In-process fake of Discord's channel messages endpoint for the harvester.
+
+FakeDiscord.transport() is an httpx.MockTransport, so harvest_channel runs
+unchanged over an httpx.AsyncClient that never leaves the process. The fake
+- serves GET /channels/{id}/messages?after=&limit= in snowflake order
+- sends X-RateLimit-Remaining / X-RateLimit-Reset-After per channel route and
+  answers 429 with Retry-After when a client ignores them
+- fails every fail_every-th request with a connection error, for the retry path
+
+Counters (requests, rate_limited, failures) show what the harvester did.
+"""
+
+import bisect
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List
+
+import httpx
+
+from synth import CHATTER, snowflake
+
+
+def channel_messages(count: int, seed: int = 11, hours: int = 24) -> List[Dict]:
+    """`count` raw messages from the last `hours` hours, oldest first."""
+    rnd = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    messages = []
+    for i in range(count):
+        ts = now - timedelta(seconds=rnd.uniform(0, hours * 3600))
+        content = (f"!process Company {rnd.randrange(600):04d} OA" if rnd.random() < 0.4
+                   else rnd.choice(CHATTER))
+        messages.append({"id": snowflake(ts, i), "content": content, "timestamp": ts.isoformat(),
+                         "author": {"username": f"user{rnd.randrange(count // 2 + 1)}"}})
+    return sorted(messages, key=lambda m: int(m["id"]))
+
+
+class FakeDiscord:
+    def __init__(self, channels: Dict[str, List[Dict]], bucket_size: int = 5,
+                 reset_after: float = 0.02, fail_every: int = 0):
+        self.channels = channels
+        self.ids = {cid: [int(m["id"]) for m in msgs] for cid, msgs in channels.items()}
+        self.bucket_size = bucket_size
+        self.reset_after = reset_after
+        self.fail_every = fail_every
+        self.buckets = {}  # channel id -> (remaining, reset_at monotonic)
+        self.counts = dict.fromkeys(["requests", "rate_limited", "failures"], 0)
+
+    def transport(self) -> httpx.MockTransport:
+        return httpx.MockTransport(self.handle)
+
+    def _take(self, channel_id: str):
+        """Consume one request from the route's bucket; returns (allowed, remaining, reset_after)."""
+        now = time.monotonic()
+        remaining, reset_at = self.buckets.get(channel_id, (self.bucket_size, now + self.reset_after))
+        if now >= reset_at:
+            remaining, reset_at = self.bucket_size, now + self.reset_after
+        if remaining == 0:
+            return False, 0, reset_at - now
+        self.buckets[channel_id] = (remaining - 1, reset_at)
+        return True, remaining - 1, reset_at - now
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        self.counts["requests"] += 1
+        if self.fail_every and self.counts["requests"] % self.fail_every == 0:
+            self.counts["failures"] += 1
+            raise httpx.ConnectError("fake connection reset", request=request)
+
+        parts = request.url.path.rstrip("/").split("/")
+        if len(parts) < 2 or parts[-1] != "messages" or parts[-2] not in self.channels:
+            return httpx.Response(404, json={"message": "Unknown Channel", "code": 10003})
+        channel_id = parts[-2]
+
+        allowed, remaining, reset_after = self._take(channel_id)
+        if not allowed:
+            self.counts["rate_limited"] += 1
+            return httpx.Response(429, headers={"Retry-After": f"{reset_after:.3f}"},
+                                  json={"message": "You are being rate limited.",
+                                        "retry_after": reset_after, "global": False})
+
+        after = int(request.url.params.get("after", 0))
+        limit = min(int(request.url.params.get("limit", 50)), 100)
+        start = bisect.bisect_right(self.ids[channel_id], after)
+        page = self.channels[channel_id][start:start + limit]
+        # Discord returns newest first
+        return httpx.Response(200, json=list(reversed(page)), headers={
+            "X-RateLimit-Limit": str(self.bucket_size),
+            "X-RateLimit-Remaining": str(remaining),
+            "X-RateLimit-Reset-After": f"{reset_after:.3f}",
+        })
@@ -0,0 +1,195 @@
+"""
+Synthetic, reproducible data for the benchmark suite.
+
+generate_submissions() yields interview_processes documents shaped like the
+parser's output:
+- company popularity is Zipf-skewed (a few companies get most submissions),
+  with the real CANON names at the head and a long tail of small ones; a
+  small share is stored under an alias spelling so merge_companies has work
+- journeys walk STAGE_ORDER with fixed transition probabilities, and some
+  intermediate stages are never reported (what the backfill fills in)
+- timestamps are Discord-style ISO strings (+00:00, microseconds), with
+  stage gaps of days to weeks, more activity on weekdays and US daytime
+- msg_ids are snowflakes derived from the timestamp
+
+generate_messages() yields raw Discord messages for the parser.
+
+The same (rows, seed, anchor date) always produces the same data.
+"""
+
+import random
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterator, List, Optional
+
+from Preprocessor.api_core import STAGE_ORDER
+from Preprocessor.canonical import CANON
+
+DISCORD_EPOCH_MS = 1420070400000
+HISTORY_DAYS = 210
+TAIL_COMPANIES = 600
+ZIPF_EXPONENT = 1.1
+ALIAS_SHARE = 0.03
+SPAM_SHARE = 0.05
+UNREPORTED_SHARE = 0.15  # intermediate stages the candidate never posted
+
+# Where a journey starts, and P(next stage | current stage); the remainder stops
+FIRST_STAGE = {"OA": 0.78, "Phone/R1": 0.14, "Onsite": 0.05, "App": 0.03}
+TRANSITIONS = {
+    "App": {"OA": 0.6, "Reject": 0.1},
+    "OA": {"Phone/R1": 0.38, "Reject": 0.27},
+    "Phone/R1": {"Onsite": 0.45, "Reject": 0.3},
+    "Onsite": {"HM": 0.25, "Offer": 0.3, "Reject": 0.3},
+    "HM": {"Offer": 0.55, "Reject": 0.3},
+}
+# Median days between consecutive stages (log-normal around it)
+STAGE_GAP_DAYS = {"App": 10, "OA": 9, "Phone/R1": 12, "Onsite": 8, "HM": 6}
+
+# Relative activity by UTC hour (peaks in the US afternoon / evening)
+HOUR_WEIGHTS = [6, 5, 4, 3, 2, 1, 1, 1, 1, 1, 2, 3, 4, 5, 7, 8, 9, 9, 9, 9, 8, 8, 7, 7]
+WEEKEND_FACTOR = 0.6
+
+CHATTER = [
+    "anyone heard back yet?", "good luck everyone", "lc grind never stops",
+    "how long did the OA take for you all", "ghosted again lol", "!stats",
+]
+FREE_TEXT = [
+    "just got the {stage} from {company}!", "{company} {stage} came in today",
+    "finally heard from {company}, {stage} next week", "{stage} for {company} {job}",
+]
+STAGE_WORDS = {"OA": "oa", "Phone/R1": "phone screen", "Onsite": "onsite", "HM": "hm round",
+               "Offer": "offer", "Reject": "rejection", "App": "application"}
+
+
+def default_anchor() -> datetime:
+    """Midnight UTC today, so date-windowed routes see a full history."""
+    return datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def company_names(rnd: random.Random) -> List[str]:
+    head = sorted(CANON)
+    rnd.shuffle(head)
+    return head + [f"Company {i:04d}" for i in range(TAIL_COMPANIES)]
+
+
+def zipf_weights(n: int, exponent: float = ZIPF_EXPONENT) -> List[float]:
+    return [1 / (rank ** exponent) for rank in range(1, n + 1)]
+
+
+def discord_time(rnd: random.Random, day: datetime) -> datetime:
+    """A timestamp on `day` drawn from the hourly activity curve."""
+    hour = rnd.choices(range(24), HOUR_WEIGHTS)[0]
+    return day.replace(hour=hour, minute=0, second=0, microsecond=0) + timedelta(
+        seconds=rnd.randrange(3600), microseconds=rnd.randrange(1_000_000))
+
+
+def pick_day(rnd: random.Random, anchor: datetime, history_days: int = HISTORY_DAYS) -> datetime:
+    while True:
+        day = anchor - timedelta(days=rnd.randrange(history_days))
+        if day.weekday() < 5 or rnd.random() < WEEKEND_FACTOR:
+            return day
+
+
+def snowflake(ts: datetime, seq: int) -> str:
+    return str(((int(ts.timestamp() * 1000) - DISCORD_EPOCH_MS) << 22) | (seq & 0x3FFFFF))
+
+
+def journey_stages(rnd: random.Random) -> List[str]:
+    stage = rnd.choices(list(FIRST_STAGE), list(FIRST_STAGE.values()))[0]
+    stages = [stage]
+    while stage in TRANSITIONS:
+        options = TRANSITIONS[stage]
+        roll, stop = rnd.random(), True
+        for nxt, p in options.items():
+            if roll < p:
+                stage, stop = nxt, False
+                break
+            roll -= p
+        if stop:
+            break
+        stages.append(stage)
+    return stages
+
+
+def generate_submissions(rows: int, seed: int = 42, anchor: Optional[datetime] = None) -> Iterator[Dict]:
+    """Yield exactly `rows` interview_processes documents."""
+    rnd = random.Random(seed)
+    anchor = anchor or default_anchor()
+    companies = company_names(rnd)
+    weights = zipf_weights(len(companies))
+    authors = max(rows // 3, 1)
+    produced = seq = 0
+
+    while produced < rows:
+        if rnd.random() < SPAM_SHARE:
+            ts = discord_time(rnd, pick_day(rnd, anchor))
+            seq += 1
+            yield {"msg_id": snowflake(ts, seq), "text": rnd.choice(CHATTER), "timestamp": ts.isoformat(),
+                   "author": f"user{rnd.randrange(authors)}", "company": "", "stage": "", "spam": True,
+                   "new_grad": rnd.random() < 0.5, "category": "grad_26"}
+            produced += 1
+            continue
+
+        company = rnd.choices(companies, weights)[0]
+        stored = company
+        if company in CANON and CANON[company] and rnd.random() < ALIAS_SHARE:
+            stored = rnd.choice(CANON[company])
+        author = f"user{rnd.randrange(authors)}"
+        new_grad = rnd.random() < 0.55
+        stages = journey_stages(rnd)
+
+        ts = discord_time(rnd, pick_day(rnd, anchor))
+        for i, stage in enumerate(stages):
+            if i:
+                gap = rnd.lognormvariate(0, 0.6) * STAGE_GAP_DAYS.get(stages[i - 1], 7)
+                ts = discord_time(rnd, ts + timedelta(days=gap))
+                if ts > anchor:
+                    break
+            last = i == len(stages) - 1
+            if not last and i and rnd.random() < UNREPORTED_SHARE:
+                continue
+            seq += 1
+            doc = {
+                "msg_id": snowflake(ts, seq),
+                "text": f"!process {stored} {stage}",
+                "timestamp": ts.isoformat(),
+                "author": author,
+                "company": stored,
+                "stage": stage,
+                "spam": False,
+                "new_grad": new_grad,
+                "category": "grad_26" if new_grad else "intern_26",
+            }
+            if stored != company:
+                doc["bench_alias"] = stored
+            yield doc
+            produced += 1
+            if produced >= rows:
+                return
+
+
+def generate_messages(count: int, seed: int = 7, anchor: Optional[datetime] = None,
+                      channel: str = "grad_26") -> Iterator[Dict]:
+    """Yield raw Discord messages (as harvested into unprocessed_messages)."""
+    rnd = random.Random(seed)
+    anchor = anchor or default_anchor()
+    companies = company_names(rnd)
+    weights = zipf_weights(len(companies))
+
+    for i in range(count):
+        ts = discord_time(rnd, pick_day(rnd, anchor, history_days=2))
+        company = rnd.choices(companies, weights)[0]
+        stage = rnd.choice(STAGE_ORDER)
+        roll = rnd.random()
+        username = f"user{rnd.randrange(count // 2 + 1)}"
+        if roll < 0.4:
+            content = f"!process {company} {stage}"
+        elif roll < 0.65:
+            content = rnd.choice(FREE_TEXT).format(company=company, stage=STAGE_WORDS[stage],
+                                                   job=rnd.choice(["ng", "intern", "new grad"]))
+        elif roll < 0.95:
+            content = rnd.choice(CHATTER)
+        else:
+            username, content = "leetbot", "Daily LeetCode problem is up!"
+        msg_id = f"bench-{snowflake(ts, i)}"
+        yield {"id": msg_id, "msg_id": msg_id, "content": content, "timestamp": ts.isoformat(),
+               "author": {"username": username}, "channel": channel}
@@ -0,0 +1,134 @@
+# =============================================
+# File: gunicorn.conf.py
+# Production settings for the JobStats API; picked up automatically by
+#   gunicorn            (from the repo root)
+# Environment overrides:
+#   PORT                 listen port (3200)
+#   GUNICORN_ASGI=1      serve server_async:app on uvicorn workers instead of
+#                        the Flask app on threaded workers
+#   WEB_CONCURRENCY      worker processes (default: from CPU count)
+#   GUNICORN_THREADS     threads per Flask worker (4)
+#   MAX_WORKER_RSS_MB    recycle a worker once its RSS passes this (512;
+#                        needs /proc, so Linux only)
+# =============================================
+import asyncio
+import multiprocessing
+import os
+import signal
+import threading
+import time
+
+ASGI = os.environ.get("GUNICORN_ASGI") == "1"
+CORES = multiprocessing.cpu_count()
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 3200)}"
+
+if ASGI:
+    # One event loop per core; each loop multiplexes many requests
+    wsgi_app = "server_async:app"
+    worker_class = "uvicorn.workers.UvicornWorker"
+    workers = int(os.environ.get("WEB_CONCURRENCY", CORES))
+else:
+    # Handlers mostly wait on MongoDB, so threads overlap that wait cheaply
+    wsgi_app = "server:app"
+    worker_class = "gthread"
+    workers = int(os.environ.get("WEB_CONCURRENCY", min(2 * CORES + 1, 9)))
+    threads = int(os.environ.get("GUNICORN_THREADS", 4))
+
+# Load the app once in the master and fork workers from it: imports and the
+# warmed response cache (see when_ready) are shared copy-on-write. Mongo
+# clients are created per process after the fork (Preprocessor/mongo_pool.py).
+preload_app = True
+
+timeout = 30
+graceful_timeout = 30
+keepalive = 5
+
+# Recycle workers to bound slow memory growth; jitter avoids all workers
+# restarting at once
+max_requests = 2000
+max_requests_jitter = 200
+
+MAX_WORKER_RSS_MB = int(os.environ.get("MAX_WORKER_RSS_MB", 512))
+RSS_CHECK_EVERY = 50  # requests between RSS checks (Flask workers)
+RSS_CHECK_INTERVAL = 30  # seconds between RSS checks (ASGI workers)
+
+# The apps write their own sampled JSON access log (Preprocessor/log_setup.py)
+accesslog = None
+errorlog = "-"
+
+
+def current_rss_mb():
+    """
+    Resident set size of this process in MB, or None without /proc.
+
+    getrusage() only reports peak RSS, which never drops below the limit once
+    passed, so off Linux memory-based recycling is skipped.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def rss_over_limit(log, pid):
+    rss = current_rss_mb()
+    if rss is None or rss <= MAX_WORKER_RSS_MB:
+        return False
+    log.info(f"Worker {pid} RSS {rss:.0f}MB > {MAX_WORKER_RSS_MB}MB, recycling")
+    return True
+
+
+def watch_rss(worker):
+    """
+    ASGI workers: check RSS every RSS_CHECK_INTERVAL seconds and shut down
+    gracefully (SIGTERM) once over the limit; uvicorn workers never call
+    post_request.
+    """
+    while True:
+        time.sleep(RSS_CHECK_INTERVAL)
+        if rss_over_limit(worker.log, worker.pid):
+            os.kill(worker.pid, signal.SIGTERM)
+            return
+
+
+def when_ready(server):
+    """Precompute the default dashboard responses in the master before workers fork."""
+    started = time.monotonic()
+    try:
+        if ASGI:
+            import server_async
+            statuses = asyncio.run(server_async.warm_cache(close=True))
+        else:
+            import server as api
+            from Preprocessor.mongo_pool import close_clients
+            statuses = api.warm_cache()
+            # Workers open their own clients; don't keep the master's pool around
+            close_clients()
+    except Exception as e:
+        server.log.warning(f"Cache warmup skipped: {e}")
+        return
+    failed = [path for path, status in statuses.items() if status != 200]
+    server.log.info(f"Cache warmup: {len(statuses) - len(failed)}/{len(statuses)} responses "
+                    f"in {time.monotonic() - started:.1f}s" + (f", failed: {failed}" if failed else ""))
+
+
+def post_fork(server, worker):
+    """Start the worker's background threads (threads don't survive the fork)."""
+    if ASGI:
+        # server_async starts its warmer task when its event loop starts serving
+        threading.Thread(target=watch_rss, args=(worker,), name="rss-watch", daemon=True).start()
+    else:
+        import server as api
+        api.start_cache_warmer()
+
+
+def post_request(worker, req, environ, resp):
+    """Gracefully recycle a Flask worker whose memory has grown past MAX_WORKER_RSS_MB."""
+    worker.nr_rss_checks = getattr(worker, "nr_rss_checks", 0) + 1
+    if worker.nr_rss_checks % RSS_CHECK_EVERY:
+        return
+    if rss_over_limit(worker.log, worker.pid):
+        worker.alive = False
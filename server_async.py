@@ -0,0 +1,584 @@
+# =============================================
+# File: server_async.py
+# ASGI variant of the JobStats API (Quart + PyMongo's asyncio driver)
+# Same routes and payloads as server.py; run with
+#   uvicorn server_async:app --host 0.0.0.0 --port 3200 --workers 4
+# =============================================
+import asyncio
+import contextvars
+import logging
+import os
+from datetime import datetime, timedelta
+from functools import wraps
+from time import time
+
+from quart import Quart, g, jsonify, make_response, request, send_from_directory
+
+from Preprocessor.api_core import (
+    JOURNEY_PROJECTION, STAGE_ORDER, PopularityTracker, TTLCache, WARMUP_PATHS, company_search_pipeline, company_suggestions,
+    company_trend, daily_counts_pipeline, dashboard_payload, existing_submissions_query,
+    feedback_document, funnel_counts, heatmap_payload, hiring_trends_payload, hiring_trends_query,
+    make_cache_key, parse_date, parse_submission, split_param, submission_conflict,
+    stale_paths, submission_document, submissions_query, timeline_payload, top_companies_pipeline,
+    weekly_top_payload, weekly_top_pipeline,
+)
+from Preprocessor.canonical import canonicalize
+from Preprocessor.db_utils import collect_pipeline_stats
+from Preprocessor.log_setup import AccessLogger, configure_logging
+from Preprocessor.mongo_pool import LazyDatabase, close_async_clients, close_clients
+from Preprocessor.meta_summary import (
+    bump_dataset_version, get_dataset_version, load_meta, rebuild_meta_summary, record_submission,
+)
+from Preprocessor.metrics import (
+    PROMETHEUS_CONTENT_TYPE, RequestTimer, install_command_listener, record_cache_lookup,
+    register_cache, render_prometheus,
+)
+
+STATIC_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# ---- Logging ----
+configure_logging()
+log = logging.getLogger("jobstats.api")
+ACCESS_LOG = AccessLogger()
+
+# ---- Quart App ----
+app = Quart(__name__)
+
+
+@app.after_request
+async def add_cors_headers(response):
+    """Allow any origin, like CORS(app) does for the Flask server."""
+    response.headers['Access-Control-Allow-Origin'] = '*'
+    if request.method == 'OPTIONS':
+        response.headers['Access-Control-Allow-Methods'] = 'GET, POST, OPTIONS'
+        requested = request.headers.get('Access-Control-Request-Headers')
+        if requested:
+            response.headers['Access-Control-Allow-Headers'] = requested
+    return response
+
+
+# ---- Metrics ----
+install_command_listener()
+# Set around the app's own warmup / cache refresh requests: not counted as traffic
+_internal = contextvars.ContextVar("internal", default=False)
+
+
+@app.before_request
+async def start_request_timer():
+    if _internal.get():
+        return
+    rule = request.url_rule
+    g.request_timer = RequestTimer(rule.rule if rule else "unmatched", request.method)
+
+
+@app.after_request
+async def record_request_metrics(response):
+    timer = g.pop("request_timer", None)
+    if timer:
+        elapsed = timer.finish(response.status_code, response.content_length)
+        ACCESS_LOG.record(timer, request.full_path.rstrip('?'), response.status_code, elapsed,
+                          response.content_length)
+    return response
+
+
+@app.teardown_request
+async def close_request_timer(exc):
+    timer = g.pop("request_timer", None)
+    if timer:
+        timer.close()
+
+
+@app.before_serving
+async def startup():
+    _warmer_state["task"] = asyncio.create_task(_cache_warmer_loop())
+
+
+@app.after_serving
+async def shutdown():
+    task = _warmer_state.pop("task", None)
+    if task:
+        task.cancel()
+    await close_async_clients()
+
+
+# ---- MongoDB Setup ----
+# Route queries go through AsyncMongoClient handles. The meta summary and
+# pipeline stats helpers are shared synchronous code that takes a Database;
+# they are rare (cached, or single writes) and run on a worker thread with
+# the sync client.
+adb = LazyDatabase("api", asynchronous=True)
+analytics_adb = LazyDatabase("analytics", asynchronous=True)
+collection = adb["interview_processes_backfilled"]
+analytics_collection = analytics_adb["interview_processes_backfilled"]
+sessions_collection = adb["active_sessions"]
+feedback_collection = adb["feedback"]
+db = LazyDatabase("api")
+
+
+async def find_all(coll, query, projection=None):
+    return await coll.find(query, projection).to_list(None)
+
+
+async def aggregate_all(coll, pipeline):
+    cursor = await coll.aggregate(pipeline)
+    return await cursor.to_list(None)
+
+
+# ---- Cache ----
+CACHE = TTLCache(maxsize=128, ttl=300)
+register_cache("response", CACHE)
+
+# Which cached responses are requested most (see _cache_warmer_loop)
+POPULARITY = PopularityTracker()
+# True inside the warmer's own requests: recompute instead of reading the cache
+_refreshing = contextvars.ContextVar("refreshing", default=False)
+
+DATASET_VERSION_CHECK_SECONDS = 30
+_dataset_state = {"version": None, "checked": 0.0}
+
+
+async def sync_dataset_version():
+    """Clear the response cache if the dataset version changed since the last check."""
+    now = time()
+    if now - _dataset_state["checked"] < DATASET_VERSION_CHECK_SECONDS:
+        return
+    _dataset_state["checked"] = now
+    try:
+        version = await asyncio.to_thread(get_dataset_version, db)
+    except Exception as e:
+        log.warning("could not read dataset version", extra={"error": str(e)})
+        return
+    if _dataset_state["version"] is not None and version != _dataset_state["version"]:
+        CACHE.clear()
+    _dataset_state["version"] = version
+
+
+async def cache_get(key):
+    await sync_dataset_version()
+    refresh = _refreshing.get()
+    POPULARITY.record(request.full_path.rstrip('?'), key, count=not refresh)
+    if refresh:
+        return None
+    data = CACHE.get(key)
+    record_cache_lookup("response", data is not None)
+    return data
+def cache_set(key, data): CACHE.set(key, data)
+
+
+def cached_route(base):
+    """Cache a GET route's serialized JSON body per query string (200s only)."""
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(*args, **kwargs):
+            cache_key = make_cache_key(base, request.args.to_dict())
+            cached = await cache_get(cache_key)
+            if cached is not None:
+                return app.response_class(cached, mimetype='application/json')
+            response = await make_response(await view(*args, **kwargs))
+            if response.status_code == 200:
+                cache_set(cache_key, await response.get_data())
+            return response
+        return wrapper
+    return decorator
+
+async def warm_cache(paths=WARMUP_PATHS, close=False):
+    """
+    Request each path once in-process so its response is cached; returns {path: status}.
+
+    close=True closes the clients afterwards, for callers that run this in a
+    throwaway event loop (the gunicorn master before forking workers).
+    """
+    client = app.test_client()
+    statuses = {}
+    token = _internal.set(True)
+    try:
+        for path in paths:
+            try:
+                statuses[path] = (await client.get(path)).status_code
+            except Exception as e:
+                log.warning("warmup failed", extra={"path": path, "error": str(e)})
+                statuses[path] = None
+    finally:
+        _internal.reset(token)
+    if close:
+        await close_async_clients()
+        close_clients()
+    return statuses
+
+
+# ---- Cache warmer ----
+# Keeps the default views and the top-K most requested responses fresh, as
+# server.py does, on a task in this worker's event loop
+CACHE_WARM_TOP_K = 20
+CACHE_WARM_INTERVAL = 30
+CACHE_REFRESH_MARGIN = 60  # seconds before expiry at which an entry is recomputed
+_warmer_state = {}
+
+
+async def refresh_popular(top_k=CACHE_WARM_TOP_K):
+    """Recompute the default and top_k most popular responses that are missing or about to expire."""
+    await sync_dataset_version()
+    paths = stale_paths(CACHE, POPULARITY, WARMUP_PATHS + POPULARITY.top(top_k), CACHE_REFRESH_MARGIN)
+    client = app.test_client()
+    token = _refreshing.set(True)
+    internal = _internal.set(True)
+    try:
+        for path in paths:
+            try:
+                await client.get(path)
+            except Exception as e:
+                log.warning("cache refresh failed", extra={"path": path, "error": str(e)})
+    finally:
+        _internal.reset(internal)
+        _refreshing.reset(token)
+    return paths
+
+
+async def _cache_warmer_loop():
+    while True:
+        await asyncio.sleep(CACHE_WARM_INTERVAL)
+        try:
+            await refresh_popular()
+        except Exception:
+            log.exception("cache warmer error")
+
+
+def dashboard_filters():
+    return submissions_query(
+        parse_date(request.args.get('start')),
+        parse_date(request.args.get('end')),
+        split_param(request.args.get('companies')),
+    )
+
+
+# ---- Routes ----
+@app.route('/')
+async def index():
+    return await send_from_directory(STATIC_DIR, 'index.html')
+
+@app.route('/beta')
+async def index2():
+    return await send_from_directory(STATIC_DIR, 'index2.html')
+
+
+@app.route('/sitemap.xml')
+async def sitemap():
+    return await send_from_directory(STATIC_DIR, 'sitemap.xml', mimetype='application/xml')
+
+
+@app.route('/robots.txt')
+async def robots():
+    return await send_from_directory(STATIC_DIR, 'robots.txt', mimetype='text/plain')
+
+
+@app.route('/metrics')
+async def metrics():
+    """Prometheus metrics for this worker process."""
+    return app.response_class(render_prometheus(), content_type=PROMETHEUS_CONTENT_TYPE)
+
+
+@app.route('/api/meta')
+async def meta():
+    """Return meta information from the meta_summary documents (see server.py)."""
+    job_types = split_param(request.args.get('job_types'))
+    job_type = job_types[0] if len(job_types) == 1 and job_types[0] in ('new_grad', 'intern') else 'all'
+
+    cache_key = f'meta:{job_type}'
+    cached = await cache_get(cache_key)
+    if cached: return jsonify(cached)
+
+    result = await asyncio.to_thread(load_meta, db, job_type)
+    if result is None:
+        # Summary has never been built (fresh database) - build it once
+        await asyncio.to_thread(rebuild_meta_summary, db)
+        result = await asyncio.to_thread(load_meta, db, job_type)
+
+    cache_set(cache_key, result)
+    return jsonify(result)
+
+
+@app.route('/api/ops/stats')
+async def ops_stats():
+    """Return harvest/parse pipeline statistics (queue depth, processed, archived)."""
+    cached = await cache_get('ops:stats')
+    if cached: return jsonify(cached)
+
+    result = await asyncio.to_thread(collect_pipeline_stats, db)
+    cache_set('ops:stats', result)
+    return jsonify(result)
+
+
+@app.route('/api/messages')
+async def api_messages():
+    """Return filtered messages based on query params."""
+    params = {
+        "start": request.args.get("start"),
+        "end": request.args.get("end"),
+        "companies": request.args.get("companies"),
+        "stages": request.args.get("stages"),
+        "job_types": request.args.get("job_types"),
+    }
+    cache_key = make_cache_key("messages", params)
+    cached = await cache_get(cache_key)
+    if cached:
+        return jsonify(cached)
+
+    query = submissions_query(
+        parse_date(params['start']),
+        parse_date(params['end']),
+        split_param(params['companies']),
+        split_param(params['job_types']),
+    )
+    stages = split_param(params['stages'])
+    if stages:
+        query['stage'] = {'$in': stages}
+
+    results = await collection.find(query, {"_id": 0}).sort("timestamp", -1).to_list(None)
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("messages query", extra={"query": query, "params": params, "results": len(results)})
+    result_payload = {'items': results, 'total': len(results)}
+    cache_set(cache_key, result_payload)
+    return jsonify(result_payload)
+
+
+@app.route('/api/funnel')
+@cached_route('funnel')
+async def api_funnel():
+    """Return stage counts for funnel chart."""
+    query = submissions_query(
+        parse_date(request.args.get('start')),
+        parse_date(request.args.get('end')),
+        split_param(request.args.get('companies')),
+        split_param(request.args.get('job_types')),
+    )
+    results = await find_all(analytics_collection, query, {"stage": 1, "_id": 0})
+
+    return jsonify({
+        'stages': STAGE_ORDER,
+        'counts': funnel_counts(results)
+    })
+
+
+# Journey math is pure Python and can take a while on wide date ranges; it
+# runs on a worker thread so heartbeats keep being served meanwhile
+@app.route('/api/heatmap')
+@cached_route('heatmap')
+async def api_heatmap():
+    """Return conversion matrix data for heatmap visualization."""
+    query = dashboard_filters()
+    top_n = int(request.args.get('top_n', 8))
+
+    results = await find_all(analytics_collection, query, JOURNEY_PROJECTION)
+    return jsonify(await asyncio.to_thread(heatmap_payload, results, top_n))
+
+
+@app.route('/api/timeline')
+@cached_route('timeline')
+async def api_timeline():
+    """Return average days between stage transitions."""
+    results = await find_all(analytics_collection, dashboard_filters(), JOURNEY_PROJECTION)
+    return jsonify(await asyncio.to_thread(timeline_payload, results))
+
+
+@app.route('/api/companies/search')
+@cached_route('companies-search')
+async def api_companies_search():
+    """Return company suggestions (with counts) for the date range and job type filters."""
+    search_term = (request.args.get('q') or request.args.get('search') or '').strip().lower()
+    match_query = submissions_query(
+        parse_date(request.args.get('start')),
+        parse_date(request.args.get('end')),
+        job_types=split_param(request.args.get('job_types')),
+    )
+
+    results = await aggregate_all(analytics_collection, company_search_pipeline(match_query))
+    return jsonify(company_suggestions(results, search_term))
+
+
+@app.route('/api/dashboard')
+@cached_route('dashboard')
+async def api_dashboard():
+    """Funnel, heatmap, timeline and summary from one fetch."""
+    query = dashboard_filters()
+    top_n = int(request.args.get('top_n', 8))
+
+    results = await find_all(analytics_collection, query, JOURNEY_PROJECTION)
+    return jsonify(await asyncio.to_thread(dashboard_payload, results, top_n))
+
+
+@app.route('/api/session/start', methods=['POST'])
+async def session_start():
+    """Register a new active session."""
+    data = await request.get_json() or {}
+    session_id = data.get('session_id')
+
+    if not session_id:
+        return jsonify({'error': 'session_id required'}), 400
+
+    now = datetime.utcnow()
+    await sessions_collection.update_one(
+        {'session_id': session_id},
+        {
+            '$set': {
+                'session_id': session_id,
+                'last_heartbeat': now,
+                'created_at': now
+            }
+        },
+        upsert=True
+    )
+
+    return jsonify({'success': True})
+
+
+@app.route('/api/session/heartbeat', methods=['POST'])
+async def session_heartbeat():
+    """Update session heartbeat to keep it active."""
+    data = await request.get_json() or {}
+    session_id = data.get('session_id')
+
+    if not session_id:
+        return jsonify({'error': 'session_id required'}), 400
+
+    result = await sessions_collection.update_one(
+        {'session_id': session_id},
+        {'$set': {'last_heartbeat': datetime.utcnow()}}
+    )
+
+    return jsonify({'success': result.modified_count > 0 or result.upserted_id is not None})
+
+
+@app.route('/api/viewers/count')
+async def viewers_count():
+    """Return count of active viewers (sessions active within last 5 minutes)."""
+    cutoff_time = datetime.utcnow() - timedelta(minutes=5)
+    count = await sessions_collection.count_documents({
+        'last_heartbeat': {'$gte': cutoff_time}
+    })
+
+    return jsonify({'count': count})
+
+
+@app.route('/api/feedback', methods=['POST'])
+async def submit_feedback():
+    """Save user feedback to database."""
+    feedback_doc, error = feedback_document(await request.get_json() or {})
+    if error:
+        return jsonify({'error': error}), 400
+
+    result = await feedback_collection.insert_one(feedback_doc)
+
+    return jsonify({
+        'success': True,
+        'feedback_id': str(result.inserted_id)
+    })
+
+
+@app.route('/api/submit', methods=['POST'])
+async def submit_data():
+    """Accept new user submissions for interview process updates."""
+    fields, error = parse_submission(await request.get_json() or {}, canonicalize)
+    if error:
+        return jsonify({'error': error}), 400
+
+    existing_submissions = await find_all(
+        collection, existing_submissions_query(fields), {"stage": 1, "timestamp": 1, "_id": 0}
+    )
+    error = submission_conflict(fields, existing_submissions)
+    if error:
+        return jsonify({'error': error}), 400
+
+    submission_doc = submission_document(fields)
+
+    try:
+        result = await collection.insert_one(submission_doc)
+    except Exception as e:
+        return jsonify({'error': f'Database error: {str(e)}'}), 500
+
+    # The submission is stored; a stale summary is repaired by the next rebuild_meta_summary
+    try:
+        await asyncio.to_thread(record_submission, db, submission_doc)
+    except Exception:
+        log.exception("meta summary update failed", extra={"msg_id": submission_doc['msg_id']})
+
+    # Every cached view may include the submission: clear this worker's cache
+    # now; the other workers see the new version in sync_dataset_version
+    try:
+        _dataset_state["version"] = await asyncio.to_thread(bump_dataset_version, db)
+    except Exception:
+        log.exception("dataset version bump failed", extra={"msg_id": submission_doc['msg_id']})
+    CACHE.clear()
+    return jsonify({
+        'success': True,
+        'submission_id': str(result.inserted_id)
+    })
+
+
+@app.route('/api/top-oa-companies')
+@cached_route('top-oa')
+async def top_oa_companies():
+    """Get top companies sending out OAs this week."""
+    job_types = split_param(request.args.get('job_types'))
+    results = await aggregate_all(analytics_collection, weekly_top_pipeline('OA', job_types))
+    return jsonify(weekly_top_payload(results))
+
+
+@app.route('/api/top-offer-companies')
+@cached_route('top-offer')
+async def top_offer_companies():
+    """Get top companies sending out offers this week."""
+    job_types = split_param(request.args.get('job_types'))
+    results = await aggregate_all(analytics_collection, weekly_top_pipeline('Offer', job_types))
+    return jsonify(weekly_top_payload(results))
+
+
+@app.route('/api/top-companies')
+@cached_route('top-companies')
+async def top_companies():
+    """Both weekly panels (top OA and top Offer companies), queried concurrently."""
+    job_types = split_param(request.args.get('job_types'))
+    oa, offer = await asyncio.gather(
+        aggregate_all(analytics_collection, weekly_top_pipeline('OA', job_types)),
+        aggregate_all(analytics_collection, weekly_top_pipeline('Offer', job_types)),
+    )
+    return jsonify({'oa': weekly_top_payload(oa), 'offer': weekly_top_payload(offer)})
+
+
+@app.route('/api/hiring-trends')
+@cached_route('hiring-trends')
+async def hiring_trends():
+    """
+    Daily OA + Offer activity for the past 6 months: global average and top 5 companies.
+
+    The global series and the top-5 ranking run concurrently, then all five
+    company series run concurrently: two round trips instead of seven.
+    """
+    job_types = split_param(request.args.get('job_types'))
+    company_filter = request.args.get('company', '').strip()
+    match_query = hiring_trends_query(job_types)
+
+    if company_filter:
+        results = await aggregate_all(
+            analytics_collection, daily_counts_pipeline({**match_query, 'company': company_filter})
+        )
+        return jsonify({'companies': {company_filter: company_trend(results)}})
+
+    global_results, top = await asyncio.gather(
+        aggregate_all(analytics_collection, daily_counts_pipeline(match_query)),
+        aggregate_all(analytics_collection, top_companies_pipeline(match_query)),
+    )
+    top_company_names = [item['_id'] for item in top if item['_id']]
+
+    series = await asyncio.gather(*(
+        aggregate_all(analytics_collection, daily_counts_pipeline({**match_query, 'company': company}))
+        for company in top_company_names
+    ))
+    return jsonify(hiring_trends_payload(global_results, dict(zip(top_company_names, series))))
+
+
+# ---- Entry ----
+if __name__ == '__main__':
+    import uvicorn
+
+    port = int(os.environ.get('PORT', 3200))
+    uvicorn.run(app, host='0.0.0.0', port=port)